@@ -0,0 +1,224 @@
+"""
+Shared pieces of the benchmark scripts: statistics, result files, and seeding
+a catalog into either Postgres or the in-memory fake.
+"""
+
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import prisma
+import prisma.enums
+import prisma.models
+import project.authenticate_user_service
+from benchmarks.fake_prisma import FakePrisma
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+BENCH_EMAIL = "bench@example.com"
+
+BENCH_PASSWORD = "correct horse battery staple"
+
+BENCH_API_KEY = "bench-api-key"
+
+LANGUAGES = ("en", "de", "fr", "es")
+
+# Every tenth joke also gets a localization, into the next language along.
+LOCALIZATION_EVERY = 10
+
+# The number of a seeded joke; NULL for every other row, so other jokes are never touched.
+BENCH_NUMBER = "CASE WHEN setup LIKE 'bench-joke-%' THEN substr(setup, 12)::int END"
+
+JOKE_SEED_SQL = """
+INSERT INTO "Joke" (id, setup, punchline, language, approved, "updatedAt")
+SELECT gen_random_uuid(), 'bench-joke-' || g, 'Who''s there? ' || g,
+       (ARRAY['en', 'de', 'fr', 'es'])[1 + g % 4], true, now()
+FROM generate_series($1::int, $2::int) AS g
+"""
+
+LOCALIZATION_SEED_SQL = f"""
+INSERT INTO "Localization" (id, "jokeId", language, setup, punchline, "updatedAt")
+SELECT gen_random_uuid(), id, (ARRAY['de', 'fr', 'es', 'en'])[1 + n % 4],
+       setup || ' (localized)', punchline, now()
+FROM (SELECT *, {BENCH_NUMBER} AS n FROM "Joke") AS jokes
+WHERE n BETWEEN $1::int AND $2::int AND n % 10 = 0
+"""
+
+PENDING_SEED_SQL = """
+WITH jokes AS (
+    INSERT INTO "Joke" (id, setup, punchline, language, "updatedAt")
+    SELECT gen_random_uuid(), 'bench-pending-' || g, 'Who''s there? ' || g, 'en', now()
+    FROM generate_series(1, $1::int) AS g
+    RETURNING id
+)
+INSERT INTO "ModerationQueue" (id, "jokeId", status, "updatedAt")
+SELECT gen_random_uuid(), id, 'PENDING', now() FROM jokes
+"""
+
+TRIM_SQL = [
+    f"""DELETE FROM "Localization"
+    WHERE "jokeId" IN (SELECT id FROM "Joke" WHERE {BENCH_NUMBER} > $1)""",
+    f"""DELETE FROM "Joke" WHERE {BENCH_NUMBER} > $1""",
+]
+
+
+def percentile(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    return {
+        "requests": len(samples),
+        "p50_ms": percentile(samples, 0.50) * 1000,
+        "p90_ms": percentile(samples, 0.90) * 1000,
+        "p95_ms": percentile(samples, 0.95) * 1000,
+        "p99_ms": percentile(samples, 0.99) * 1000,
+        "max_ms": max(samples) * 1000,
+        "mean_ms": statistics.fmean(samples) * 1000,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=RESULTS_DIR.parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_results(
+    name: str, args: Dict[str, Any], results: Any, path: Optional[str] = None
+) -> Path:
+    """
+    Writes a benchmark run to JSON, with enough context to compare runs over time.
+
+    Args:
+        name (str): The benchmark's name, used in the default file name.
+        args (Dict[str, Any]): The options the benchmark ran with.
+        results (Any): The measurements.
+        path (Optional[str]): Where to write; defaults to benchmarks/results/<name>-<timestamp>.json.
+
+    Returns:
+        Path: The file written.
+    """
+    started = datetime.now(timezone.utc)
+    if path is None:
+        RESULTS_DIR.mkdir(exist_ok=True)
+        target = RESULTS_DIR / f"{name}-{started:%Y%m%dT%H%M%SZ}.json"
+    else:
+        target = Path(path)
+    payload = {
+        "benchmark": name,
+        "recorded_at": started.isoformat(),
+        "git_commit": _git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "args": args,
+        "results": results,
+    }
+    target.write_text(json.dumps(payload, indent=2, default=str) + "\n")
+    return target
+
+
+async def seed_accounts() -> prisma.models.User:
+    """
+    Creates the benchmark user and its API key if they do not exist yet.
+    """
+    user = await prisma.models.User.prisma().find_unique(where={"email": BENCH_EMAIL})
+    if user is None:
+        user = await prisma.models.User.prisma().create(
+            data={
+                "email": BENCH_EMAIL,
+                "hash": project.authenticate_user_service.pwd_context.hash(
+                    BENCH_PASSWORD
+                ),
+            }
+        )
+    api_key = await prisma.models.ApiKey.prisma().find_unique(
+        where={"key": BENCH_API_KEY}
+    )
+    if api_key is None:
+        await prisma.models.ApiKey.prisma().create(
+            data={"key": BENCH_API_KEY, "userId": user.id}
+        )
+    return user
+
+
+def seed_fake(fake: FakePrisma, jokes: int, pending: int) -> None:
+    """
+    Fills the fake with `jokes` approved jokes, their localizations, and `pending` jokes awaiting review.
+    """
+    for name in ("Joke", "Localization", "ModerationQueue"):
+        fake.tables[name].clear()
+    joke_table = fake.tables["Joke"]
+    localization_table = fake.tables["Localization"]
+    for i in range(1, jokes + 1):
+        joke = joke_table._insert(
+            {
+                "setup": f"bench-joke-{i}",
+                "punchline": f"Who's there? {i}",
+                "language": LANGUAGES[i % len(LANGUAGES)],
+                "approved": True,
+            }
+        )
+        if i % LOCALIZATION_EVERY == 0:
+            localization_table._insert(
+                {
+                    "jokeId": joke["id"],
+                    "language": LANGUAGES[(i + 1) % len(LANGUAGES)],
+                    "setup": f"bench-joke-{i} (localized)",
+                    "punchline": joke["punchline"],
+                }
+            )
+    for i in range(1, pending + 1):
+        joke_table._insert(
+            {
+                "setup": f"bench-pending-{i}",
+                "punchline": f"Who's there? {i}",
+                "moderationQueues": {
+                    "create": {"status": prisma.enums.ModerationStatus.PENDING}
+                },
+            }
+        )
+
+
+async def seed_postgres(db: Any, jokes: int, pending: int) -> None:
+    """
+    Brings the database to exactly `jokes` approved benchmark jokes and at least `pending` jokes awaiting review.
+
+    Benchmark rows are recognised by their `bench-` prefix, so the rest of the
+    catalog is left alone and repeated runs only insert what is missing.
+    """
+    started = time.perf_counter()
+    for sql in TRIM_SQL:
+        await db.execute_raw(sql, jokes)
+    existing = await prisma.models.Joke.prisma().count(
+        where={"setup": {"startswith": "bench-joke-"}}
+    )
+    if existing < jokes:
+        await db.execute_raw(JOKE_SEED_SQL, existing + 1, jokes)
+        await db.execute_raw(LOCALIZATION_SEED_SQL, existing + 1, jokes)
+    pending_jokes = await prisma.models.ModerationQueue.prisma().count(
+        where={"status": prisma.enums.ModerationStatus.PENDING}
+    )
+    if pending_jokes < pending:
+        await db.execute_raw(PENDING_SEED_SQL, pending - pending_jokes)
+    await db.execute_raw('ANALYZE "Joke"')
+    await db.execute_raw('ANALYZE "Localization"')
+    print(
+        f"Seeded {jokes} jokes ({existing} already present) "
+        f"in {time.perf_counter() - started:.1f}s",
+        file=sys.stderr,
+    )
@@ -0,0 +1,312 @@
+"""
+Load-tests every route in project/server.py at a fixed concurrency.
+
+The app runs in process behind httpx's ASGI transport, lifespan included,
+against either the in-memory fake of the Prisma models (`--backend fake`, the
+default) or the database at DATABASE_URL (`--backend postgres`, e.g. the
+docker-compose `db` service). For each catalog size in `--jokes` the catalog
+is seeded and the joke pool re-warmed, then each endpoint is driven by
+`--concurrency` clients issuing requests back to back until its share of
+`--requests` has completed. Throughput, latency percentiles and status codes
+are printed and saved as JSON under benchmarks/results/.
+
+Usage:
+    poetry run python -m benchmarks.endpoints --jokes 1000,100000,1000000
+    docker-compose up -d db && prisma db push
+    poetry run python -m benchmarks.endpoints --backend postgres --jokes 100000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Tuple
+
+os.environ.setdefault("RATE_LIMIT_REQUESTS", str(10**9))
+
+import httpx
+import prisma.models
+import project.authenticate_user_service
+import project.server
+from benchmarks.common import (
+    BENCH_API_KEY,
+    BENCH_EMAIL,
+    BENCH_PASSWORD,
+    LANGUAGES,
+    save_results,
+    seed_accounts,
+    seed_fake,
+    seed_postgres,
+    summarize,
+)
+from benchmarks.fake_prisma import FakePrisma
+from project.joke_pool import joke_pool
+
+Request = Tuple[str, str, Dict[str, Any]]
+
+
+@dataclass
+class Scenario:
+    name: str
+    request: Callable[[int], Request]
+    # Fraction of --requests to send; expensive endpoints get a smaller share.
+    share: float = 1.0
+    # Aggregates in SQL, which the fake backend cannot run.
+    raw_sql: bool = False
+
+
+def scenarios(token: str, submitter_id: str, pending_ids: List[str]) -> List[Scenario]:
+    auth = {"Authorization": f"Bearer {token}"}
+    bulk_body = "\n".join(
+        json.dumps({"setup": f"bulk-{i}", "punchline": "Who's there?"})
+        for i in range(100)
+    )
+    return [
+        Scenario(
+            "GET /joke", lambda i: ("GET", "/joke", {"params": {"language": "en"}})
+        ),
+        Scenario(
+            "GET /joke/{language}",
+            lambda i: ("GET", f"/joke/{LANGUAGES[i % len(LANGUAGES)]}", {}),
+        ),
+        Scenario("GET /joke/{language} fallback", lambda i: ("GET", "/joke/pt-BR", {})),
+        Scenario(
+            "GET /jokes",
+            lambda i: (
+                "GET",
+                "/jokes",
+                {"params": {"count": 20, "language": LANGUAGES}},
+            ),
+        ),
+        Scenario(
+            "GET /jokes ndjson",
+            lambda i: (
+                "GET",
+                "/jokes",
+                {"params": {"count": 1000, "format": "ndjson"}},
+            ),
+        ),
+        Scenario(
+            "POST /moderation/submit",
+            lambda i: (
+                "POST",
+                "/moderation/submit",
+                {
+                    "params": {
+                        "setup": f"bench-submitted-{i}",
+                        "punchline": "Who's there?",
+                        "submitterId": submitter_id,
+                        "language": "en",
+                    }
+                },
+            ),
+        ),
+        Scenario(
+            "POST /moderation/bulk_import",
+            lambda i: (
+                "POST",
+                "/moderation/bulk_import",
+                {
+                    "params": {"submitterId": submitter_id},
+                    "content": bulk_body,
+                    "headers": {**auth, "Content-Type": "application/x-ndjson"},
+                },
+            ),
+            share=0.05,
+        ),
+        Scenario(
+            "PUT /moderation/review/{jokeId}",
+            lambda i: (
+                "PUT",
+                f"/moderation/review/{pending_ids[i % len(pending_ids)]}",
+                {
+                    "params": {"decision": "APPROVED" if i % 2 else "REJECTED"},
+                    "headers": auth,
+                },
+            ),
+            raw_sql=True,
+        ),
+        Scenario(
+            "POST /moderation/review",
+            lambda i: (
+                "POST",
+                "/moderation/review",
+                {
+                    "json": {
+                        "decisions": [
+                            {"jokeId": joke_id, "decision": "APPROVED"}
+                            for joke_id in pending_ids[i * 10 % len(pending_ids) :][:10]
+                        ]
+                    },
+                    "headers": auth,
+                },
+            ),
+            share=0.1,
+            raw_sql=True,
+        ),
+        Scenario(
+            "GET /moderation/pending",
+            lambda i: (
+                "GET",
+                "/moderation/pending",
+                {"params": {"limit": 50}, "headers": auth},
+            ),
+        ),
+        Scenario(
+            "POST /moderation/claim",
+            lambda i: (
+                "POST",
+                "/moderation/claim",
+                {"params": {"limit": 10}, "headers": auth},
+            ),
+            raw_sql=True,
+        ),
+        Scenario(
+            "GET /security/rate_limit", lambda i: ("GET", "/security/rate_limit", {})
+        ),
+        Scenario("GET /analytics/usage", lambda i: ("GET", "/analytics/usage", {})),
+        Scenario(
+            "GET /analytics/performance",
+            lambda i: ("GET", "/analytics/performance", {}),
+            raw_sql=True,
+        ),
+        Scenario(
+            "POST /auth/login",
+            lambda i: (
+                "POST",
+                "/auth/login",
+                {
+                    "params": {
+                        "username_or_email": BENCH_EMAIL,
+                        "password": BENCH_PASSWORD,
+                    }
+                },
+            ),
+            share=0.05,
+        ),
+    ]
+
+
+async def drive(
+    client: httpx.AsyncClient, scenario: Scenario, requests: int, concurrency: int
+) -> Dict[str, Any]:
+    """
+    Sends `requests` requests from `concurrency` closed-loop clients and summarizes them.
+    """
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    issued = 0
+
+    async def client_loop() -> None:
+        nonlocal issued
+        while issued < requests:
+            number = issued
+            issued += 1
+            method, url, kwargs = scenario.request(number)
+            started = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] += 1
+            # The in-process transport never touches a socket, so yield
+            # explicitly to let the other clients and background tasks run.
+            await asyncio.sleep(0)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "seconds": elapsed,
+        "throughput_rps": len(latencies) / elapsed,
+        **summarize(latencies),
+        "statuses": {str(code): count for code, count in sorted(statuses.items())},
+    }
+
+
+async def run_size(args: argparse.Namespace, jokes: int) -> Dict[str, Any]:
+    app = project.server.app
+    async with app.router.lifespan_context(app):
+        if args.backend == "fake":
+            seed_fake(project.server.db_client, jokes, args.pending)
+        else:
+            await seed_postgres(project.server.db_client, jokes, args.pending)
+        user = await seed_accounts()
+        started = time.perf_counter()
+        await joke_pool.warm()
+        warm_seconds = time.perf_counter() - started
+        # Prime the incremental refresh too, so that its first run does not
+        # land in the middle of a measurement.
+        await joke_pool.refresh()
+        pending = await prisma.models.Joke.prisma().find_many(
+            where={"setup": {"startswith": "bench-pending-"}}, take=args.pending
+        )
+        token = project.authenticate_user_service.create_access_token(
+            {"sub": BENCH_EMAIL}
+        )
+        selected = [
+            scenario
+            for scenario in scenarios(token, user.id, [joke.id for joke in pending])
+            if not args.endpoint or any(name in scenario.name for name in args.endpoint)
+            if args.backend == "postgres" or not scenario.raw_sql
+        ]
+        results: Dict[str, Any] = {}
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport,
+            base_url="http://bench",
+            headers={"X-API-Key": BENCH_API_KEY},
+            timeout=None,
+        ) as client:
+            for scenario in selected:
+                count = max(1, int(args.requests * scenario.share))
+                results[scenario.name] = stats = await drive(
+                    client, scenario, count, args.concurrency
+                )
+                print(
+                    f"  {scenario.name:<34} {stats['throughput_rps']:>8.0f} req/s "
+                    f"p50={stats['p50_ms']:.2f}ms p99={stats['p99_ms']:.2f}ms "
+                    f"{stats['statuses']}",
+                    file=sys.stderr,
+                )
+    return {
+        "jokes": jokes,
+        "pool_size": len(joke_pool),
+        "pool_warm_seconds": warm_seconds,
+        "endpoints": results,
+    }
+
+
+async def main(args: argparse.Namespace) -> None:
+    if args.backend == "fake":
+        project.server.db_client = FakePrisma().install()
+    runs = []
+    for jokes in args.jokes:
+        print(f"{args.backend}, {jokes} jokes:", file=sys.stderr)
+        runs.append(await run_size(args, jokes))
+    path = save_results("endpoints", vars(args), runs, args.output)
+    print(f"Results written to {path}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--backend", choices=["fake", "postgres"], default="fake")
+    parser.add_argument(
+        "--jokes",
+        type=lambda value: [int(n) for n in value.split(",")],
+        default=[1000, 100_000],
+        help="comma-separated catalog sizes, e.g. 1000,100000,1000000",
+    )
+    parser.add_argument("--pending", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument(
+        "--endpoint",
+        action="append",
+        help="only run scenarios whose name contains this; may be repeated",
+    )
+    parser.add_argument("--output", help="defaults to benchmarks/results/")
+    asyncio.run(main(parser.parse_args()))
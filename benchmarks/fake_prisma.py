@@ -0,0 +1,506 @@
+"""
+An in-memory stand-in for the generated Prisma client, for benchmarks.
+
+It implements the subset of the query API the services use — `find_many`
+with `where`/`order`/`cursor`/`take`/`skip`/`include`, `find_first`,
+`find_unique`, `create` with nested `create`, `create_many`, `update` with
+`increment`, `update_many`, `count`, `batch_()` and `tx()` — over plain dicts,
+and returns real `prisma.models` instances. Transactions do not roll back and
+raw SQL is not supported.
+
+`FakePrisma().install()` points every model's `prisma()` and
+`prisma.get_client()` at the fake, so the app can be driven without a database.
+"""
+
+import bisect
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import prisma
+import prisma.models
+
+# Per model: scalar defaults, fields set on create, and fields set on every write.
+MODELS: Dict[str, Tuple[Dict[str, Any], Tuple[str, ...], Tuple[str, ...]]] = {
+    "User": ({"role": "USER"}, ("createdAt",), ("updatedAt",)),
+    "Joke": (
+        {"language": "en", "approved": False, "createdByUserId": None},
+        ("createdAt",),
+        ("updatedAt",),
+    ),
+    "ApiKey": ({}, ("createdAt",), ("updatedAt",)),
+    "Localization": ({}, ("createdAt",), ("updatedAt",)),
+    "Analytics": ({"requestCount": 0}, ("createdAt",), ("lastAccess",)),
+    "AccessLog": ({}, ("accessTime",), ()),
+    "ModerationQueue": (
+        {"claimedBy": None, "claimExpiresAt": None, "reviewedBy": None},
+        ("createdAt",),
+        ("updatedAt",),
+    ),
+}
+
+# To-many relations usable in `include` and nested `create`: (model, foreign key).
+RELATIONS: Dict[str, Dict[str, Tuple[str, str]]] = {
+    "User": {"jokes": ("Joke", "createdByUserId"), "apiKeys": ("ApiKey", "userId")},
+    "Joke": {
+        "localizations": ("Localization", "jokeId"),
+        "moderationQueues": ("ModerationQueue", "jokeId"),
+    },
+    "ApiKey": {"accessLogs": ("AccessLog", "apiKeyId")},
+}
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _match_condition(value: Any, condition: Any) -> bool:
+    if not isinstance(condition, dict):
+        return value == condition
+    for op, operand in condition.items():
+        if op == "equals":
+            ok = value == operand
+        elif op == "in":
+            ok = value in operand
+        elif op == "not_in":
+            ok = value not in operand
+        elif op == "not":
+            ok = not _match_condition(value, operand)
+        elif op == "lt":
+            ok = value is not None and value < operand
+        elif op == "lte":
+            ok = value is not None and value <= operand
+        elif op == "gt":
+            ok = value is not None and value > operand
+        elif op == "gte":
+            ok = value is not None and value >= operand
+        elif op == "contains":
+            ok = value is not None and operand in value
+        elif op == "startswith":
+            ok = value is not None and value.startswith(operand)
+        elif op == "mode":
+            continue
+        else:
+            raise NotImplementedError(f"Filter {op!r} is not supported by the fake")
+        if not ok:
+            return False
+    return True
+
+
+def _compile(where: Optional[Dict[str, Any]]) -> Callable[[Dict[str, Any]], bool]:
+    if not where:
+        return lambda row: True
+    checks: List[Callable[[Dict[str, Any]], bool]] = []
+    for field, condition in where.items():
+        if field in ("AND", "OR", "NOT"):
+            parts = [
+                _compile(w)
+                for w in (condition if isinstance(condition, list) else [condition])
+            ]
+            if field == "AND":
+                checks.append(lambda row, parts=parts: all(p(row) for p in parts))
+            elif field == "OR":
+                checks.append(lambda row, parts=parts: any(p(row) for p in parts))
+            else:
+                checks.append(lambda row, parts=parts: not any(p(row) for p in parts))
+        else:
+            checks.append(
+                lambda row, field=field, condition=condition: _match_condition(
+                    row.get(field), condition
+                )
+            )
+    return lambda row: all(check(row) for check in checks)
+
+
+def _order_fields(order: Any) -> Tuple[Tuple[str, bool], ...]:
+    if not order:
+        return ()
+    specs = order if isinstance(order, list) else [order]
+    return tuple(
+        (field, direction == "desc")
+        for spec in specs
+        for field, direction in spec.items()
+    )
+
+
+class _Descending:
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any) -> None:
+        self.value = value
+
+    def __lt__(self, other: "_Descending") -> bool:
+        return other.value < self.value
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, _Descending) and self.value == other.value
+
+
+def _with_id(fields: Tuple[Tuple[str, bool], ...]) -> Tuple[Tuple[str, bool], ...]:
+    # Ties are broken by id so that every order is total and cursors are exact.
+    return fields if ("id", False) in fields else fields + (("id", False),)
+
+
+def _sort_key(
+    fields: Tuple[Tuple[str, bool], ...],
+) -> Callable[[Dict[str, Any]], tuple]:
+    def key(row: Dict[str, Any]) -> tuple:
+        parts = []
+        for field, descending in fields:
+            value = row.get(field)
+            # None sorts before any value; only a consistent order matters here.
+            item = (value is not None, value if value is not None else 0)
+            parts.append(_Descending(item) if descending else item)
+        return tuple(parts)
+
+    return key
+
+
+class FakeTable:
+    """
+    The rows of one model and the query actions over them.
+
+    Sorted orders and foreign key lookups are indexed on first use and then
+    kept up to date on every write, so that paging or refreshing a large
+    table does not rescan it.
+    """
+
+    # Above this many rows, create_many drops the sorted indexes instead of
+    # updating them row by row; they are rebuilt on next use.
+    BULK_INSERT_THRESHOLD = 1000
+
+    def __init__(self, client: "FakePrisma", name: str) -> None:
+        self.client = client
+        self.name = name
+        self.model = getattr(prisma.models, name)
+        self.defaults, self.created_fields, self.updated_fields = MODELS[name]
+        self.rows: Dict[str, Dict[str, Any]] = {}
+        self._sorted: Dict[tuple, Tuple[Callable, List[tuple], List[str]]] = {}
+        self._by_key: Dict[str, Dict[Any, List[str]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def clear(self) -> None:
+        self.rows.clear()
+        self._sorted.clear()
+        self._by_key.clear()
+
+    def _ordered(
+        self, fields: Tuple[Tuple[str, bool], ...]
+    ) -> Tuple[Callable, List[tuple], List[str]]:
+        fields = _with_id(fields)
+        cached = self._sorted.get(fields)
+        if cached is None:
+            key = _sort_key(fields)
+            entries = sorted((key(row), row_id) for row_id, row in self.rows.items())
+            cached = (key, [e[0] for e in entries], [e[1] for e in entries])
+            self._sorted[fields] = cached
+        return cached
+
+    def related_ids(self, field: str, value: Any) -> List[str]:
+        index = self._by_key.get(field)
+        if index is None:
+            index = {}
+            for row_id, row in self.rows.items():
+                index.setdefault(row.get(field), []).append(row_id)
+            self._by_key[field] = index
+        return index.get(value, [])
+
+    def _index(self, row: Dict[str, Any]) -> None:
+        for key, keys, ids in self._sorted.values():
+            k = key(row)
+            position = bisect.bisect_left(keys, k)
+            keys.insert(position, k)
+            ids.insert(position, row["id"])
+        for field, index in self._by_key.items():
+            index.setdefault(row.get(field), []).append(row["id"])
+
+    def _unindex(self, row: Dict[str, Any]) -> None:
+        for key, keys, ids in self._sorted.values():
+            position = bisect.bisect_left(keys, key(row))
+            del keys[position]
+            del ids[position]
+        for field, index in self._by_key.items():
+            index[row.get(field)].remove(row["id"])
+
+    def _record(
+        self, row: Dict[str, Any], include: Optional[Dict[str, Any]] = None
+    ) -> Any:
+        values = dict(row)
+        for relation, wanted in (include or {}).items():
+            if not wanted:
+                continue
+            model, foreign_key = RELATIONS[self.name][relation]
+            table = self.client.tables[model]
+            values[relation] = [
+                table._record(table.rows[related_id])
+                for related_id in table.related_ids(foreign_key, row["id"])
+            ]
+        return self.model.construct(**values)
+
+    def _insert(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        now = _now()
+        row = dict(self.defaults)
+        for field in self.created_fields + self.updated_fields:
+            row[field] = now
+        nested = {}
+        for field, value in data.items():
+            if field in RELATIONS.get(self.name, {}):
+                nested[field] = value
+            else:
+                row[field] = value
+        row.setdefault("id", str(uuid.uuid4()))
+        self.rows[row["id"]] = row
+        self._index(row)
+        for relation, operations in nested.items():
+            model, foreign_key = RELATIONS[self.name][relation]
+            creates = operations.get("create", [])
+            for child in creates if isinstance(creates, list) else [creates]:
+                self.client.tables[model]._insert({**child, foreign_key: row["id"]})
+        return row
+
+    def _apply(self, row: Dict[str, Any], data: Dict[str, Any]) -> None:
+        self._unindex(row)
+        for field, value in data.items():
+            if isinstance(value, dict):
+                if "increment" in value:
+                    row[field] += value["increment"]
+                elif "decrement" in value:
+                    row[field] -= value["decrement"]
+                elif "set" in value:
+                    row[field] = value["set"]
+                else:
+                    raise NotImplementedError(
+                        f"Update of {field!r} is not supported by the fake"
+                    )
+            else:
+                row[field] = value
+        now = _now()
+        for field in self.updated_fields:
+            row[field] = now
+        self._index(row)
+
+    def _remove(self, row: Dict[str, Any]) -> None:
+        self._unindex(row)
+        del self.rows[row["id"]]
+
+    def _find(self, where: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if where and len(where) == 1 and isinstance(where.get("id"), str):
+            return self.rows.get(where["id"])
+        match = _compile(where)
+        return next((row for row in self.rows.values() if match(row)), None)
+
+    def _matching(self, where: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if where and len(where) == 1:
+            ((field, value),) = where.items()
+            if isinstance(value, str) and field.endswith("Id"):
+                return [self.rows[row_id] for row_id in self.related_ids(field, value)]
+        match = _compile(where)
+        return [row for row in self.rows.values() if match(row)]
+
+    async def find_many(
+        self,
+        where: Optional[Dict[str, Any]] = None,
+        take: Optional[int] = None,
+        skip: Optional[int] = None,
+        cursor: Optional[Dict[str, Any]] = None,
+        order: Any = None,
+        include: Optional[Dict[str, Any]] = None,
+        distinct: Any = None,
+    ) -> List[Any]:
+        match = _compile(where)
+        fields = _order_fields(order)
+        if fields or cursor:
+            key, keys, ids = self._ordered(fields)
+            start = 0
+            if cursor:
+                anchor = self._find(cursor)
+                if anchor is None:
+                    return []
+                start = bisect.bisect_left(keys, key(anchor))
+            candidates = (self.rows[ids[i]] for i in range(start, len(ids)))
+        else:
+            candidates = iter(list(self.rows.values()))
+        results = []
+        to_skip = skip or 0
+        for row in candidates:
+            if not match(row):
+                continue
+            if to_skip:
+                to_skip -= 1
+                continue
+            results.append(self._record(row, include))
+            if take is not None and len(results) >= take:
+                break
+        return results
+
+    async def find_first(
+        self,
+        where: Optional[Dict[str, Any]] = None,
+        order: Any = None,
+        include: Optional[Dict[str, Any]] = None,
+        skip: Optional[int] = None,
+        cursor: Optional[Dict[str, Any]] = None,
+    ) -> Optional[Any]:
+        rows = await self.find_many(
+            where=where, take=1, skip=skip, cursor=cursor, order=order, include=include
+        )
+        return rows[0] if rows else None
+
+    async def find_unique(
+        self, where: Dict[str, Any], include: Optional[Dict[str, Any]] = None
+    ) -> Optional[Any]:
+        row = self._find(where)
+        return self._record(row, include) if row is not None else None
+
+    async def count(self, where: Optional[Dict[str, Any]] = None) -> int:
+        if not where:
+            return len(self.rows)
+        return len(self._matching(where))
+
+    async def create(
+        self, data: Dict[str, Any], include: Optional[Dict[str, Any]] = None
+    ) -> Any:
+        return self._record(self._insert(data), include)
+
+    async def create_many(
+        self, data: List[Dict[str, Any]], skip_duplicates: bool = False
+    ) -> int:
+        if len(data) > self.BULK_INSERT_THRESHOLD:
+            self._sorted.clear()
+        created = 0
+        for item in data:
+            if skip_duplicates and item.get("id") in self.rows:
+                continue
+            self._insert(item)
+            created += 1
+        return created
+
+    async def update(
+        self,
+        where: Dict[str, Any],
+        data: Dict[str, Any],
+        include: Optional[Dict[str, Any]] = None,
+    ) -> Optional[Any]:
+        row = self._find(where)
+        if row is None:
+            return None
+        self._apply(row, data)
+        return self._record(row, include)
+
+    async def update_many(self, where: Dict[str, Any], data: Dict[str, Any]) -> int:
+        rows = self._matching(where)
+        for row in rows:
+            self._apply(row, data)
+        return len(rows)
+
+    async def delete(self, where: Dict[str, Any]) -> Optional[Any]:
+        row = self._find(where)
+        if row is None:
+            return None
+        self._remove(row)
+        return self._record(row)
+
+    async def delete_many(self, where: Optional[Dict[str, Any]] = None) -> int:
+        rows = self._matching(where)
+        for row in rows:
+            self._remove(row)
+        return len(rows)
+
+
+class _QueuedTable:
+    def __init__(
+        self, queue: List[Tuple[FakeTable, str, Dict[str, Any]]], table: FakeTable
+    ) -> None:
+        self._queue = queue
+        self._table = table
+
+    def __getattr__(self, method: str) -> Callable[..., None]:
+        def queue(**kwargs: Any) -> None:
+            self._queue.append((self._table, method, kwargs))
+
+        return queue
+
+
+class _FakeBatch:
+    def __init__(self, client: "FakePrisma") -> None:
+        self._client = client
+        self._queue: List[Tuple[FakeTable, str, Dict[str, Any]]] = []
+
+    def __getattr__(self, name: str) -> _QueuedTable:
+        return _QueuedTable(self._queue, self._client.table(name))
+
+    async def __aenter__(self) -> "_FakeBatch":
+        return self
+
+    async def __aexit__(self, exc_type: Any, exc: Any, tb: Any) -> None:
+        if exc_type is None:
+            for table, method, kwargs in self._queue:
+                await getattr(table, method)(**kwargs)
+
+
+class _FakeTransaction:
+    def __init__(self, client: "FakePrisma") -> None:
+        self._client = client
+
+    async def __aenter__(self) -> "FakePrisma":
+        return self._client
+
+    async def __aexit__(self, exc_type: Any, exc: Any, tb: Any) -> None:
+        pass
+
+
+class FakePrisma:
+    """
+    In-memory client holding one FakeTable per model.
+    """
+
+    def __init__(self) -> None:
+        self.tables = {name: FakeTable(self, name) for name in MODELS}
+        self._connected = False
+
+    def table(self, name: str) -> FakeTable:
+        for model, table in self.tables.items():
+            if model.lower() == name.lower():
+                return table
+        raise AttributeError(name)
+
+    def __getattr__(self, name: str) -> FakeTable:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self.table(name)
+
+    def install(self) -> "FakePrisma":
+        for name, table in self.tables.items():
+            setattr(
+                getattr(prisma.models, name),
+                "prisma",
+                classmethod(lambda cls, client=None, table=table: table),
+            )
+        prisma.get_client = lambda: self
+        return self
+
+    async def connect(self, timeout: Any = None) -> None:
+        self._connected = True
+
+    async def disconnect(self, timeout: Any = None) -> None:
+        self._connected = False
+
+    def is_connected(self) -> bool:
+        return self._connected
+
+    def batch_(self) -> _FakeBatch:
+        return _FakeBatch(self)
+
+    def tx(self, max_wait: Any = None, timeout: Any = None) -> _FakeTransaction:
+        return _FakeTransaction(self)
+
+    async def query_raw(self, query: str, *args: Any, model: Any = None) -> Any:
+        raise NotImplementedError("Raw SQL is not supported by the in-memory fake")
+
+    async def query_first(self, query: str, *args: Any, model: Any = None) -> Any:
+        raise NotImplementedError("Raw SQL is not supported by the in-memory fake")
+
+    async def execute_raw(self, query: str, *args: Any) -> int:
+        raise NotImplementedError("Raw SQL is not supported by the in-memory fake")
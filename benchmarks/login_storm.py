@@ -0,0 +1,135 @@
+"""
+Measures /joke latency while /auth/login is hit by a concurrent login storm.
+
+The app runs in process behind httpx's ASGI transport. The user lookup is
+replaced by an in-memory user with a real bcrypt hash and the joke pool is
+seeded directly, so no database is needed: what is measured is how much
+bcrypt work on the login path delays unrelated requests on the same event loop.
+
+Each scenario first measures /joke alone, then again while `--concurrency`
+clients log in back to back. `--mode inline` runs bcrypt on the event loop
+the way verify_password used to, for comparison with the worker pool.
+
+Usage:
+    poetry run python -m benchmarks.login_storm [--mode pool|inline|both]
+"""
+
+import argparse
+import asyncio
+import os
+import time
+from collections import Counter
+from types import SimpleNamespace
+from typing import Dict, List
+
+os.environ.setdefault("RATE_LIMIT_REQUESTS", str(10**9))
+
+import httpx
+import project.authenticate_user_service
+from benchmarks.common import summarize
+from project.joke_pool import PooledJoke, joke_pool
+from project.server import app
+
+PASSWORD = "correct horse battery staple"
+
+
+async def measure_jokes(
+    client: httpx.AsyncClient, seconds: float, interval: float = 0.005
+) -> List[float]:
+    # Requests are scheduled at a fixed rate and latency is measured from the
+    # scheduled start, so time spent waiting for a blocked event loop counts
+    # against the request instead of silently lowering the sample count.
+    latencies = []
+    started = time.perf_counter()
+    for i in range(int(seconds / interval)):
+        scheduled = started + i * interval
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        response = await client.get("/joke", params={"language": "en"})
+        latencies.append(time.perf_counter() - scheduled)
+        response.raise_for_status()
+    return latencies
+
+
+async def storm(
+    client: httpx.AsyncClient, stop: asyncio.Event, statuses: Counter
+) -> None:
+    while not stop.is_set():
+        response = await client.post(
+            "/auth/login",
+            params={"username_or_email": "storm@example.com", "password": PASSWORD},
+        )
+        statuses[response.status_code] += 1
+        # The in-process transport never touches a socket, so a login that
+        # does not await anything would otherwise never give up the loop.
+        await asyncio.sleep(0)
+
+
+async def run(mode: str, seconds: float, concurrency: int) -> Dict[str, object]:
+    auth = project.authenticate_user_service
+    user = SimpleNamespace(
+        id="storm", email="storm@example.com", hash=auth.pwd_context.hash(PASSWORD)
+    )
+
+    async def get_user(username_or_email: str):
+        return user
+
+    auth.get_user = get_user
+    if mode == "inline":
+
+        async def verify_password(plain_password: str, hashed_password: str) -> bool:
+            return auth.pwd_context.verify(plain_password, hashed_password)
+
+        auth.verify_password = verify_password
+    joke_pool.replace(
+        PooledJoke(
+            id=str(i), setup="Knock knock.", punchline="Who's there?", language="en"
+        )
+        for i in range(1000)
+    )
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+        baseline = await measure_jokes(client, seconds)
+        stop = asyncio.Event()
+        statuses: Counter = Counter()
+        workers = [
+            asyncio.create_task(storm(client, stop, statuses))
+            for _ in range(concurrency)
+        ]
+        under_storm = await measure_jokes(client, seconds)
+        stop.set()
+        await asyncio.gather(*workers)
+    return {
+        "mode": mode,
+        "baseline": summarize(baseline),
+        "under_storm": summarize(under_storm),
+        "login_statuses": dict(statuses),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--mode", choices=["pool", "inline", "both"], default="both")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+    verify_password = project.authenticate_user_service.verify_password
+    modes = ["inline", "pool"] if args.mode == "both" else [args.mode]
+    for mode in modes:
+        project.authenticate_user_service.verify_password = verify_password
+        result = asyncio.run(run(mode, args.seconds, args.concurrency))
+        print(f"{mode}: logins {result['login_statuses']}")
+        for phase in ("baseline", "under_storm"):
+            stats = result[phase]
+            print(
+                f"  {phase:<12} n={stats['requests']:<6} p50={stats['p50_ms']:.2f}ms "
+                f"p95={stats['p95_ms']:.2f}ms p99={stats['p99_ms']:.2f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Compares serving a joke through its response model with serving pre-encoded bytes.
+
+Two minimal apps answer GET /joke from the same seeded joke pool:
+
+* `model`: the previous route shape, returning a `RandomJokeResponse` that
+  FastAPI validates against `response_model` and JSON-encodes per request
+* `bytes`: the current route shape, returning the body encoded when the joke
+  entered the pool as a raw `Response`
+
+Requests are sent back to back on one event loop through httpx's ASGI
+transport, so requests per CPU-second is throughput per core. The full app's
+/joke, middleware and instrumentation included, is measured as well. Results
+are saved as JSON under benchmarks/results/.
+
+Usage:
+    poetry run python -m benchmarks.serialization [--seconds 5]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from typing import Any, Dict
+
+os.environ.setdefault("RATE_LIMIT_REQUESTS", str(10**9))
+
+import httpx
+import project.get_random_joke_service
+import project.json_encoding
+import project.server
+from benchmarks.common import save_results
+from fastapi import FastAPI
+from project.joke_pool import PooledJoke, joke_pool
+
+
+def model_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/joke", response_model=project.get_random_joke_service.RandomJokeResponse)
+    async def joke(language: str):
+        return await project.get_random_joke_service.get_random_joke(language)
+
+    return app
+
+
+def bytes_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/joke", response_model=project.get_random_joke_service.RandomJokeResponse)
+    async def joke(language: str):
+        return project.json_encoding.json_response(
+            await project.get_random_joke_service.get_random_joke_json(language)
+        )
+
+    return app
+
+
+async def measure(app: Any, seconds: float) -> Dict[str, float]:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+        requests = 0
+        wall_started = time.perf_counter()
+        cpu_started = time.process_time()
+        while time.perf_counter() - wall_started < seconds:
+            response = await client.get("/joke", params={"language": "en"})
+            response.raise_for_status()
+            requests += 1
+        wall = time.perf_counter() - wall_started
+        cpu = time.process_time() - cpu_started
+    return {
+        "requests": requests,
+        "requests_per_second": requests / wall,
+        "requests_per_cpu_second": requests / cpu,
+        "cpu_us_per_request": cpu / requests * 1e6,
+    }
+
+
+def encode_only(iterations: int) -> Dict[str, float]:
+    # The per-request encoding work alone, without HTTP.
+    joke = joke_pool.pick("en")
+    started = time.perf_counter()
+    for _ in range(iterations):
+        project.get_random_joke_service.RandomJokeResponse(
+            setup=joke.setup, punchline=joke.punchline, language=joke.language
+        ).json()
+    model_us = (time.perf_counter() - started) / iterations * 1e6
+    started = time.perf_counter()
+    for _ in range(iterations):
+        joke_pool.pick("en").random_joke_json
+    bytes_us = (time.perf_counter() - started) / iterations * 1e6
+    return {"model_us": model_us, "bytes_us": bytes_us}
+
+
+async def main(args: argparse.Namespace) -> None:
+    joke_pool.replace(
+        PooledJoke(
+            id=str(i),
+            setup=f"Knock knock. Who's there? Joke number {i}.",
+            punchline="Interrupting cow. Interrupting c- MOO!",
+            language="en",
+        )
+        for i in range(10000)
+    )
+    results: Dict[str, Any] = {
+        "encoder": "orjson" if project.json_encoding.orjson else "json",
+        "encode_only": encode_only(args.iterations),
+    }
+    for name, app in (
+        ("model", model_app()),
+        ("bytes", bytes_app()),
+        ("full_app", project.server.app),
+    ):
+        results[name] = stats = await measure(app, args.seconds)
+        print(
+            f"{name:<9} {stats['requests_per_second']:>8.0f} req/s "
+            f"{stats['requests_per_cpu_second']:>8.0f} req/cpu-s "
+            f"{stats['cpu_us_per_request']:.0f}us cpu/req",
+            file=sys.stderr,
+        )
+    speedup = (
+        results["bytes"]["requests_per_cpu_second"]
+        / results["model"]["requests_per_cpu_second"]
+    )
+    print(f"bytes vs model: {speedup:.2f}x per core", file=sys.stderr)
+    path = save_results("serialization", vars(args), results, args.output)
+    print(f"Results written to {path}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--iterations", type=int, default=100_000)
+    parser.add_argument("--output", help="defaults to benchmarks/results/")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,172 @@
+"""
+Micro-benchmarks for the service functions behind each route, without HTTP.
+
+Each function is called `--iterations` times in a row on a warmed catalog of
+`--jokes` jokes, held by the in-memory fake of the Prisma models or by the
+database at DATABASE_URL (`--backend postgres`). Per-call latency percentiles
+and calls per second are printed and saved as JSON under benchmarks/results/.
+
+Usage:
+    poetry run python -m benchmarks.services [--jokes 100000] [--iterations 20000]
+"""
+
+import argparse
+import asyncio
+import inspect
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+os.environ.setdefault("RATE_LIMIT_REQUESTS", str(10**9))
+
+import project.authenticate_user_service
+import project.get_api_usage_stats_service
+import project.get_joke_in_language_service
+import project.get_performance_metrics_service
+import project.get_random_joke_service
+import project.rate_limit_check_service
+import project.server
+from benchmarks.common import (
+    BENCH_EMAIL,
+    BENCH_PASSWORD,
+    save_results,
+    seed_accounts,
+    seed_fake,
+    seed_postgres,
+    summarize,
+)
+from benchmarks.fake_prisma import FakePrisma
+from project.analytics_rollup import analytics_rollup
+from project.catalog_snapshot import SharedCatalog, write_catalog
+from project.instrumentation import RequestRecord
+from project.joke_pool import joke_pool
+from project.joke_selection import joke_selector
+from project.token_validation import token_validator
+
+
+def cases(
+    token: str, backend: str, shared: SharedCatalog
+) -> List[Tuple[str, Callable[[], Any], float]]:
+    """
+    The functions to time, with the fraction of --iterations each runs for.
+
+    Functions that aggregate in SQL are only timed against PostgreSQL.
+    """
+    record = RequestRecord(
+        endpoint="/joke",
+        method="GET",
+        status_code=200,
+        duration=0.001,
+        api_key=None,
+        finished_at=time.time(),
+    )
+    raw_sql = backend == "postgres"
+    return [
+        (
+            "get_random_joke",
+            lambda: project.get_random_joke_service.get_random_joke("en"),
+            1.0,
+        ),
+        (
+            "get_joke_in_language",
+            lambda: project.get_joke_in_language_service.get_joke_in_language("de"),
+            1.0,
+        ),
+        (
+            "get_joke_in_language fallback",
+            lambda: project.get_joke_in_language_service.get_joke_in_language("pt-BR"),
+            1.0,
+        ),
+        (
+            "get_api_usage_stats",
+            project.get_api_usage_stats_service.get_api_usage_stats,
+            1.0,
+        ),
+        *(
+            [
+                (
+                    "get_performance_metrics",
+                    project.get_performance_metrics_service.get_performance_metrics,
+                    0.1,
+                )
+            ]
+            if raw_sql
+            else []
+        ),
+        (
+            "rate_limit_check",
+            lambda: project.rate_limit_check_service.rate_limit_check("ip:127.0.0.1"),
+            1.0,
+        ),
+        (
+            "authenticate_user",
+            lambda: project.authenticate_user_service.authenticate_user(
+                BENCH_EMAIL, BENCH_PASSWORD
+            ),
+            0.005,
+        ),
+        ("token_validator.validate", lambda: token_validator.validate(token), 1.0),
+        ("joke_pool.pick", lambda: joke_pool.pick("en"), 1.0),
+        ("shared_catalog.pick", lambda: shared.pick("en").joke_json, 1.0),
+        ("joke_selector.pick", lambda: joke_selector.pick("bench", "en"), 1.0),
+        ("analytics_rollup.observe", lambda: analytics_rollup.observe(record), 1.0),
+    ]
+
+
+async def time_calls(fn: Callable[[], Any], iterations: int) -> Dict[str, float]:
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t = time.perf_counter()
+        result = fn()
+        if inspect.isawaitable(result):
+            await result
+        latencies.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - started
+    return {"calls_per_second": iterations / elapsed, **summarize(latencies)}
+
+
+async def main(args: argparse.Namespace) -> None:
+    if args.backend == "fake":
+        project.server.db_client = FakePrisma().install()
+    db = project.server.db_client
+    await db.connect()
+    try:
+        if args.backend == "fake":
+            seed_fake(db, args.jokes, pending=0)
+        else:
+            await seed_postgres(db, args.jokes, pending=0)
+        await seed_accounts()
+        await joke_pool.warm()
+        token = project.authenticate_user_service.create_access_token(
+            {"sub": BENCH_EMAIL}
+        )
+        results = {}
+        with tempfile.TemporaryDirectory() as directory:
+            snapshot = os.path.join(directory, "catalog.bin")
+            write_catalog(snapshot, 1, len(joke_pool), joke_pool.entries())
+            shared = SharedCatalog(snapshot)
+            for name, fn, share in cases(token, args.backend, shared):
+                iterations = max(1, int(args.iterations * share))
+                results[name] = stats = await time_calls(fn, iterations)
+                print(
+                    f"{name:<32} {stats['calls_per_second']:>10.0f}/s "
+                    f"p50={stats['p50_ms'] * 1000:.1f}us p99={stats['p99_ms'] * 1000:.1f}us",
+                    file=sys.stderr,
+                )
+    finally:
+        project.authenticate_user_service.password_hasher.shutdown()
+        await db.disconnect()
+    path = save_results("services", vars(args), results, args.output)
+    print(f"Results written to {path}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--backend", choices=["fake", "postgres"], default="fake")
+    parser.add_argument("--jokes", type=int, default=100_000)
+    parser.add_argument("--iterations", type=int, default=20_000)
+    parser.add_argument("--output", help="defaults to benchmarks/results/")
+    asyncio.run(main(parser.parse_args()))
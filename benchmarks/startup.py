@@ -0,0 +1,161 @@
+"""
+Measures cold start: import time, time to serving, to the first joke and to readiness.
+
+Each run is a fresh interpreter, with nothing imported or cached yet, that
+imports project.server, runs the app's lifespan in process behind httpx's
+ASGI transport and polls `GET /joke` and `GET /ready` until they succeed. Runs alternate between a normal start and FAST_START, against
+either the in-memory fake of the Prisma models (`--backend fake`, the
+default, seeded with `--jokes` jokes before startup) or the database at
+DATABASE_URL (`--backend postgres`). Per mode, the median and spread of each
+measurement are printed and saved as JSON under benchmarks/results/.
+
+Usage:
+    poetry run python -m benchmarks.startup --runs 10
+    poetry run python -m benchmarks.startup --backend postgres --jokes 0
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+MODES = {"normal": "0", "fast_start": "1"}
+
+MEASUREMENTS = (
+    "import_seconds",
+    "serving_seconds",
+    "first_joke_seconds",
+    "ready_seconds",
+    "process_seconds",
+)
+
+# How often the child polls for its first joke and for readiness, and when it
+# gives up.
+POLL_SECONDS = 0.001
+POLL_TIMEOUT_SECONDS = 60
+
+
+async def _poll(client: Any, path: str) -> float:
+    deadline = time.perf_counter() + POLL_TIMEOUT_SECONDS
+    while True:
+        response = await client.get(path)
+        if response.status_code == 200:
+            return time.perf_counter()
+        if time.perf_counter() > deadline:
+            raise RuntimeError(f"{path} answered {response.status_code}")
+        await asyncio.sleep(POLL_SECONDS)
+
+
+async def child(args: argparse.Namespace) -> Dict[str, float]:
+    """
+    One cold start in this process.
+    """
+    imported = time.perf_counter()
+    os.environ.setdefault("RATE_LIMIT_REQUESTS", str(10**9))
+    import project.server
+
+    result = {"import_seconds": time.perf_counter() - imported}
+
+    import httpx
+    from benchmarks.common import seed_fake
+    from benchmarks.fake_prisma import FakePrisma
+
+    seeding = time.perf_counter()
+    if args.backend == "fake":
+        project.server.db_client = FakePrisma().install()
+        seed_fake(project.server.db_client, args.jokes, 0)
+    result["seed_seconds"] = time.perf_counter() - seeding
+    app = project.server.app
+    started = time.perf_counter()
+    async with app.router.lifespan_context(app):
+        serving = time.perf_counter()
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://bench"
+        ) as client:
+            first_joke, ready = await asyncio.gather(
+                _poll(client, "/joke?language=en"), _poll(client, "/ready")
+            )
+    result["serving_seconds"] = serving - started
+    result["first_joke_seconds"] = first_joke - started
+    result["ready_seconds"] = ready - started
+    # Wall-clock time of the first joke, for the parent to time the whole
+    # process from when it was spawned.
+    result["first_joke_at"] = time.time() - (time.perf_counter() - first_joke)
+    return result
+
+
+def run_child(args: argparse.Namespace, fast_start: str) -> Dict[str, float]:
+    command = [
+        sys.executable,
+        "-m",
+        "benchmarks.startup",
+        "--child",
+        "--backend",
+        args.backend,
+        "--jokes",
+        str(args.jokes),
+    ]
+    spawned = time.time()
+    completed = subprocess.run(
+        command,
+        env={**os.environ, "FAST_START": fast_start},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    # Interpreter startup included, the fake's seeding left out.
+    result["process_seconds"] = (
+        result["first_joke_at"] - spawned - result["seed_seconds"]
+    )
+    return result
+
+
+def summarize_runs(runs: List[Dict[str, float]]) -> Dict[str, Dict[str, float]]:
+    summary = {}
+    for name in MEASUREMENTS:
+        samples = sorted(run[name] for run in runs)
+        summary[name] = {
+            "median_ms": samples[len(samples) // 2] * 1000,
+            "min_ms": samples[0] * 1000,
+            "max_ms": samples[-1] * 1000,
+        }
+    return summary
+
+
+def main(args: argparse.Namespace) -> None:
+    from benchmarks.common import save_results
+
+    runs: Dict[str, List[Dict[str, float]]] = {mode: [] for mode in MODES}
+    for _ in range(args.runs):
+        for mode, fast_start in MODES.items():
+            runs[mode].append(run_child(args, fast_start))
+    results = {}
+    for mode, mode_runs in runs.items():
+        results[mode] = summarize_runs(mode_runs)
+        print(f"{mode} ({len(mode_runs)} runs)")
+        for name, stats in results[mode].items():
+            print(
+                f"  {name:<20} median {stats['median_ms']:8.1f} ms"
+                f"  min {stats['min_ms']:8.1f} ms  max {stats['max_ms']:8.1f} ms"
+            )
+    path = save_results("startup", vars(args), results, args.output)
+    print(f"results written to {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--backend", choices=["fake", "postgres"], default="fake")
+    parser.add_argument("--jokes", type=int, default=10000)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", help="defaults to benchmarks/results/")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(asyncio.run(child(args))))
+    else:
+        main(args)
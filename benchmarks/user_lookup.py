@@ -0,0 +1,129 @@
+"""
+Compares login user lookups against a seeded User table.
+
+Seeds `--users` rows (1M by default) into the database at DATABASE_URL with a
+single INSERT ... SELECT, skipping the seed if the table is already that
+large. It then times three ways of resolving a login identifier:
+
+* `or`: the previous `find_first` with an OR over email and id
+* `unique`: `get_user` with its cache disabled, i.e. one unique-index lookup
+* `cached`: `get_user` with its cache enabled, replaying a credential-stuffing
+  style burst where a small set of identifiers is tried over and over
+
+Both query shapes are also run through EXPLAIN ANALYZE so the plans can be compared.
+
+Usage:
+    docker-compose up -d db && prisma db push
+    poetry run python -m benchmarks.user_lookup [--users 1000000] [--lookups 5000]
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from typing import Awaitable, Callable, Dict, List
+
+import prisma.models
+import project.authenticate_user_service as auth
+from prisma import Prisma
+
+SEED_SQL = """
+INSERT INTO "User" (id, email, hash, "updatedAt")
+SELECT gen_random_uuid(), 'bench-user-' || g || '@example.com', 'x', now()
+FROM generate_series($1::int, $2::int) AS g
+ON CONFLICT DO NOTHING
+"""
+
+
+async def seed(db: Prisma, users: int) -> None:
+    existing = await prisma.models.User.prisma().count()
+    if existing >= users:
+        print(f"User table already has {existing} rows")
+        return
+    started = time.perf_counter()
+    await db.execute_raw(SEED_SQL, existing + 1, users)
+    await db.execute_raw('ANALYZE "User"')
+    print(f"Seeded {users - existing} users in {time.perf_counter() - started:.1f}s")
+
+
+async def time_lookups(
+    identifiers: List[str], lookup: Callable[[str], Awaitable[object]]
+) -> Dict[str, float]:
+    latencies = []
+    started = time.perf_counter()
+    for identifier in identifiers:
+        t = time.perf_counter()
+        await lookup(identifier)
+        latencies.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "lookups_per_second": len(identifiers) / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+    }
+
+
+async def or_lookup(identifier: str):
+    return await prisma.models.User.prisma().find_first(
+        where={"OR": [{"email": identifier}, {"id": identifier}]}
+    )
+
+
+async def uncached_lookup(identifier: str):
+    auth.user_cache.clear()
+    return await auth.get_user(identifier)
+
+
+async def explain(db: Prisma, identifier: str) -> None:
+    for label, sql in (
+        (
+            "or",
+            'EXPLAIN ANALYZE SELECT * FROM "User" WHERE email = $1 OR id = $1 LIMIT 1',
+        ),
+        ("unique", 'EXPLAIN ANALYZE SELECT * FROM "User" WHERE email = $1 LIMIT 1'),
+    ):
+        rows = await db.query_raw(sql, identifier)
+        print(f"-- {label}")
+        for row in rows:
+            print("   " + row["QUERY PLAN"])
+
+
+async def main(users: int, lookups: int) -> None:
+    db = Prisma(auto_register=True)
+    await db.connect()
+    try:
+        await seed(db, users)
+        rows = await db.query_raw(
+            'SELECT email FROM "User" ORDER BY random() LIMIT $1', min(lookups, 1000)
+        )
+        emails = [row["email"] for row in rows]
+        identifiers = [random.choice(emails) for _ in range(lookups)]
+        # Half of a stuffing burst is usually identifiers that do not exist.
+        burst = [
+            random.choice(emails[:20]) if i % 2 else f"missing-{i % 20}@example.com"
+            for i in range(lookups)
+        ]
+        await explain(db, emails[0])
+        results = {
+            "or": await time_lookups(identifiers, or_lookup),
+            "unique": await time_lookups(identifiers, uncached_lookup),
+            "cached": await time_lookups(burst, auth.get_user),
+        }
+        for name, stats in results.items():
+            print(
+                f"{name:<7} {stats['lookups_per_second']:>9.0f}/s "
+                f"p50={stats['p50_ms']:.3f}ms p99={stats['p99_ms']:.3f}ms"
+            )
+    finally:
+        await db.disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=5000)
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.lookups))
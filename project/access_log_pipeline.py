@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import os
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import prisma
+import prisma.models
+from project.instrumentation import RequestRecord
+
+logger = logging.getLogger(__name__)
+
+ACCESS_LOG_QUEUE_SIZE = int(os.getenv("ACCESS_LOG_QUEUE_SIZE", "10000"))
+
+ACCESS_LOG_BATCH_SIZE = int(os.getenv("ACCESS_LOG_BATCH_SIZE", "500"))
+
+ACCESS_LOG_FLUSH_SECONDS = float(os.getenv("ACCESS_LOG_FLUSH_SECONDS", "2"))
+
+# Upper bound on remembered API key -> ApiKey.id resolutions.
+API_KEY_CACHE_SIZE = 10000
+
+
+@dataclass(frozen=True, slots=True)
+class AccessEvent:
+    """
+    A single request waiting to be written to `AccessLog`.
+    """
+
+    endpoint: str
+    api_key: Optional[str]
+    access_time: datetime
+
+
+class AccessLogPipeline:
+    """
+    Buffers access events on a bounded queue and writes them to the database in batches.
+
+    `record()` is called on the request path and never waits: when the queue
+    is full the event is dropped and counted in `dropped`. A background task
+    flushes the queue whenever it holds `batch_size` events, or every
+    `flush_interval` seconds otherwise. Each flush writes its `AccessLog` rows
+    with one `create_many`. Per-endpoint counts in `Analytics` are maintained
+    by `project.usage_leaderboard`.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = ACCESS_LOG_QUEUE_SIZE,
+        batch_size: int = ACCESS_LOG_BATCH_SIZE,
+        flush_interval: float = ACCESS_LOG_FLUSH_SECONDS,
+    ) -> None:
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: asyncio.Queue[AccessEvent] = asyncio.Queue(maxsize)
+        self._batch_ready = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._api_key_ids: Dict[str, str] = {}
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+
+    def record(self, record: RequestRecord) -> None:
+        """
+        Queues a handled request for writing. Registered as a request observer.
+        """
+        try:
+            self._queue.put_nowait(
+                AccessEvent(
+                    endpoint=record.endpoint,
+                    api_key=record.api_key,
+                    access_time=datetime.fromtimestamp(
+                        record.finished_at, timezone.utc
+                    ),
+                )
+            )
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return
+        self.enqueued += 1
+        if self._queue.qsize() >= self.batch_size:
+            self._batch_ready.set()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queued": self._queue.qsize(),
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "written": self.written,
+            "failed": self.failed,
+        }
+
+    async def _resolve_api_keys(self, keys: List[str]) -> None:
+        unknown = [key for key in keys if key not in self._api_key_ids]
+        if not unknown:
+            return
+        if len(self._api_key_ids) + len(unknown) > API_KEY_CACHE_SIZE:
+            self._api_key_ids.clear()
+        api_keys = await prisma.models.ApiKey.prisma().find_many(
+            where={"key": {"in": unknown}}
+        )
+        for api_key in api_keys:
+            self._api_key_ids[api_key.key] = api_key.id
+
+    async def _write(self, batch: List[AccessEvent]) -> None:
+        await self._resolve_api_keys(
+            list({event.api_key for event in batch if event.api_key})
+        )
+        access_logs = [
+            {
+                "apiKeyId": self._api_key_ids[event.api_key],
+                "endpoint": event.endpoint,
+                "accessTime": event.access_time,
+            }
+            for event in batch
+            if event.api_key in self._api_key_ids
+        ]
+        if access_logs:
+            await prisma.models.AccessLog.prisma().create_many(data=access_logs)
+
+    async def flush(self) -> None:
+        """
+        Writes everything currently queued, one batch at a time.
+        """
+        while not self._queue.empty():
+            batch = [
+                self._queue.get_nowait()
+                for _ in range(min(self.batch_size, self._queue.qsize()))
+            ]
+            try:
+                await self._write(batch)
+                self.written += len(batch)
+            except Exception:
+                self.failed += len(batch)
+                logger.exception("Error writing %d access log events", len(batch))
+
+    async def _flush_forever(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._batch_ready.clear()
+            await self.flush()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._flush_forever())
+
+    async def stop(self) -> None:
+        """
+        Stops the background task and drains whatever is still queued.
+        """
+        if self._task is not None:
+            self._stopping = True
+            self._batch_ready.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+
+access_log_pipeline = AccessLogPipeline()
@@ -0,0 +1,302 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+import prisma
+from project.database import timestamp
+from project.instrumentation import RequestRecord
+from project.request_metrics import BUCKET_BOUNDS, Histogram
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_FLUSH_SECONDS = float(os.getenv("ROLLUP_FLUSH_SECONDS", "15"))
+
+ROLLUP_COMPACT_SECONDS = float(os.getenv("ROLLUP_COMPACT_SECONDS", "300"))
+
+ROLLUP_MINUTE_RETENTION_HOURS = int(os.getenv("ROLLUP_MINUTE_RETENTION_HOURS", "2"))
+
+ROLLUP_HOUR_RETENTION_DAYS = int(os.getenv("ROLLUP_HOUR_RETENTION_DAYS", "2"))
+
+ROLLUP_DAY_RETENTION_DAYS = int(os.getenv("ROLLUP_DAY_RETENTION_DAYS", "400"))
+
+_UPSERT = """
+    ON CONFLICT ("endpoint", "granularity", "bucketStart") DO UPDATE SET
+        "requestCount" = r."requestCount" + EXCLUDED."requestCount",
+        "errorCount" = r."errorCount" + EXCLUDED."errorCount",
+        "totalDuration" = r."totalDuration" + EXCLUDED."totalDuration",
+        "latencyBuckets" = ARRAY(
+            SELECT a + b
+            FROM unnest(r."latencyBuckets", EXCLUDED."latencyBuckets")
+                WITH ORDINALITY AS t(a, b, i)
+            ORDER BY i
+        )
+"""
+
+_COLUMNS = """
+    "endpoint", "granularity", "bucketStart",
+    "requestCount", "errorCount", "totalDuration", "latencyBuckets"
+"""
+
+
+@dataclass(frozen=True)
+class Compaction:
+    """
+    Folds `finer` buckets older than `retention` into `coarser` ones.
+    """
+
+    finer: str
+    coarser: str
+    unit: str
+    retention: timedelta
+
+
+COMPACTIONS = (
+    Compaction(
+        "MINUTE", "HOUR", "hour", timedelta(hours=ROLLUP_MINUTE_RETENTION_HOURS)
+    ),
+    Compaction("HOUR", "DAY", "day", timedelta(days=ROLLUP_HOUR_RETENTION_DAYS)),
+)
+
+
+@dataclass
+class RollupWindow:
+    """
+    Totals and latency percentiles, in seconds, over every endpoint in a window.
+    """
+
+    request_count: int
+    error_count: int
+    total_duration: float
+    p50: float
+    p95: float
+    p99: float
+    most_accessed_endpoint: Optional[str]
+
+
+def _bound(bucket: Optional[int]) -> float:
+    # Array positions from WITH ORDINALITY start at 1.
+    return BUCKET_BOUNDS[bucket - 1] if bucket else 0.0
+
+
+class AnalyticsRollup:
+    """
+    Per-endpoint request totals and latency histograms in time buckets.
+
+    Requests are counted into per-minute histograms in memory and added to the
+    `AnalyticsRollup` table every `flush_interval` seconds with one upsert, so
+    any number of processes can write to the same buckets. A compaction run
+    every `compact_interval` seconds folds minute buckets past their retention
+    into hour buckets and hours into days, and drops days past theirs. Each
+    moment is therefore covered by exactly one granularity, and a window of
+    any length reads at most a few hundred rows per endpoint.
+    """
+
+    def __init__(
+        self,
+        flush_interval: float = ROLLUP_FLUSH_SECONDS,
+        compact_interval: float = ROLLUP_COMPACT_SECONDS,
+    ) -> None:
+        self.flush_interval = flush_interval
+        self.compact_interval = compact_interval
+        self._pending: Dict[Tuple[str, int], Histogram] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._compacted_at = 0.0
+        self.written = 0
+        self.failed = 0
+        # Bumped after every flush that reached the table.
+        self.version = 0
+
+    def observe(self, record: RequestRecord) -> None:
+        """
+        Counts one handled request. Registered as a request observer.
+        """
+        key = (record.endpoint, int(record.finished_at // 60))
+        histogram = self._pending.get(key)
+        if histogram is None:
+            histogram = self._pending[key] = Histogram(key[1])
+        histogram.record(record.duration, record.status_code >= 500)
+
+    async def flush(self) -> None:
+        """
+        Adds the minute histograms counted since the last flush to the table.
+        """
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        values: List[str] = []
+        args: List[object] = []
+        for (endpoint, minute), histogram in pending.items():
+            n = len(args)
+            values.append(
+                f"(${n + 1}, 'MINUTE'::\"RollupGranularity\", ${n + 2}::timestamp, "
+                f"${n + 3}::int, ${n + 4}::int, ${n + 5}::float8, ${n + 6}::int[])"
+            )
+            args += [
+                endpoint,
+                timestamp(datetime.fromtimestamp(minute * 60, timezone.utc)),
+                str(histogram.count),
+                str(histogram.errors),
+                str(histogram.total),
+                "{" + ",".join(map(str, histogram.buckets)) + "}",
+            ]
+        try:
+            await prisma.get_client().execute_raw(
+                f'INSERT INTO "AnalyticsRollup" AS r ({_COLUMNS}) '
+                f"VALUES {', '.join(values)} {_UPSERT}",
+                *args,
+            )
+        except Exception:
+            self.failed += sum(histogram.count for histogram in pending.values())
+            logger.exception("Error writing %d analytics rollup buckets", len(pending))
+            return
+        self.written += sum(histogram.count for histogram in pending.values())
+        self.version += 1
+
+    async def compact(self, now: Optional[datetime] = None) -> None:
+        """
+        Moves buckets past their granularity's retention into the next coarser one.
+        """
+        now = now or datetime.now(timezone.utc)
+        client = prisma.get_client()
+        for compaction in COMPACTIONS:
+            # One statement: the rows are deleted and re-added as coarser
+            # buckets atomically, so a concurrent reader never counts them twice.
+            await client.execute_raw(
+                f"""
+                WITH moved AS (
+                    DELETE FROM "AnalyticsRollup"
+                    WHERE "granularity" = '{compaction.finer}'::"RollupGranularity"
+                        AND "bucketStart" < $1::timestamp
+                    RETURNING *
+                ),
+                cells AS (
+                    SELECT m."endpoint",
+                        date_trunc('{compaction.unit}', m."bucketStart") AS "bucketStart",
+                        u.i, sum(u.n)::int AS n
+                    FROM moved m,
+                        unnest(m."latencyBuckets") WITH ORDINALITY AS u(n, i)
+                    GROUP BY 1, 2, 3
+                ),
+                histograms AS (
+                    SELECT "endpoint", "bucketStart",
+                        array_agg(n ORDER BY i) AS "latencyBuckets"
+                    FROM cells
+                    GROUP BY 1, 2
+                ),
+                totals AS (
+                    SELECT "endpoint",
+                        date_trunc('{compaction.unit}', "bucketStart") AS "bucketStart",
+                        sum("requestCount")::int AS "requestCount",
+                        sum("errorCount")::int AS "errorCount",
+                        sum("totalDuration") AS "totalDuration"
+                    FROM moved
+                    GROUP BY 1, 2
+                )
+                INSERT INTO "AnalyticsRollup" AS r ({_COLUMNS})
+                SELECT t."endpoint", '{compaction.coarser}'::"RollupGranularity",
+                    t."bucketStart", t."requestCount", t."errorCount",
+                    t."totalDuration", h."latencyBuckets"
+                FROM totals t JOIN histograms h USING ("endpoint", "bucketStart")
+                {_UPSERT}
+                """,
+                timestamp(now - compaction.retention),
+            )
+        await client.execute_raw(
+            """
+            DELETE FROM "AnalyticsRollup"
+            WHERE "granularity" = 'DAY'::"RollupGranularity"
+                AND "bucketStart" < $1::timestamp
+            """,
+            timestamp(now - timedelta(days=ROLLUP_DAY_RETENTION_DAYS)),
+        )
+
+    async def window(self, start: datetime, end: datetime) -> RollupWindow:
+        """
+        Aggregates every bucket starting in [start, end] in the database.
+
+        Buckets are counted whole, so the window is accurate to the width of
+        the coarsest bucket at its start.
+        """
+        row = await prisma.get_client().query_first(
+            """
+            WITH windowed AS (
+                SELECT "endpoint", "requestCount", "errorCount", "totalDuration",
+                    "latencyBuckets"
+                FROM "AnalyticsRollup"
+                WHERE "granularity" IN ('MINUTE', 'HOUR', 'DAY')
+                    AND "bucketStart" BETWEEN $1::timestamp AND $2::timestamp
+            ),
+            cells AS (
+                SELECT u.i, sum(u.n) AS n
+                FROM windowed w,
+                    unnest(w."latencyBuckets") WITH ORDINALITY AS u(n, i)
+                GROUP BY u.i
+            ),
+            cumulative AS (
+                SELECT i, sum(n) OVER (ORDER BY i) AS seen, sum(n) OVER () AS total
+                FROM cells
+            )
+            SELECT
+                (SELECT coalesce(sum("requestCount"), 0) FROM windowed)::bigint
+                    AS "requestCount",
+                (SELECT coalesce(sum("errorCount"), 0) FROM windowed)::bigint
+                    AS "errorCount",
+                (SELECT coalesce(sum("totalDuration"), 0) FROM windowed)::float8
+                    AS "totalDuration",
+                (SELECT min(i) FROM cumulative WHERE seen >= 0.50 * total)::int AS "p50",
+                (SELECT min(i) FROM cumulative WHERE seen >= 0.95 * total)::int AS "p95",
+                (SELECT min(i) FROM cumulative WHERE seen >= 0.99 * total)::int AS "p99",
+                (
+                    SELECT "endpoint" FROM windowed
+                    GROUP BY "endpoint"
+                    ORDER BY sum("requestCount") DESC
+                    LIMIT 1
+                ) AS "mostAccessedEndpoint"
+            """,
+            timestamp(start),
+            timestamp(end),
+        )
+        return RollupWindow(
+            request_count=row["requestCount"],
+            error_count=row["errorCount"],
+            total_duration=row["totalDuration"],
+            p50=_bound(row["p50"]),
+            p95=_bound(row["p95"]),
+            p99=_bound(row["p99"]),
+            most_accessed_endpoint=row["mostAccessedEndpoint"],
+        )
+
+    async def _run_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+            if time.monotonic() - self._compacted_at >= self.compact_interval:
+                self._compacted_at = time.monotonic()
+                try:
+                    await self.compact()
+                except Exception:
+                    logger.exception("Error compacting analytics rollups")
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run_forever())
+
+    async def stop(self) -> None:
+        """
+        Stops the background task and writes whatever is still pending.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+analytics_rollup = AnalyticsRollup()
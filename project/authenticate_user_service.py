@@ -1,9 +1,16 @@
+import functools
+import os
+import uuid
 from datetime import datetime, timedelta
+from typing import Any, Dict
 
 import prisma
+import prisma.enums
 import prisma.models
-from jose import jwt
-from passlib.context import CryptContext
+from fastapi import Depends, HTTPException
+from project.password_hashing import PasswordHasher
+from project.token_validation import ALGORITHM, key_ring, require_token
+from project.ttl_cache import TTLCache
 from pydantic import BaseModel
 
 
@@ -16,26 +23,96 @@ class AuthenticationResponse(BaseModel):
     expires_in: int
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+@functools.lru_cache(maxsize=1)
+def crypt_context() -> Any:
+    """
+    The passlib context passwords are hashed with.
+
+    passlib and its bcrypt backend are only imported when a password is
+    first hashed or verified, so processes that never log anyone in do not
+    pay for them at startup.
+    """
+    from passlib.context import CryptContext
+
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-SECRET_KEY = "a_very_secret_key"
 
-ALGORITHM = "HS256"
+def __getattr__(name: str) -> Any:
+    # `pwd_context` is created on first use; see `crypt_context`.
+    if name == "pwd_context":
+        return crypt_context()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+password_hasher = PasswordHasher(crypt_context)
 
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "30"))
+
+USER_CACHE_NEGATIVE_TTL_SECONDS = float(
+    os.getenv("USER_CACHE_NEGATIVE_TTL_SECONDS", "5")
+)
+
+user_cache: TTLCache[prisma.models.User] = TTLCache(
+    USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS, USER_CACHE_NEGATIVE_TTL_SECONDS
+)
+
 
 async def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return await password_hasher.verify(plain_password, hashed_password)
+
+
+async def get_password_hash(password: str) -> str:
+    return await password_hasher.hash(password)
+
+
+def _user_where(username_or_email: str) -> dict:
+    # User ids are UUIDs, so an identifier that parses as one can only match
+    # the primary key; anything else can only match the unique email column.
+    try:
+        return {"id": str(uuid.UUID(username_or_email))}
+    except ValueError:
+        return {"email": username_or_email}
 
 
 async def get_user(username_or_email: str) -> prisma.models.User | None:
-    user = await prisma.models.User.prisma().find_first(
-        where={"OR": [{"email": username_or_email}, {"id": username_or_email}]}
+    """
+    Looks a user up by id or email with a single unique-index query.
+
+    Results, including misses, are cached briefly so that bursts of attempts
+    against the same identifier do not each reach the database.
+    """
+    found, user = user_cache.get(username_or_email)
+    if found:
+        return user
+    user = await prisma.models.User.prisma().find_unique(
+        where=_user_where(username_or_email)
     )
+    user_cache.put(username_or_email, user)
     return user
 
 
+async def require_moderator(
+    claims: Dict[str, Any] = Depends(require_token),
+) -> Dict[str, Any]:
+    """
+    FastAPI dependency that only lets moderators (users with the ADMIN role) through.
+
+    The role is read from the user rather than the token, through the user
+    cache, so a revoked role stops working within USER_CACHE_TTL_SECONDS.
+
+    Returns:
+        Dict[str, Any]: The verified claims of the caller's token.
+    """
+    user = await get_user(claims["sub"])
+    if user is None or user.role != prisma.enums.Role.ADMIN:
+        raise HTTPException(status_code=403, detail="Moderator role required")
+    return claims
+
+
 def create_access_token(data: dict, expires_delta: timedelta | None = None) -> str:
     to_encode = data.copy()
     if expires_delta:
@@ -43,7 +120,12 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None) -> s
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    from jose import jwt
+
+    kid, secret = key_ring.signing_key()
+    encoded_jwt = jwt.encode(
+        to_encode, secret, algorithm=ALGORITHM, headers={"kid": kid}
+    )
     return encoded_jwt
 
 
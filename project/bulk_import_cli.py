@@ -0,0 +1,98 @@
+"""
+Imports a file of jokes into the moderation queue.
+
+    python -m project.bulk_import_cli jokes.ndjson
+    python -m project.bulk_import_cli jokes.csv --submitter-id <user id>
+
+Progress is checkpointed to `<file>.checkpoint` after every committed batch;
+running the same command again after an interruption resumes from there.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+from typing import AsyncIterator, Optional
+
+import project.bulk_import_jokes_service
+import project.near_duplicates
+from prisma import Prisma
+
+
+async def _read_lines(path: str) -> AsyncIterator[str]:
+    with open(path, encoding="utf-8", newline="") as f:
+        for line in f:
+            yield line.rstrip("\r\n")
+
+
+def _load_checkpoint(path: str) -> int:
+    try:
+        with open(path) as f:
+            return int(f.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def _save_checkpoint(path: str, line: int) -> None:
+    # Written to a temporary file and renamed so a crash never leaves a torn checkpoint.
+    with open(path + ".tmp", "w") as f:
+        f.write(str(line))
+    os.replace(path + ".tmp", path)
+
+
+async def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("path", help="NDJSON or CSV file of jokes")
+    parser.add_argument("--format", choices=["ndjson", "csv"])
+    parser.add_argument("--submitter-id")
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=project.bulk_import_jokes_service.BULK_IMPORT_BATCH_SIZE,
+    )
+    parser.add_argument("--checkpoint", help="defaults to <path>.checkpoint")
+    parser.add_argument(
+        "--restart", action="store_true", help="ignore an existing checkpoint"
+    )
+    args = parser.parse_args(argv)
+
+    format = args.format or ("csv" if args.path.endswith(".csv") else "ndjson")
+    checkpoint_path = args.checkpoint or args.path + ".checkpoint"
+    resume_from_line = 0 if args.restart else _load_checkpoint(checkpoint_path)
+    if resume_from_line:
+        print(f"resuming after line {resume_from_line}", file=sys.stderr)
+
+    def on_batch(batch: project.bulk_import_jokes_service.BulkImportBatch) -> None:
+        _save_checkpoint(checkpoint_path, batch.last_line)
+        print(
+            f"batch {batch.batch}: line {batch.last_line}, {batch.imported} imported, "
+            f"{batch.rejected} rejected, {batch.rows_per_second:.0f} rows/s",
+            file=sys.stderr,
+        )
+
+    db_client = Prisma(auto_register=True)
+    await db_client.connect()
+    try:
+        if project.near_duplicates.JOKE_DUPLICATE_CHECK != "off":
+            # Imported rows are checked against the jokes already stored.
+            await project.near_duplicates.near_duplicate_index.backfill()
+        res = await project.bulk_import_jokes_service.bulk_import_jokes(
+            _read_lines(args.path),
+            format,
+            args.submitter_id,
+            resume_from_line,
+            args.batch_size,
+            on_batch,
+        )
+    finally:
+        await db_client.disconnect()
+
+    for error in res.errors:
+        print(error, file=sys.stderr)
+    print(res.message)
+    print(f"{res.imported} imported, {res.rejected} rejected")
+    return 0 if res.success else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
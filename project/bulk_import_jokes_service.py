@@ -0,0 +1,292 @@
+import codecs
+import csv
+import json
+import os
+import time
+import uuid
+from datetime import timedelta
+from typing import AsyncIterable, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+import prisma
+import prisma.enums
+import prisma.models
+from project.near_duplicates import (
+    JOKE_DUPLICATE_CHECK,
+    near_duplicate_index,
+    signature,
+)
+from pydantic import BaseModel
+
+BULK_IMPORT_BATCH_SIZE = int(os.getenv("BULK_IMPORT_BATCH_SIZE", "1000"))
+
+# Longer input lines are rejected; `iter_lines` stops buffering them at this
+# many characters, so a body without line breaks cannot exhaust memory.
+BULK_IMPORT_MAX_LINE_LENGTH = int(os.getenv("BULK_IMPORT_MAX_LINE_LENGTH", "65536"))
+
+# Only the first few validation errors are reported back; the counts cover the rest.
+MAX_REPORTED_ERRORS = 100
+
+MAX_FIELD_LENGTH = 2000
+
+CSV_COLUMNS = ("setup", "punchline", "language", "submitterId")
+
+
+class BulkImportBatch(BaseModel):
+    """
+    Throughput of one committed batch of a bulk import.
+    """
+
+    batch: int
+    last_line: int
+    imported: int
+    rejected: int
+    seconds: float
+    rows_per_second: float
+
+
+class BulkImportResponse(BaseModel):
+    """
+    Outcome of a bulk import. `resume_from_line` is the last input line whose batch was committed; passing it back resumes the import after that line.
+    """
+
+    success: bool
+    message: str
+    imported: int
+    rejected: int
+    lines_read: int
+    resume_from_line: int
+    batches: List[BulkImportBatch]
+    errors: List[str]
+
+
+async def iter_lines(
+    chunks: AsyncIterable[bytes], max_length: int = BULK_IMPORT_MAX_LINE_LENGTH
+) -> AsyncIterator[str]:
+    """
+    Splits a stream of UTF-8 byte chunks into lines without buffering the whole body.
+
+    A line longer than `max_length` is cut to `max_length + 1` characters as
+    it is read, which is enough for `bulk_import_jokes` to reject it.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")[: max_length + 1]
+        if len(pending) > max_length:
+            pending = pending[: max_length + 1]
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")[: max_length + 1]
+
+
+def _parse(line: str, format: str, header: Optional[List[str]]) -> Dict[str, object]:
+    if format == "csv":
+        values = next(csv.reader([line]))
+        return dict(zip(header or CSV_COLUMNS, values))
+    row = json.loads(line)
+    if not isinstance(row, dict):
+        raise ValueError("expected a JSON object")
+    return row
+
+
+def _validate(
+    row: Dict[str, object], default_submitter_id: Optional[str]
+) -> Dict[str, object]:
+    data: Dict[str, object] = {}
+    for field in ("setup", "punchline"):
+        value = row.get(field)
+        if not isinstance(value, str) or not value.strip():
+            raise ValueError(f"'{field}' must be a non-empty string")
+        if len(value) > MAX_FIELD_LENGTH:
+            raise ValueError(f"'{field}' is longer than {MAX_FIELD_LENGTH} characters")
+        data[field] = value
+    language = row.get("language") or "en"
+    if not isinstance(language, str):
+        raise ValueError("'language' must be a string")
+    data["language"] = language
+    submitter_id = row.get("submitterId") or default_submitter_id
+    if submitter_id is not None:
+        data["createdByUserId"] = str(submitter_id)
+    return data
+
+
+async def _insert_batch(
+    rows: List[Dict[str, object]],
+) -> Tuple[List[Dict[str, object]], List[str]]:
+    """
+    Inserts one batch of jokes and their moderation queue entries in a single transaction.
+
+    Rows naming a submitter that does not exist are rejected up front so that
+    one bad reference cannot fail the whole batch.
+
+    Returns:
+        Tuple[List[Dict[str, object]], List[str]]: The rows inserted, and why the others were not.
+    """
+    errors: List[str] = []
+    submitter_ids = {row["createdByUserId"] for row in rows if "createdByUserId" in row}
+    if submitter_ids:
+        users = await prisma.models.User.prisma().find_many(
+            where={"id": {"in": list(submitter_ids)}}
+        )
+        missing = submitter_ids - {user.id for user in users}
+        if missing:
+            errors = [f"unknown submitterId {submitter_id}" for submitter_id in missing]
+            rows = [row for row in rows if row.get("createdByUserId") not in missing]
+    if not rows:
+        return rows, errors
+    duplicates = {row["id"]: row.pop("duplicateOfId", None) for row in rows}
+    async with prisma.get_client().tx(timeout=timedelta(seconds=60)) as transaction:
+        await transaction.joke.create_many(data=rows)
+        await transaction.moderationqueue.create_many(
+            data=[
+                {
+                    "jokeId": row["id"],
+                    "status": prisma.enums.ModerationStatus.PENDING,
+                    "duplicateOfId": duplicates[row["id"]],
+                }
+                for row in rows
+            ]
+        )
+    return rows, errors
+
+
+async def bulk_import_jokes(
+    lines: AsyncIterable[str],
+    format: str = "ndjson",
+    submitterId: Optional[str] = None,
+    resume_from_line: int = 0,
+    batch_size: int = BULK_IMPORT_BATCH_SIZE,
+    on_batch: Optional[Callable[[BulkImportBatch], None]] = None,
+) -> BulkImportResponse:
+    """
+    Imports jokes for moderation from a stream of NDJSON or CSV lines.
+
+    Rows are validated as they are read and inserted in batches of `batch_size`,
+    each batch in its own transaction together with its PENDING moderation queue
+    entries. Only the current batch is held in memory. CSV input must start with
+    a header naming the columns (setup, punchline, language, submitterId) and
+    cannot contain line breaks inside quoted fields. Lines longer than
+    BULK_IMPORT_MAX_LINE_LENGTH characters are rejected.
+
+    Unless JOKE_DUPLICATE_CHECK is "off", each row is looked up in the
+    near-duplicate index like a submitted joke: with "reject" a near-duplicate
+    row is rejected, and otherwise it is queued with `duplicateOfId` set. Rows
+    are indexed as they are read, so a row also matches earlier rows of the
+    same import, and dropped from the index again if their batch fails.
+
+    Args:
+        lines (AsyncIterable[str]): The input, one record per line.
+        format (str): Either 'ndjson' or 'csv'.
+        submitterId (Optional[str]): Submitter recorded for rows that do not name one.
+        resume_from_line (int): Lines up to and including this one are skipped, as returned by a previous interrupted import.
+        batch_size (int): Rows per transaction.
+        on_batch (Optional[Callable[[BulkImportBatch], None]]): Called after each committed batch, e.g. to save a checkpoint.
+
+    Returns:
+        BulkImportResponse: Totals, per-batch throughput and the line to resume from.
+    """
+    if format not in ("ndjson", "csv"):
+        raise ValueError("Invalid format. Choices are 'ndjson' or 'csv'.")
+    header: Optional[List[str]] = None
+    batch: List[Dict[str, object]] = []
+    batches: List[BulkImportBatch] = []
+    errors: List[str] = []
+    imported = rejected = batch_rejected = 0
+    line_number = checkpoint = resume_from_line
+    line_count = 0
+    batch_started = time.perf_counter()
+
+    async def commit() -> None:
+        nonlocal imported, rejected, batch_rejected, checkpoint, batch, batch_started
+        try:
+            stored, batch_errors = await _insert_batch(batch)
+        except Exception:
+            for row in batch:
+                near_duplicate_index.remove(row["id"])
+            raise
+        inserted = len(stored)
+        stored_ids = {row["id"] for row in stored}
+        for row in batch:
+            if row["id"] not in stored_ids:
+                near_duplicate_index.remove(row["id"])
+        refused = len(batch) - inserted
+        imported += inserted
+        rejected += refused
+        errors.extend(batch_errors[: MAX_REPORTED_ERRORS - len(errors)])
+        seconds = time.perf_counter() - batch_started
+        stats = BulkImportBatch(
+            batch=len(batches) + 1,
+            last_line=line_number,
+            imported=inserted,
+            rejected=refused + batch_rejected,
+            seconds=seconds,
+            rows_per_second=inserted / seconds if seconds else 0.0,
+        )
+        batches.append(stats)
+        checkpoint = line_number
+        batch = []
+        batch_rejected = 0
+        batch_started = time.perf_counter()
+        if on_batch is not None:
+            on_batch(stats)
+
+    try:
+        async for line in lines:
+            line_count += 1
+            if format == "csv" and header is None:
+                header = next(csv.reader([line]))
+                continue
+            if line_count <= resume_from_line:
+                continue
+            line_number = line_count
+            if not line.strip():
+                continue
+            try:
+                if len(line) > BULK_IMPORT_MAX_LINE_LENGTH:
+                    raise ValueError(
+                        f"longer than {BULK_IMPORT_MAX_LINE_LENGTH} characters"
+                    )
+                row = _validate(_parse(line, format, header), submitterId)
+                row["id"] = str(uuid.uuid4())
+                if JOKE_DUPLICATE_CHECK != "off":
+                    sig = signature(str(row["setup"]), str(row["punchline"]))
+                    duplicate = near_duplicate_index.find(sig)
+                    if duplicate is not None and JOKE_DUPLICATE_CHECK == "reject":
+                        raise ValueError(f"near-duplicate of joke {duplicate[0]}")
+                    row["duplicateOfId"] = duplicate[0] if duplicate else None
+                    near_duplicate_index.add(str(row["id"]), sig)
+                batch.append(row)
+            except ValueError as e:
+                rejected += 1
+                batch_rejected += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append(f"line {line_number}: {e}")
+                continue
+            if len(batch) >= batch_size:
+                await commit()
+        if batch or batch_rejected:
+            await commit()
+    except Exception as e:
+        return BulkImportResponse(
+            success=False,
+            message=f"Import stopped after line {checkpoint}. Error: {str(e)}",
+            imported=imported,
+            rejected=rejected,
+            lines_read=line_count,
+            resume_from_line=checkpoint,
+            batches=batches,
+            errors=errors,
+        )
+    return BulkImportResponse(
+        success=True,
+        message=f"Imported {imported} jokes for review.",
+        imported=imported,
+        rejected=rejected,
+        lines_read=line_count,
+        resume_from_line=checkpoint,
+        batches=batches,
+        errors=errors,
+    )
@@ -0,0 +1,140 @@
+import asyncio
+import json
+import logging
+import os
+import uuid
+from dataclasses import asdict, dataclass
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+CATALOG_EVENTS_BACKEND = os.getenv("CATALOG_EVENTS_BACKEND", "memory")
+
+CATALOG_EVENTS_CHANNEL = os.getenv("CATALOG_EVENTS_CHANNEL", "joke_catalog")
+
+# Identifies this process so that it can ignore its own NOTIFY echoes.
+ORIGIN = uuid.uuid4().hex
+
+
+@dataclass(frozen=True)
+class CatalogEvent:
+    """
+    A moderation decision that changed whether a joke may be served.
+    """
+
+    joke_id: str
+    approved: bool
+    language: str
+    setup: str
+    punchline: str
+    origin: str = ORIGIN
+
+
+CatalogEventHandler = Callable[[CatalogEvent], None]
+
+
+class PostgresNotifyBackend:
+    """
+    Fans catalog events out to every process through PostgreSQL LISTEN/NOTIFY.
+
+    Requires the optional `asyncpg` dependency. A dedicated connection is kept
+    open for listening; notifications are sent over the same connection.
+    """
+
+    def __init__(self, dsn: str, channel: str = CATALOG_EVENTS_CHANNEL) -> None:
+        # Prisma-specific query parameters (schema, connection_limit, ...) are
+        # not understood by asyncpg.
+        self.dsn = dsn.split("?", 1)[0]
+        self.channel = channel
+        self._connection = None
+        self._send_lock = asyncio.Lock()
+
+    async def start(self, deliver: CatalogEventHandler) -> None:
+        try:
+            import asyncpg
+        except ImportError as e:
+            raise RuntimeError(
+                "CATALOG_EVENTS_BACKEND=postgres requires the 'asyncpg' package"
+            ) from e
+
+        def on_notify(connection, pid, channel, payload) -> None:
+            try:
+                event = CatalogEvent(**json.loads(payload))
+            except (TypeError, ValueError):
+                logger.warning("Ignoring malformed catalog event: %r", payload)
+                return
+            if event.origin != ORIGIN:
+                deliver(event)
+
+        self._connection = await asyncpg.connect(self.dsn)
+        await self._connection.add_listener(self.channel, on_notify)
+
+    async def send(self, event: CatalogEvent) -> None:
+        if self._connection is None:
+            return
+        async with self._send_lock:
+            await self._connection.execute(
+                "SELECT pg_notify($1, $2)", self.channel, json.dumps(asdict(event))
+            )
+
+    async def stop(self) -> None:
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
+
+
+class CatalogEventBus:
+    """
+    In-process publish/subscribe channel for catalog changes.
+
+    Handlers run synchronously on the event loop and must not block. When a
+    backend is attached, published events are also forwarded to it so that
+    other processes receive them.
+    """
+
+    def __init__(self) -> None:
+        self._handlers: List[CatalogEventHandler] = []
+        self.backend: Optional[PostgresNotifyBackend] = None
+
+    def subscribe(self, handler: CatalogEventHandler) -> None:
+        if handler not in self._handlers:
+            self._handlers.append(handler)
+
+    def unsubscribe(self, handler: CatalogEventHandler) -> None:
+        if handler in self._handlers:
+            self._handlers.remove(handler)
+
+    def deliver(self, event: CatalogEvent) -> None:
+        for handler in self._handlers:
+            try:
+                handler(event)
+            except Exception:
+                logger.exception("Error handling catalog event for %s", event.joke_id)
+
+    async def publish(self, event: CatalogEvent) -> None:
+        """
+        Delivers an event to local subscribers and forwards it to the backend.
+
+        A failure to forward is logged rather than raised: the decision has
+        already been committed, and other processes still converge on their
+        next periodic refresh.
+        """
+        self.deliver(event)
+        if self.backend is not None:
+            try:
+                await self.backend.send(event)
+            except Exception:
+                logger.exception("Error forwarding catalog event for %s", event.joke_id)
+
+    async def start(self) -> None:
+        if CATALOG_EVENTS_BACKEND == "postgres" and self.backend is None:
+            self.backend = PostgresNotifyBackend(os.environ["DATABASE_URL"])
+            await self.backend.start(self.deliver)
+
+    async def stop(self) -> None:
+        if self.backend is not None:
+            await self.backend.stop()
+            self.backend = None
+
+
+catalog_events = CatalogEventBus()
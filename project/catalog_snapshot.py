@@ -0,0 +1,283 @@
+import mmap
+import os
+import random
+import struct
+from typing import Dict, Iterable, Mapping, Optional, Sequence, Tuple
+
+from project.joke_weights import ClassSampler, freshness_class
+
+MAGIC = b"JOKECAT2"
+
+# Magic, generation, approved joke count, language count, class span count,
+# entry count.
+HEADER = struct.Struct("<8sQIIII")
+
+# Start and end of the language name in the string area, the index of its
+# first entry and how many entries it has, then the index of its first class
+# span and how many it has.
+LANGUAGE = struct.Struct("<6I")
+
+# A freshness class and the range of a language's entries, relative to its
+# first one, that belong to it. Only written for weighted catalogs, whose
+# entries are ordered by class within each language.
+CLASS_SPAN = struct.Struct("<iII")
+
+# Boundaries, relative to the string area, of one entry's fields in FIELDS
+# order: field i runs from bound i to bound i + 1.
+ENTRY = struct.Struct("<8I")
+
+FIELDS = (
+    "id",
+    "setup",
+    "punchline",
+    "language",
+    "localization_id",
+    "random_joke_json",
+    "joke_json",
+)
+
+
+class SharedJoke:
+    """
+    A joke read straight from a mapped catalog snapshot.
+
+    Has the attributes of a `PooledJoke`; each is sliced from the mapping when
+    it is read, so serving a pre-encoded body copies only that body.
+    """
+
+    __slots__ = ("_catalog", "_bounds")
+
+    def __init__(self, catalog: "SharedCatalog", bounds: Tuple[int, ...]) -> None:
+        self._catalog = catalog
+        self._bounds = bounds
+
+    def _bytes(self, field: int) -> bytes:
+        start = self._catalog.strings + self._bounds[field]
+        return self._catalog.buffer[
+            start : start + self._bounds[field + 1] - self._bounds[field]
+        ]
+
+    @property
+    def id(self) -> str:
+        return self._bytes(0).decode()
+
+    @property
+    def setup(self) -> str:
+        return self._bytes(1).decode()
+
+    @property
+    def punchline(self) -> str:
+        return self._bytes(2).decode()
+
+    @property
+    def language(self) -> str:
+        return self._bytes(3).decode()
+
+    @property
+    def localization_id(self) -> Optional[str]:
+        return self._bytes(4).decode() or None
+
+    @property
+    def random_joke_json(self) -> bytes:
+        return self._bytes(5)
+
+    @property
+    def joke_json(self) -> bytes:
+        return self._bytes(6)
+
+    @property
+    def key(self) -> str:
+        return self.localization_id or self.id
+
+
+class SharedCatalog:
+    """
+    A read-only, memory-mapped catalog snapshot written by `write_catalog`.
+
+    Every worker that opens the same snapshot file shares its pages with the
+    others, so the catalog is held in memory once per host rather than once
+    per process. Entries are grouped by language, so a random pick is one
+    index into the language's range and one fixed-size record read. In a
+    weighted catalog they are further grouped by freshness class, so a
+    weighted pick chooses a class and then an index within its range.
+    """
+
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as file:
+            self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        (
+            magic,
+            generation,
+            approved,
+            languages,
+            class_spans,
+            entries,
+        ) = HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a catalog snapshot")
+        self.path = path
+        self.generation = generation
+        self.approved = approved
+        spans = HEADER.size + languages * LANGUAGE.size
+        self.entries = spans + class_spans * CLASS_SPAN.size
+        self.strings = self.entries + entries * ENTRY.size
+        self._languages: Dict[str, Tuple[int, int]] = {}
+        self._classes: Dict[str, Tuple[ClassSampler, Dict[int, Tuple[int, int]]]] = {}
+        for i in range(languages):
+            start, end, first, count, first_span, span_count = LANGUAGE.unpack_from(
+                self.buffer, HEADER.size + i * LANGUAGE.size
+            )
+            name = self.buffer[self.strings + start : self.strings + end].decode()
+            self._languages[name] = (first, count)
+            ranges = {}
+            for j in range(first_span, first_span + span_count):
+                c, offset, members = CLASS_SPAN.unpack_from(
+                    self.buffer, spans + j * CLASS_SPAN.size
+                )
+                ranges[c] = (offset, members)
+            if ranges:
+                sampler = ClassSampler({c: n for c, (_, n) in ranges.items()})
+                self._classes[name] = (sampler, ranges)
+
+    def __len__(self) -> int:
+        return self.approved
+
+    def size(self, language: str) -> int:
+        return self._languages.get(language, (0, 0))[1]
+
+    def entry(self, index: int) -> SharedJoke:
+        return SharedJoke(
+            self, ENTRY.unpack_from(self.buffer, self.entries + index * ENTRY.size)
+        )
+
+    def entry_at(self, language: str, index: int) -> SharedJoke:
+        return self.entry(self._languages[language][0] + index)
+
+    def sample_weighted(self, language: str) -> Optional[int]:
+        """
+        Picks the index, within its language, of an entry with probability proportional to its freshness weight.
+        """
+        span = self._languages.get(language)
+        if span is None:
+            return None
+        classes = self._classes.get(language)
+        if classes is None:
+            return random.randrange(span[1])
+        sampler, ranges = classes
+        offset, members = ranges[sampler.choose()]
+        return offset + random.randrange(members)
+
+    def pick(self, language: str) -> Optional[SharedJoke]:
+        """
+        Picks a uniformly random joke or localization in the given language.
+        """
+        span = self._languages.get(language)
+        if span is None:
+            return None
+        return self.entry(span[0] + random.randrange(span[1]))
+
+
+def write_catalog(
+    path: str,
+    generation: int,
+    approved: int,
+    jokes: Mapping[str, Sequence[object]],
+    weighted: bool = False,
+) -> None:
+    """
+    Writes a catalog snapshot to `path`, atomically replacing any previous file.
+
+    Args:
+        path (str): Where to write the snapshot.
+        generation (int): The snapshot's version stamp.
+        approved (int): How many approved jokes the catalog holds.
+        jokes (Mapping[str, Sequence[object]]): `PooledJoke`s by language, localizations included.
+        weighted (bool): Whether to group each language's entries by freshness class.
+    """
+    languages = [(language, entries) for language, entries in jokes.items() if entries]
+    strings = bytearray()
+
+    def append(value: bytes) -> int:
+        strings.extend(value)
+        return len(strings)
+
+    table = bytearray()
+    spans = bytearray()
+    span_count = 0
+    records = bytearray()
+    first = 0
+    for language, entries in languages:
+        classes: Dict[int, list] = {}
+        if weighted:
+            for joke in entries:
+                classes.setdefault(freshness_class(joke.created_at), []).append(joke)
+            entries = [joke for c in sorted(classes) for joke in classes[c]]
+        start = len(strings)
+        table += LANGUAGE.pack(
+            start,
+            append(language.encode()),
+            first,
+            len(entries),
+            span_count,
+            len(classes),
+        )
+        offset = 0
+        for c in sorted(classes):
+            spans += CLASS_SPAN.pack(c, offset, len(classes[c]))
+            offset += len(classes[c])
+        span_count += len(classes)
+        first += len(entries)
+        for joke in entries:
+            bounds = [len(strings)]
+            for value in _fields(joke):
+                bounds.append(append(value))
+            records += ENTRY.pack(*bounds)
+    if len(strings) >= 2**32:
+        raise ValueError("The catalog is too large for a snapshot")
+    header = HEADER.pack(MAGIC, generation, approved, len(languages), span_count, first)
+    with open(f"{path}.tmp", "wb") as file:
+        file.write(header)
+        file.write(table)
+        file.write(spans)
+        file.write(records)
+        file.write(strings)
+    os.replace(f"{path}.tmp", path)
+
+
+def _fields(joke: object) -> Iterable[bytes]:
+    for name in FIELDS:
+        value = getattr(joke, name)
+        if value is None:
+            yield b""
+        elif isinstance(value, bytes):
+            yield value
+        else:
+            yield value.encode()
+
+
+class CatalogStamp:
+    """
+    The generation of the current snapshot, in an 8-byte file every worker maps.
+
+    The leader writes a new snapshot file first and then stores its generation
+    here; followers poll the stamp and map the new file once it changes, so a
+    worker always sees either the old catalog or the complete new one.
+    """
+
+    def __init__(self, path: str) -> None:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < 8:
+                os.ftruncate(fd, 8)
+            self._buffer = mmap.mmap(fd, 8)
+        finally:
+            os.close(fd)
+
+    def read(self) -> int:
+        return struct.unpack_from("<Q", self._buffer, 0)[0]
+
+    def write(self, generation: int) -> None:
+        struct.pack_into("<Q", self._buffer, 0, generation)
+
+    def close(self) -> None:
+        self._buffer.close()
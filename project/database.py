@@ -0,0 +1,281 @@
+import asyncio
+import os
+import time
+from contextlib import AsyncExitStack, asynccontextmanager, nullcontext
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qsl, quote, urlencode, urlsplit, urlunsplit
+
+from dotenv import load_dotenv
+from prisma import Prisma
+from prisma.client import Batch
+from project.instrumentation import current_endpoint
+from project.query_tracing import query_tracer
+from project.request_metrics import Histogram
+
+# Connections the query engine may open, per process.
+DATABASE_POOL_SIZE = int(os.getenv("DATABASE_POOL_SIZE", "10"))
+
+# Queries allowed to wait for a connection at once; more are rejected outright.
+DATABASE_MAX_WAITING = int(os.getenv("DATABASE_MAX_WAITING", "100"))
+
+# How long a query may wait for a connection before being rejected.
+DATABASE_ACQUIRE_TIMEOUT = float(os.getenv("DATABASE_ACQUIRE_TIMEOUT", "2"))
+
+DATABASE_CONNECT_TIMEOUT = int(os.getenv("DATABASE_CONNECT_TIMEOUT", "5"))
+
+DATABASE_STATEMENT_TIMEOUT_MS = int(os.getenv("DATABASE_STATEMENT_TIMEOUT_MS", "5000"))
+
+# Client-side bound on one round trip to the query engine.
+DATABASE_QUERY_TIMEOUT = float(os.getenv("DATABASE_QUERY_TIMEOUT", "30"))
+
+
+class PoolExhausted(Exception):
+    """
+    Raised when a query cannot get a database connection within its budget.
+    """
+
+
+def database_url(url: Optional[str] = None) -> str:
+    """
+    Adds the pool and timeout settings to a PostgreSQL URL as Prisma parameters.
+
+    `connection_limit` is always set to DATABASE_POOL_SIZE, which `query_gate`
+    is sized by as well; other parameters already present in the URL are left
+    as they are.
+    """
+    parts = urlsplit(url or os.environ["DATABASE_URL"])
+    params = dict(parse_qsl(parts.query))
+    params["connection_limit"] = str(DATABASE_POOL_SIZE)
+    params.setdefault("pool_timeout", str(max(1, round(DATABASE_ACQUIRE_TIMEOUT))))
+    params.setdefault("connect_timeout", str(DATABASE_CONNECT_TIMEOUT))
+    if DATABASE_STATEMENT_TIMEOUT_MS:
+        params.setdefault(
+            "options", f"-c statement_timeout={DATABASE_STATEMENT_TIMEOUT_MS}"
+        )
+    return urlunsplit(parts._replace(query=urlencode(params, quote_via=quote)))
+
+
+def timestamp(value: datetime) -> str:
+    """
+    A time as a query parameter for a `timestamp` column, which Prisma fills with UTC.
+
+    Raw queries cast it with `$n::timestamp`.
+    """
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+class QueryGate:
+    """
+    Admits at most `size` queries to the engine at once and bounds the queue behind them.
+
+    `size` matches the engine's `connection_limit`, so a query admitted here
+    finds a free connection, and the queue lives in this process, where it can
+    be measured and cut short. A query that finds `max_waiting` others already
+    queued, or that waits longer than `timeout`, raises `PoolExhausted` rather
+    than adding to the backlog.
+    """
+
+    def __init__(
+        self,
+        size: int = DATABASE_POOL_SIZE,
+        max_waiting: int = DATABASE_MAX_WAITING,
+        timeout: float = DATABASE_ACQUIRE_TIMEOUT,
+    ) -> None:
+        self.size = size
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(size)
+        self.in_use = 0
+        self.waiting = 0
+        self.acquired = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.wait_times = Histogram()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        if self._semaphore.locked():
+            if self.waiting >= self.max_waiting:
+                self.rejected += 1
+                raise PoolExhausted(
+                    f"{self.waiting} queries are already waiting for a connection"
+                )
+            started = time.perf_counter()
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+            except asyncio.TimeoutError:
+                self.timed_out += 1
+                raise PoolExhausted(
+                    f"No database connection became free within {self.timeout}s"
+                ) from None
+            finally:
+                self.waiting -= 1
+            self.wait_times.record(time.perf_counter() - started, False)
+        else:
+            await self._semaphore.acquire()
+            self.wait_times.record(0.0, False)
+        self.in_use += 1
+        self.acquired += 1
+        try:
+            yield
+        finally:
+            self.in_use -= 1
+            self._semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": self.size,
+            "in_use": self.in_use,
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "acquired": self.acquired,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+
+query_gate = QueryGate()
+
+
+class QueryStats:
+    """
+    Count, errors and duration histogram of queries per route and Prisma operation.
+
+    Each route calls one service function, so the route template attributes
+    a query to the service that issued it. Queries made outside of requests
+    (pool refreshes, flushes) are attributed to "background".
+    """
+
+    def __init__(self) -> None:
+        self.queries: Dict[Tuple[str, str], Histogram] = {}
+
+    def record(self, operation: str, duration: float, error: bool) -> None:
+        key = (current_endpoint.get(), operation)
+        histogram = self.queries.get(key)
+        if histogram is None:
+            histogram = self.queries[key] = Histogram()
+        histogram.record(duration, error)
+
+
+query_stats = QueryStats()
+
+
+class GatedPrisma(Prisma):
+    """
+    Prisma client whose queries each pass through `query_gate`, and are timed and traced.
+
+    An interactive transaction (`tx()`) keeps its connection from start to
+    commit, so it takes one gate slot for all of that time, before the
+    transaction is started, and the queries made in it are not gated again.
+    A batch (`batch_()`) is one engine request on one connection and takes
+    one slot while it is sent, or none inside a transaction.
+
+    Queries made while the client is still connecting, as happens with
+    FAST_START, wait for the connection for up to DATABASE_CONNECT_TIMEOUT
+    and are then rejected with `PoolExhausted`, like queries that wait too
+    long for a pool slot.
+    """
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self._connection_ready = asyncio.Event()
+
+    async def connect(self, *args: Any, **kwargs: Any) -> None:
+        await super().connect(*args, **kwargs)
+        self._connection_ready.set()
+
+    async def disconnect(self, *args: Any, **kwargs: Any) -> None:
+        self._connection_ready.clear()
+        await super().disconnect(*args, **kwargs)
+
+    async def _wait_connected(self) -> None:
+        try:
+            await asyncio.wait_for(
+                self._connection_ready.wait(), DATABASE_CONNECT_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            raise PoolExhausted("The database is not connected yet") from None
+
+    async def _run(self, operation: str, query: Callable[[], Awaitable[Any]]) -> Any:
+        if not self.is_connected():
+            await self._wait_connected()
+        queued = time.perf_counter()
+        # A transaction already holds the slot its queries run on.
+        async with nullcontext() if self.is_transaction() else query_gate.slot():
+            started = time.perf_counter()
+            result = None
+            error = True
+            try:
+                result = await query()
+                error = False
+                return result
+            finally:
+                duration = time.perf_counter() - started
+                query_stats.record(operation, duration, error)
+                query_tracer.record(operation, result, duration, started - queued)
+
+    async def _execute(self, **kwargs: Any) -> Any:
+        model = kwargs.get("model")
+        operation = (
+            f"{model.__name__}.{kwargs['method']}"
+            if model is not None
+            else kwargs["method"]
+        )
+        return await self._run(operation, partial(super()._execute, **kwargs))
+
+    def tx(self, **kwargs: Any) -> "GatedTransaction":
+        return GatedTransaction(self, super().tx(**kwargs))
+
+    def batch_(self) -> "GatedBatch":
+        return GatedBatch(client=self)
+
+
+class GatedTransaction:
+    """
+    Transaction context manager that holds one `query_gate` slot until the transaction ends.
+    """
+
+    def __init__(self, client: GatedPrisma, manager: Any) -> None:
+        self._client = client
+        self._manager = manager
+        self._stack: Optional[AsyncExitStack] = None
+
+    async def __aenter__(self) -> GatedPrisma:
+        if not self._client.is_connected():
+            await self._client._wait_connected()
+        async with AsyncExitStack() as stack:
+            await stack.enter_async_context(query_gate.slot())
+            transaction = await stack.enter_async_context(self._manager)
+            self._stack = stack.pop_all()
+        return transaction
+
+    async def __aexit__(self, *exc_info: Any) -> Optional[bool]:
+        stack, self._stack = self._stack, None
+        return await stack.__aexit__(*exc_info)
+
+
+class GatedBatch(Batch):
+    """
+    Batch sent through its client's `_run`, so it is gated, timed and traced as one query.
+    """
+
+    def __init__(self, client: GatedPrisma) -> None:
+        super().__init__(client=client)
+        self._gated_client = client
+
+    async def commit(self) -> None:
+        await self._gated_client._run("batch", super().commit)
+
+
+def create_client() -> GatedPrisma:
+    # Prisma reads .env itself, but only once the client is constructed.
+    load_dotenv(".env")
+    return GatedPrisma(
+        auto_register=True,
+        datasource={"url": database_url()} if "DATABASE_URL" in os.environ else None,
+        connect_timeout=timedelta(seconds=DATABASE_CONNECT_TIMEOUT),
+        http={"timeout": DATABASE_QUERY_TIMEOUT},
+    )
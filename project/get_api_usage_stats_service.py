@@ -1,10 +1,20 @@
 from datetime import datetime
+from typing import List
 
-import prisma
-import prisma.models
+from project.usage_leaderboard import usage_leaderboard
 from pydantic import BaseModel
 
 
+class EndpointUsageStats(BaseModel):
+    """
+    Request volume of a single endpoint.
+    """
+
+    endpoint: str
+    request_count: int
+    last_access: datetime
+
+
 class GetApiUsageStatsResponse(BaseModel):
     """
     Structure representing the API usage analytics, including request volumes and popular endpoints.
@@ -13,31 +23,43 @@ class GetApiUsageStatsResponse(BaseModel):
     endpoint: str
     request_count: int
     last_access: datetime
+    top_endpoints: List[EndpointUsageStats] = []
 
 
-async def get_api_usage_stats() -> GetApiUsageStatsResponse:
+async def get_api_usage_stats(limit: int = 10) -> GetApiUsageStatsResponse:
     """
     Provides statistics on API usage.
 
-    This function retrieves the analytics record with the highest request count from the database and converts it into a GetApiUsageStatsResponse structure.
+    The most requested endpoints are read from the in-memory usage leaderboard, which is
+    kept up to date as requests are handled and reconciled with the Analytics table
+    periodically, so no query is made here.
+
+    Args:
+        limit (int): How many of the most requested endpoints to list, highest count first.
 
     Returns:
         GetApiUsageStatsResponse: Structure representing the API usage analytics, including request volumes and popular endpoints.
 
     Example:
-        response = await get_api_usage_stats()
-        > GetApiUsageStatsResponse(endpoint='/joke', request_count=200, last_access=datetime.now())
+        response = await get_api_usage_stats(3)
+        > GetApiUsageStatsResponse(endpoint='/joke', request_count=200, last_access=datetime.now(), top_endpoints=[...])
     """
-    max_request_record = await prisma.models.Analytics.prisma().find_first(
-        where=None, order={"requestCount": "desc"}
-    )
-    if max_request_record:
+    limit = max(limit, 0)
+    top_endpoints = [
+        EndpointUsageStats(
+            endpoint=entry.endpoint,
+            request_count=entry.count,
+            last_access=entry.last_access,
+        )
+        for entry in usage_leaderboard.top(max(limit, 1))
+    ]
+    if top_endpoints:
+        top = top_endpoints[0]
         return GetApiUsageStatsResponse(
-            endpoint=max_request_record.endpoint,
-            request_count=max_request_record.requestCount,
-            last_access=max_request_record.lastAccess
-            if max_request_record.lastAccess
-            else datetime.now(),
+            endpoint=top.endpoint,
+            request_count=top.request_count,
+            last_access=top.last_access,
+            top_endpoints=top_endpoints[:limit],
         )
     else:
         return GetApiUsageStatsResponse(
@@ -0,0 +1,57 @@
+import logging
+from typing import Dict
+
+import prisma
+from project.database import query_gate
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+
+class DatabasePoolStatsResponse(BaseModel):
+    """
+    Connection pool saturation of this process: admitted and queued queries, rejections and wait times.
+    """
+
+    size: int
+    in_use: int
+    waiting: int
+    max_waiting: int
+    acquired: int
+    rejected: int
+    timed_out: int
+    wait_p50_ms: float
+    wait_p95_ms: float
+    wait_p99_ms: float
+    engine: Dict[str, float] = {}
+
+
+async def get_database_pool_stats() -> DatabasePoolStatsResponse:
+    """
+    Reports how busy this process's database connection pool is.
+
+    Wait times cover every query since the process started; percentiles are
+    accurate to the histogram's bucket width. `engine` holds the query engine's
+    own connection gauges when its metrics are available.
+
+    Returns:
+        DatabasePoolStatsResponse: Connection pool saturation of this process.
+    """
+    wait_times = query_gate.wait_times
+    engine: Dict[str, float] = {}
+    try:
+        metrics = await prisma.get_client().get_metrics()
+        engine = {
+            gauge.key: gauge.value
+            for gauge in metrics.gauges
+            if gauge.key.startswith("prisma_pool_connections")
+        }
+    except Exception:
+        logger.debug("Query engine metrics are unavailable", exc_info=True)
+    return DatabasePoolStatsResponse(
+        **query_gate.stats(),
+        wait_p50_ms=wait_times.percentile(0.50) * 1000,
+        wait_p95_ms=wait_times.percentile(0.95) * 1000,
+        wait_p99_ms=wait_times.percentile(0.99) * 1000,
+        engine=engine,
+    )
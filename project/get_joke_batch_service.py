@@ -0,0 +1,277 @@
+import os
+from typing import AsyncIterator, Callable, Iterator, List, Optional, Sequence, Set
+
+import prisma
+from project.get_joke_in_language_service import JokeResponse, language_chain
+from project.joke_pool import ServedJoke, joke_pool
+from project.joke_selection import joke_selector
+from project.json_encoding import dumps
+from pydantic import BaseModel
+
+# Most jokes a JSON batch returns; larger batches have to be streamed as NDJSON.
+JOKE_BATCH_LIMIT = int(os.getenv("JOKE_BATCH_LIMIT", "100"))
+
+# Most jokes a streamed batch returns. Each joke in a batch counts as a request
+# against the client's rate limit, so this is best kept within it.
+JOKE_BATCH_STREAM_LIMIT = int(os.getenv("JOKE_BATCH_STREAM_LIMIT", "1000"))
+
+BATCH_FORMATS = ("json", "ndjson")
+
+# NDJSON lines sent per chunk of a streamed batch.
+STREAM_CHUNK_LINES = 256
+
+# Weighted picks that keep landing on jokes already in the batch are given up
+# on after this many tries, and their language is dropped from the batch.
+MAX_WEIGHTED_ATTEMPTS = 16
+
+
+class JokeBatchResponse(BaseModel):
+    """
+    Distinct random jokes across the requested languages, in one response.
+    """
+
+    jokes: List[JokeResponse]
+
+
+def _check_count(count: int, limit: int) -> None:
+    if count < 1:
+        raise ValueError("count must be at least 1.")
+    if count > limit:
+        raise ValueError(f"At most {limit} jokes can be fetched at once.")
+
+
+def check_batch(count: int, format: str) -> None:
+    """
+    Validates a batch request before anything is picked or charged for it.
+
+    Args:
+        count (int): How many jokes are asked for.
+        format (str): "json" or "ndjson".
+
+    Raises:
+        ValueError: If the format is unknown or the count out of range for it.
+    """
+    if format not in BATCH_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(BATCH_FORMATS)}.")
+    _check_count(
+        count, JOKE_BATCH_STREAM_LIMIT if format == "ndjson" else JOKE_BATCH_LIMIT
+    )
+
+
+def _resolve_languages(
+    languages: Sequence[str], available: Callable[[str], bool]
+) -> List[str]:
+    # Each requested language is served from the first language in its
+    # fallback chain that has jokes, as `/joke/{language}` does.
+    resolved: List[str] = []
+    for language in languages:
+        for candidate in language_chain(language):
+            if available(candidate):
+                if candidate not in resolved:
+                    resolved.append(candidate)
+                break
+    return resolved
+
+
+def _pick_unseen(
+    client: Optional[str], language: str, seen: Set[str]
+) -> Optional[ServedJoke]:
+    # A client's uniform cursor yields every joke of the language once per
+    # cycle, so within `size` picks it reaches any joke not yet in the batch.
+    attempts = MAX_WEIGHTED_ATTEMPTS if joke_pool.weighted else joke_pool.size(language)
+    for _ in range(attempts):
+        joke = joke_selector.pick(client, language)
+        if joke is None:
+            return None
+        if joke.id not in seen:
+            return joke
+    return None
+
+
+def iter_jokes(
+    count: int, languages: Sequence[str], client: Optional[str] = None
+) -> Iterator[ServedJoke]:
+    """
+    Yields up to `count` distinct jokes from the pool, taking turns between languages.
+
+    Jokes are picked one at a time with the client's selection cursors (see
+    `project.joke_selection`), so a feed does not repeat across batches
+    either, and no joke is yielded twice, counting a joke and its
+    localizations as the same joke. Fewer than `count` are yielded once the
+    languages run out of jokes.
+
+    Args:
+        count (int): How many jokes to yield at most.
+        languages (Sequence[str]): The languages to take turns between.
+        client (Optional[str]): Identifies the caller, e.g. by API key, for avoiding repeats.
+    """
+    rotation = _resolve_languages(
+        languages, lambda language: joke_pool.size(language) > 0
+    )
+    seen: Set[str] = set()
+    while rotation and len(seen) < count:
+        for language in list(rotation):
+            joke = _pick_unseen(client, language, seen)
+            if joke is None:
+                rotation.remove(language)
+                continue
+            seen.add(joke.id)
+            yield joke
+            if len(seen) == count:
+                return
+
+
+async def _languages_in_database(languages: Sequence[str]) -> Set[str]:
+    placeholders = ", ".join(f"${i}" for i in range(1, len(languages) + 1))
+    rows = await prisma.get_client().query_raw(
+        f"""
+        SELECT DISTINCT "language" FROM (
+            SELECT j."language"
+            FROM "Joke" j
+            WHERE j."approved" AND j."language" IN ({placeholders})
+            UNION ALL
+            SELECT l."language"
+            FROM "Localization" l JOIN "Joke" j ON j."id" = l."jokeId"
+            WHERE j."approved" AND l."language" IN ({placeholders})
+        ) AS candidates
+        """,
+        *languages,
+    )
+    return {row["language"] for row in rows}
+
+
+async def _batch_from_database(count: int, languages: Sequence[str]) -> List[dict]:
+    # Used only until the pool is loaded: one query finding which languages of
+    # the fallback chains have jokes, so that they resolve as from the pool,
+    # and one over native jokes and localizations of approved jokes in them,
+    # one row per joke.
+    chains = list(
+        dict.fromkeys(
+            candidate
+            for language in languages
+            for candidate in language_chain(language)
+        )
+    )
+    available = await _languages_in_database(chains)
+    languages = _resolve_languages(languages, available.__contains__)
+    if not languages:
+        return []
+    placeholders = ", ".join(f"${i}" for i in range(2, len(languages) + 2))
+    return await prisma.get_client().query_raw(
+        f"""
+        SELECT "id", "setup", "punchline", "language" FROM (
+            SELECT DISTINCT ON ("id") "id", "setup", "punchline", "language"
+            FROM (
+                SELECT j."id", j."setup", j."punchline", j."language"
+                FROM "Joke" j
+                WHERE j."approved" AND j."language" IN ({placeholders})
+                UNION ALL
+                SELECT l."jokeId", l."setup", l."punchline", l."language"
+                FROM "Localization" l JOIN "Joke" j ON j."id" = l."jokeId"
+                WHERE j."approved" AND l."language" IN ({placeholders})
+            ) AS candidates
+            ORDER BY "id", random()
+        ) AS jokes
+        ORDER BY random()
+        LIMIT $1::int
+        """,
+        str(count),
+        *languages,
+    )
+
+
+async def get_joke_batch(
+    count: int, languages: Sequence[str], client: Optional[str] = None
+) -> JokeBatchResponse:
+    """
+    Fetches `count` distinct random jokes across the given languages.
+
+    Args:
+        count (int): How many jokes to return, up to JOKE_BATCH_LIMIT.
+        languages (Sequence[str]): The languages to take turns between.
+        client (Optional[str]): Identifies the caller, e.g. by API key, for avoiding repeats.
+
+    Returns:
+        JokeBatchResponse: The jokes; fewer than `count` if the languages have fewer.
+    """
+    _check_count(count, JOKE_BATCH_LIMIT)
+    if not joke_pool.ready:
+        rows = await _batch_from_database(count, languages)
+        return JokeBatchResponse(jokes=[JokeResponse(**row) for row in rows])
+    return JokeBatchResponse(
+        jokes=[
+            JokeResponse(
+                id=joke.id,
+                setup=joke.setup,
+                punchline=joke.punchline,
+                language=joke.language,
+            )
+            for joke in iter_jokes(count, languages, client)
+        ]
+    )
+
+
+async def get_joke_batch_json(
+    count: int, languages: Sequence[str], client: Optional[str] = None
+) -> bytes:
+    """
+    Fetches a batch of jokes as an encoded `JokeBatchResponse` body.
+
+    Served from the pool, the body is joined from the jokes' pre-encoded
+    `JokeResponse` bodies, so no database query, model construction or
+    serialization takes place.
+
+    Args:
+        count (int): How many jokes to return, up to JOKE_BATCH_LIMIT.
+        languages (Sequence[str]): The languages to take turns between.
+        client (Optional[str]): Identifies the caller, e.g. by API key, for avoiding repeats.
+
+    Returns:
+        bytes: The JSON body of a JokeBatchResponse.
+    """
+    _check_count(count, JOKE_BATCH_LIMIT)
+    if not joke_pool.ready:
+        return dumps({"jokes": await _batch_from_database(count, languages)})
+    bodies = b",".join(joke.joke_json for joke in iter_jokes(count, languages, client))
+    return b'{"jokes":[' + bodies + b"]}"
+
+
+async def stream_joke_batch(
+    count: int, languages: Sequence[str], client: Optional[str] = None
+) -> AsyncIterator[bytes]:
+    """
+    Fetches a batch of jokes as NDJSON, one `JokeResponse` per line.
+
+    The count is checked before anything is sent. Jokes are then picked as
+    the response is written, a chunk of lines at a time, so memory use does
+    not grow with the body, only with the ids of the jokes already sent.
+
+    Args:
+        count (int): How many jokes to return, up to JOKE_BATCH_STREAM_LIMIT.
+        languages (Sequence[str]): The languages to take turns between.
+        client (Optional[str]): Identifies the caller, e.g. by API key, for avoiding repeats.
+
+    Returns:
+        AsyncIterator[bytes]: Chunks of the NDJSON body.
+    """
+    _check_count(count, JOKE_BATCH_STREAM_LIMIT)
+    rows = None if joke_pool.ready else await _batch_from_database(count, languages)
+
+    async def chunks() -> AsyncIterator[bytes]:
+        if rows is not None:
+            for start in range(0, len(rows), STREAM_CHUNK_LINES):
+                yield b"".join(
+                    dumps(row) + b"\n"
+                    for row in rows[start : start + STREAM_CHUNK_LINES]
+                )
+            return
+        lines: List[bytes] = []
+        for joke in iter_jokes(count, languages, client):
+            lines.append(joke.joke_json)
+            if len(lines) == STREAM_CHUNK_LINES:
+                yield b"\n".join(lines) + b"\n"
+                lines = []
+        if lines:
+            yield b"\n".join(lines) + b"\n"
+
+    return chunks()
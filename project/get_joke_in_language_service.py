@@ -1,9 +1,31 @@
-import random
+import functools
+import os
+from typing import Dict, Optional, Sequence, Tuple
 
 import prisma
-import prisma.models
+from project.joke_pool import ServedJoke, joke_pool
+from project.joke_selection import joke_selector
+from project.json_encoding import dumps
 from pydantic import BaseModel
 
+# Explicit fallbacks as comma-separated `language:fallback` pairs, e.g.
+# "gsw:de,pt-BR:pt". Languages without one fall back by dropping their last
+# subtag (de-AT -> de), and every chain ends in JOKE_DEFAULT_LANGUAGE.
+JOKE_LANGUAGE_FALLBACKS = os.getenv("JOKE_LANGUAGE_FALLBACKS", "")
+
+JOKE_DEFAULT_LANGUAGE = os.getenv("JOKE_DEFAULT_LANGUAGE", "en")
+
+
+def _parse_fallbacks(value: str) -> Dict[str, str]:
+    fallbacks: Dict[str, str] = {}
+    for pair in filter(None, (p.strip() for p in value.split(","))):
+        language, _, fallback = pair.partition(":")
+        fallbacks[language.strip()] = fallback.strip()
+    return fallbacks
+
+
+language_fallbacks = _parse_fallbacks(JOKE_LANGUAGE_FALLBACKS)
+
 
 class JokeResponse(BaseModel):
     """
@@ -16,25 +38,113 @@ class JokeResponse(BaseModel):
     language: str
 
 
-async def get_joke_in_language(language: str) -> JokeResponse:
+@functools.lru_cache(maxsize=1024)
+def language_chain(language: str) -> Tuple[str, ...]:
+    """
+    Returns the languages to try for a request, most specific first.
+
+    Args:
+        language (str): The requested language, e.g. 'de-AT'.
+
+    Returns:
+        Tuple[str, ...]: The requested language followed by its fallbacks, e.g. ('de-AT', 'de', 'en').
+    """
+    chain = []
+    current: Optional[str] = language
+    while current and current not in chain:
+        chain.append(current)
+        if current in language_fallbacks:
+            current = language_fallbacks[current]
+        elif "-" in current:
+            current = current.rsplit("-", 1)[0]
+        else:
+            current = None
+    if JOKE_DEFAULT_LANGUAGE not in chain:
+        chain.append(JOKE_DEFAULT_LANGUAGE)
+    return tuple(chain)
+
+
+def _pick_from_pool(chain: Sequence[str], client: Optional[str]) -> ServedJoke:
+    for candidate in chain:
+        random_joke = joke_selector.pick(client, candidate)
+        if random_joke is not None:
+            return random_joke
+    raise ValueError("No jokes found in the specified language.")
+
+
+async def _pick_from_database(chain: Sequence[str]) -> JokeResponse:
+    # Used only until the pool is loaded: a single query over native jokes and
+    # localizations of approved jokes, preferring earlier languages in the chain.
+    placeholders = ", ".join(f"${i}" for i in range(1, len(chain) + 1))
+    row = await prisma.get_client().query_first(
+        f"""
+        SELECT "id", "setup", "punchline", "language" FROM (
+            SELECT j."id", j."setup", j."punchline", j."language"
+            FROM "Joke" j
+            WHERE j."approved" AND j."language" IN ({placeholders})
+            UNION ALL
+            SELECT l."jokeId", l."setup", l."punchline", l."language"
+            FROM "Localization" l JOIN "Joke" j ON j."id" = l."jokeId"
+            WHERE j."approved" AND l."language" IN ({placeholders})
+        ) AS candidates
+        ORDER BY array_position(ARRAY[{placeholders}]::text[], "language"), random()
+        LIMIT 1
+        """,
+        *chain,
+    )
+    if not row:
+        raise ValueError("No jokes found in the specified language.")
+    return JokeResponse(**row)
+
+
+async def get_joke_in_language(
+    language: str, client: Optional[str] = None
+) -> JokeResponse:
     """
     Fetches a random joke in the specified language.
 
+    Jokes written in the language and localizations into it are served alike.
+    If there are none, the language's fallback chain is followed, e.g.
+    de-AT -> de -> en. Once the joke pool is loaded no database query is made;
+    before that, a single query resolves the whole chain. A client is not
+    served the same joke again until it has seen the others.
+
     Args:
     language (str): The preferred language for the joke defined in the path parameter.
+    client (Optional[str]): Identifies the caller, e.g. by API key, for avoiding repeats.
 
     Returns:
     JokeResponse: Outputs a single joke localized in the user's requested language, alongside some basic identifying data about the joke. This model is designed to be flexible to accommodate jokes in any supported language.
     """
-    jokes_in_language = await prisma.models.Joke.prisma().find_many(
-        where={"language": language, "approved": True}
-    )
-    if not jokes_in_language:
-        raise ValueError("No jokes found in the specified language.")
-    random_joke = random.choice(jokes_in_language)
+    chain = language_chain(language)
+    if not joke_pool.ready:
+        return await _pick_from_database(chain)
+    random_joke = _pick_from_pool(chain, client)
     return JokeResponse(
         id=random_joke.id,
         setup=random_joke.setup,
         punchline=random_joke.punchline,
         language=random_joke.language,
     )
+
+
+async def get_joke_in_language_json(
+    language: str, client: Optional[str] = None
+) -> bytes:
+    """
+    Fetches a random joke in the specified language as an encoded `JokeResponse` body.
+
+    Served from the pool, the body was encoded when the joke entered it, so
+    this does no model construction or serialization.
+
+    Args:
+    language (str): The preferred language for the joke defined in the path parameter.
+    client (Optional[str]): Identifies the caller, e.g. by API key, for avoiding repeats.
+
+    Returns:
+    bytes: The JSON body of a JokeResponse.
+    """
+    chain = language_chain(language)
+    if not joke_pool.ready:
+        return dumps((await _pick_from_database(chain)).dict())
+    return _pick_from_pool(chain, client).joke_json
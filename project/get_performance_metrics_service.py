@@ -1,10 +1,11 @@
-from datetime import datetime, timedelta
-from typing import List
+import re
+from datetime import datetime, timedelta, timezone
 
-import prisma
-import prisma.models
+from project.analytics_rollup import ROLLUP_DAY_RETENTION_DAYS, analytics_rollup
 from pydantic import BaseModel
 
+WINDOW_UNITS = {"m": "minutes", "h": "hours", "d": "days"}
+
 
 class PerformanceMetricsResponse(BaseModel):
     """
@@ -12,45 +13,54 @@ class PerformanceMetricsResponse(BaseModel):
     """
 
     average_response_time: float
+    p50_response_time: float
+    p95_response_time: float
+    p99_response_time: float
     request_count: int
     error_rate: float
     most_accessed_endpoint: str
     timeframe: str
 
 
-async def get_performance_metrics() -> PerformanceMetricsResponse:
+def parse_window(window: str) -> timedelta:
+    """
+    Parses a window such as `90m`, `24h` or `30d`, capped at the rollup retention.
+    """
+    match = re.fullmatch(r"(\d+)([mhd])", window.strip())
+    if not match:
+        raise ValueError(f"Invalid window {window!r}; expected e.g. 1h, 24h or 30d.")
+    length = timedelta(**{WINDOW_UNITS[match.group(2)]: int(match.group(1))})
+    return min(length, timedelta(days=ROLLUP_DAY_RETENTION_DAYS))
+
+
+async def get_performance_metrics(window: str = "24h") -> PerformanceMetricsResponse:
     """
     Provides metrics on API performance.
 
+    The figures are aggregated in the database from the time-bucketed
+    `AnalyticsRollup` rows of every process, so the work is bounded by the
+    number of buckets in the window rather than by request volume. Response
+    times are in milliseconds; percentiles are accurate to the histogram's
+    bucket width.
+
+    Args:
+        window (str): How far back to look, e.g. `1h`, `24h` or `30d`.
+
     Returns:
         PerformanceMetricsResponse: Provides aggregated performance metrics of the API, including average response times and error rates.
     """
-    now = datetime.now()
-    start_time = now - timedelta(days=1)
+    now = datetime.now(timezone.utc)
+    start_time = now - parse_window(window)
     timeframe_str = f"{start_time.strftime('%Y-%m-%d %H:%M:%S')} to {now.strftime('%Y-%m-%d %H:%M:%S')}"
-    analytics: List[
-        prisma.models.Analytics
-    ] = await prisma.models.Analytics.prisma().find_many(
-        where={"createdAt": {"gte": start_time}}
-    )
-    total_requests = sum((analytic.requestCount for analytic in analytics))
-    endpoint_usage_counts = {}
-    for analytic in analytics:
-        endpoint_usage_counts[analytic.endpoint] = (
-            endpoint_usage_counts.get(analytic.endpoint, 0) + analytic.requestCount
-        )
-    if endpoint_usage_counts:
-        most_accessed_endpoint = max(
-            endpoint_usage_counts.keys(), key=lambda key: endpoint_usage_counts[key]
-        )
-    else:
-        most_accessed_endpoint = "N/A"
-    average_response_time = 120.0
-    error_rate = 0.02
+    totals = await analytics_rollup.window(start_time, now)
+    count = totals.request_count
     return PerformanceMetricsResponse(
-        average_response_time=average_response_time,
-        request_count=total_requests,
-        error_rate=error_rate,
-        most_accessed_endpoint=most_accessed_endpoint,
+        average_response_time=totals.total_duration / count * 1000 if count else 0.0,
+        p50_response_time=totals.p50 * 1000,
+        p95_response_time=totals.p95 * 1000,
+        p99_response_time=totals.p99 * 1000,
+        request_count=count,
+        error_rate=totals.error_count / count if count else 0.0,
+        most_accessed_endpoint=totals.most_accessed_endpoint or "N/A",
         timeframe=timeframe_str,
     )
@@ -1,8 +1,8 @@
-import random
+from typing import Optional
 
-import prisma
-import prisma.models
 from fastapi import HTTPException
+from project.joke_pool import ServedJoke, joke_pool
+from project.joke_selection import joke_selector
 from pydantic import BaseModel
 
 
@@ -16,15 +16,29 @@ class RandomJokeResponse(BaseModel):
     language: str
 
 
-async def get_random_joke(language: str) -> RandomJokeResponse:
+async def _pick(language: str, client: Optional[str]) -> ServedJoke:
+    await joke_pool.ensure_ready()
+    joke = joke_selector.pick(client, language)
+    if joke is None:
+        raise HTTPException(
+            status_code=404, detail="No jokes found for the specified language."
+        )
+    return joke
+
+
+async def get_random_joke(
+    language: str, client: Optional[str] = None
+) -> RandomJokeResponse:
     """
     Fetches a random knock-knock joke.
 
-    This function queries the database for a list of jokes that match the specified
-    language. If no jokes are found for the given language, the function raises an HTTP exception.
+    This function picks a joke from the in-process pool of approved jokes for the
+    specified language. If no jokes are found for the given language, the function raises an HTTP exception.
+    A client is not served the same joke again until it has seen the others (see `project.joke_selection`).
 
     Args:
     language (str): The preferred language for the joke. Defaults to 'en' if not specified.
+    client (Optional[str]): Identifies the caller, e.g. by API key, for avoiding repeats.
 
     Returns:
     RandomJokeResponse: Response model containing the random knock-knock joke fetched from the database.
@@ -33,14 +47,25 @@ async def get_random_joke(language: str) -> RandomJokeResponse:
     get_random_joke('en')
     > RandomJokeResponse(setup="Knock knock.", punchline="Who's there?", language='en')
     """
-    jokes = await prisma.models.Joke.prisma().find_many(
-        where={"language": language, "approved": True}
-    )
-    if not jokes:
-        raise HTTPException(
-            status_code=404, detail="No jokes found for the specified language."
-        )
-    joke = random.choice(jokes)
+    joke = await _pick(language, client)
     return RandomJokeResponse(
         setup=joke.setup, punchline=joke.punchline, language=joke.language
     )
+
+
+async def get_random_joke_json(language: str, client: Optional[str] = None) -> bytes:
+    """
+    Fetches a random knock-knock joke as an encoded `RandomJokeResponse` body.
+
+    The body was encoded when the joke entered the pool, so this does no
+    model construction or serialization.
+
+    Args:
+    language (str): The preferred language for the joke.
+    client (Optional[str]): Identifies the caller, e.g. by API key, for avoiding repeats.
+
+    Returns:
+    bytes: The JSON body of a RandomJokeResponse.
+    """
+    joke = await _pick(language, client)
+    return joke.random_joke_json
@@ -0,0 +1,52 @@
+from typing import List, Optional
+
+from project.joke_pool import joke_pool
+from project.warmup import FAST_START, warmup
+from pydantic import BaseModel
+
+
+class WarmupStageStatus(BaseModel):
+    """
+    How far one startup stage has got.
+    """
+
+    name: str
+    required: bool
+    state: str
+    seconds: Optional[float] = None
+    error: Optional[str] = None
+
+
+class ReadinessResponse(BaseModel):
+    """
+    Whether the process is ready to serve, and the progress of its startup.
+    """
+
+    ready: bool
+    fast_start: bool
+    jokes: int
+    stages: List[WarmupStageStatus]
+
+
+async def get_readiness() -> ReadinessResponse:
+    """
+    Reports whether every required startup stage is done, with the state of each stage.
+
+    Returns:
+        ReadinessResponse: Readiness, the number of approved jokes loaded so far, and the stages in the order they run.
+    """
+    return ReadinessResponse(
+        ready=warmup.ready,
+        fast_start=FAST_START,
+        jokes=len(joke_pool),
+        stages=[
+            WarmupStageStatus(
+                name=stage.name,
+                required=stage.required,
+                state=stage.state,
+                seconds=stage.seconds,
+                error=stage.error,
+            )
+            for stage in warmup.stages
+        ],
+    )
@@ -0,0 +1,133 @@
+import os
+import time
+from typing import Callable, Dict
+
+from fastapi import Request
+from fastapi.responses import Response
+from project.analytics_rollup import analytics_rollup
+from project.catalog_events import ORIGIN
+from project.joke_pool import joke_pool
+from project.usage_leaderboard import usage_leaderboard
+
+JOKE_CACHE_MAX_AGE = int(os.getenv("JOKE_CACHE_MAX_AGE", "5"))
+
+JOKE_CACHE_STALE_WHILE_REVALIDATE = int(
+    os.getenv("JOKE_CACHE_STALE_WHILE_REVALIDATE", "30")
+)
+
+ANALYTICS_CACHE_MAX_AGE = int(os.getenv("ANALYTICS_CACHE_MAX_AGE", "10"))
+
+ANALYTICS_CACHE_STALE_WHILE_REVALIDATE = int(
+    os.getenv("ANALYTICS_CACHE_STALE_WHILE_REVALIDATE", "60")
+)
+
+
+class CachePolicy:
+    """
+    ETag and Cache-Control handling for one family of routes.
+
+    The ETag is a weak tag built from a data version counter, so answering a
+    conditional request is a string comparison: nothing is computed and the
+    database is not touched. Counters are per process, so tags also carry the
+    process's id and a tag minted by another worker simply never matches.
+
+    Counters that move on every request (analytics count the requests made to
+    read them) are sampled at most once per `settle_seconds`; between samples
+    the tag stays put, and the data it stands for is at most that much older
+    than what a full recomputation would return.
+
+    Routes whose response is picked per client (the joke routes, whose
+    selection follows each client's cursor) are `per_client`: they are sent
+    `Cache-Control: private` with `Vary: X-API-Key` and no ETag, so a shared
+    cache never hands one client's pick to another, and a conditional
+    request is never answered with 304.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        source: Callable[[], int],
+        max_age: int,
+        stale_while_revalidate: int,
+        settle_seconds: float = 0.0,
+        per_client: bool = False,
+    ) -> None:
+        self.name = name
+        self.source = source
+        self.settle_seconds = settle_seconds
+        self.per_client = per_client
+        self.cache_control = (
+            f"{'private' if per_client else 'public'}, max-age={max_age}, "
+            f"stale-while-revalidate={stale_while_revalidate}"
+        )
+        self._sampled = source()
+        self.hits = 0
+        self.misses = 0
+        self._version = 0
+        self._sample_after = 0.0
+
+    def version(self) -> int:
+        now = time.monotonic()
+        if now >= self._sample_after:
+            sampled = self.source()
+            if sampled != self._sampled:
+                self._sampled = sampled
+                self._version += 1
+            self._sample_after = now + self.settle_seconds
+        return self._version
+
+    def etag(self) -> str:
+        return f'W/"{self.name}-{ORIGIN[:12]}-{self.version()}"'
+
+    def headers(self) -> Dict[str, str]:
+        if self.per_client:
+            return {"Cache-Control": self.cache_control, "Vary": "X-API-Key"}
+        return {"ETag": self.etag(), "Cache-Control": self.cache_control}
+
+    def is_fresh(self, request: Request) -> bool:
+        """
+        Whether the request's If-None-Match already names the current version.
+
+        Always False for `per_client` policies, which send no tag.
+        """
+        if self.per_client:
+            return False
+        header = request.headers.get("if-none-match")
+        if header:
+            # If-None-Match uses the weak comparison, so W/ prefixes are ignored.
+            etag = self.etag().removeprefix("W/")
+            for candidate in header.split(","):
+                candidate = candidate.strip()
+                if candidate == "*" or candidate.removeprefix("W/") == etag:
+                    self.hits += 1
+                    return True
+        self.misses += 1
+        return False
+
+    def not_modified(self) -> Response:
+        return Response(status_code=304, headers=self.headers())
+
+
+joke_cache = CachePolicy(
+    "catalog",
+    lambda: joke_pool.version,
+    JOKE_CACHE_MAX_AGE,
+    JOKE_CACHE_STALE_WHILE_REVALIDATE,
+    per_client=True,
+)
+
+usage_cache = CachePolicy(
+    "usage",
+    lambda: usage_leaderboard.version,
+    ANALYTICS_CACHE_MAX_AGE,
+    ANALYTICS_CACHE_STALE_WHILE_REVALIDATE,
+    settle_seconds=ANALYTICS_CACHE_MAX_AGE,
+)
+
+performance_cache = CachePolicy(
+    "performance",
+    lambda: analytics_rollup.version,
+    ANALYTICS_CACHE_MAX_AGE,
+    ANALYTICS_CACHE_STALE_WHILE_REVALIDATE,
+    settle_seconds=ANALYTICS_CACHE_MAX_AGE,
+)
@@ -0,0 +1,110 @@
+import logging
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+from fastapi import HTTPException, Request, Response
+from fastapi.exceptions import RequestValidationError
+from fastapi.routing import APIRoute
+from project.query_tracing import QUERY_TRACING, QueryTrace, current_trace
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True, slots=True)
+class RequestRecord:
+    """
+    What the instrumentation layer knows about one handled request.
+    """
+
+    endpoint: str
+    method: str
+    status_code: int
+    duration: float
+    api_key: Optional[str]
+    finished_at: float
+
+
+RequestObserver = Callable[[RequestRecord], None]
+
+# Route template of the request being handled, for attributing work done on its
+# behalf (database queries, for instance); "background" outside of requests.
+current_endpoint: ContextVar[str] = ContextVar("current_endpoint", default="background")
+
+_observers: List[RequestObserver] = []
+
+
+def add_observer(observer: RequestObserver) -> None:
+    """
+    Registers a callback that receives a RequestRecord after every routed request.
+
+    Observers run inline on the event loop after the response has been produced,
+    so they must be cheap and must not block; anything slower belongs on a queue.
+    """
+    if observer not in _observers:
+        _observers.append(observer)
+
+
+def remove_observer(observer: RequestObserver) -> None:
+    if observer in _observers:
+        _observers.remove(observer)
+
+
+class InstrumentedRoute(APIRoute):
+    """
+    APIRoute that times its handler and reports each request to the registered observers.
+
+    Requests are labelled with the route's path template (e.g. `/joke/{language}`)
+    rather than the concrete URL, which keeps the set of endpoints bounded.
+    The database queries each request makes are traced (see
+    `project.query_tracing`) and summed up in its `Server-Timing` header.
+    """
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        endpoint = self.path
+
+        async def instrumented_handler(request: Request) -> Response:
+            started = time.perf_counter()
+            status_code = 500
+            token = current_endpoint.set(endpoint)
+            trace = QueryTrace(endpoint) if QUERY_TRACING else None
+            trace_token = current_trace.set(trace)
+            try:
+                response = await handler(request)
+                status_code = response.status_code
+                if trace is not None:
+                    # Queries made while a streamed body is sent come after
+                    # the headers, and are left out.
+                    response.headers["Server-Timing"] = trace.server_timing(
+                        time.perf_counter() - started
+                    )
+                return response
+            except HTTPException as e:
+                # Raised by dependencies (auth, for instance) and answered by
+                # FastAPI's exception handler with this status.
+                status_code = e.status_code
+                raise
+            except RequestValidationError:
+                # Not an HTTPException in FastAPI 0.85; answered with a 422.
+                status_code = 422
+                raise
+            finally:
+                current_endpoint.reset(token)
+                current_trace.reset(trace_token)
+                record = RequestRecord(
+                    endpoint=endpoint,
+                    method=request.method,
+                    status_code=status_code,
+                    duration=time.perf_counter() - started,
+                    api_key=request.headers.get("x-api-key"),
+                    finished_at=time.time(),
+                )
+                for observer in _observers:
+                    try:
+                        observer(record)
+                    except Exception:
+                        logger.exception("Error in request observer")
+
+        return instrumented_handler
@@ -0,0 +1,534 @@
+import asyncio
+import logging
+import os
+import random
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Protocol, Set, Tuple, Union
+
+import prisma
+import prisma.models
+from project.catalog_events import CatalogEvent
+from project.catalog_snapshot import SharedCatalog, SharedJoke
+from project.joke_weights import (
+    JOKE_FRESHNESS_HALF_LIFE_DAYS,
+    ClassSampler,
+    freshness_class,
+)
+from project.json_encoding import dumps
+
+logger = logging.getLogger(__name__)
+
+JOKE_POOL_REFRESH_SECONDS = float(os.getenv("JOKE_POOL_REFRESH_SECONDS", "30"))
+
+JOKE_POOL_PAGE_SIZE = int(os.getenv("JOKE_POOL_PAGE_SIZE", "5000"))
+
+# Rows committed by a slow transaction can carry an `updatedAt` older than the
+# newest row we have already seen, so each refresh re-reads a short overlap.
+REFRESH_OVERLAP = timedelta(seconds=5)
+
+
+@dataclass(frozen=True, slots=True)
+class PooledJoke:
+    """
+    An approved joke, or a localization of one, as held in the in-process pool.
+
+    `id` is always the joke's id; localizations also carry their own
+    `localization_id`, which keys them in the pool. `created_at` sets the
+    joke's freshness weight when jokes are weighted. The bodies of the
+    `RandomJokeResponse` and `JokeResponse` for the joke are encoded once,
+    when it enters the pool, so serving it needs no serialization.
+    """
+
+    id: str
+    setup: str
+    punchline: str
+    language: str
+    localization_id: Optional[str] = None
+    created_at: Optional[datetime] = field(default=None, compare=False)
+    random_joke_json: bytes = field(init=False, repr=False, compare=False)
+    joke_json: bytes = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        object.__setattr__(
+            self,
+            "random_joke_json",
+            dumps(
+                {
+                    "setup": self.setup,
+                    "punchline": self.punchline,
+                    "language": self.language,
+                }
+            ),
+        )
+        object.__setattr__(
+            self,
+            "joke_json",
+            dumps(
+                {
+                    "id": self.id,
+                    "setup": self.setup,
+                    "punchline": self.punchline,
+                    "language": self.language,
+                }
+            ),
+        )
+
+    @property
+    def key(self) -> str:
+        return self.localization_id or self.id
+
+
+ServedJoke = Union[PooledJoke, SharedJoke]
+
+
+class PoolWatcher(Protocol):
+    """
+    Follows what a `JokePool` serves, e.g. to keep an index of it.
+    """
+
+    def reset(self, jokes: Iterable[PooledJoke]) -> None:
+        """Called with everything the pool serves when its contents are replaced."""
+
+    def update(self, key: str, joke: Optional[PooledJoke]) -> None:
+        """Called when the pool starts serving `joke` under `key`, or stops when None."""
+
+
+class JokePool:
+    """
+    Per-language, array-backed pool of approved jokes and their localizations.
+
+    Each language maps to a plain list holding both the jokes written in it
+    and the localizations into it of approved jokes, so that a random pick is
+    a single index into it. Removals swap the last element into the freed
+    slot, keeping both insertion and removal O(1). The pool is loaded once
+    with `warm()` and then kept current by `refresh()`, which only reads
+    jokes and localizations whose `updatedAt` moved since the previous sync.
+
+    With JOKE_FRESHNESS_HALF_LIFE_DAYS set, each language's jokes are also
+    grouped by freshness class (see `project.joke_weights`), kept up to date
+    by the same O(1) swaps, so that `sample_weighted` can pick a class by
+    weight and then a joke uniformly within it.
+
+    A pool can instead serve from a shared catalog snapshot built by another
+    process (see `project.shared_catalog`); while one is attached, reads go
+    to it and the pool's own contents are left alone.
+
+    Watchers added with `watch()` are told of every change to the pool's own
+    contents.
+    """
+
+    def __init__(self, weighted: bool = JOKE_FRESHNESS_HALF_LIFE_DAYS > 0) -> None:
+        self.weighted = weighted
+        self._jokes: Dict[str, List[PooledJoke]] = {}
+        self._positions: Dict[str, int] = {}
+        self._languages: Dict[str, str] = {}
+        self._approved: Set[str] = set()
+        # Localizations of every joke seen so far, approved or not, so that an
+        # approval can publish them without another query.
+        self._localizations: Dict[str, Dict[str, PooledJoke]] = {}
+        # Keys of each language's jokes by freshness class, and where each key
+        # sits in its class, when weighted.
+        self._classes: Dict[str, Dict[int, List[str]]] = {}
+        self._class_positions: Dict[str, Tuple[int, int]] = {}
+        self._samplers: Dict[str, ClassSampler] = {}
+        self._cursor: Optional[datetime] = None
+        self._localization_cursor: Optional[datetime] = None
+        # Bumped on every change to what the pool serves.
+        self.version = 0
+        self._lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._shared: Optional[SharedCatalog] = None
+        self._watchers: List[PoolWatcher] = []
+
+    @property
+    def ready(self) -> bool:
+        return self._shared is not None or self._cursor is not None
+
+    def __len__(self) -> int:
+        if self._shared is not None:
+            return len(self._shared)
+        return len(self._approved)
+
+    def size(self, language: str) -> int:
+        if self._shared is not None:
+            return self._shared.size(language)
+        return len(self._jokes.get(language, ()))
+
+    def pick(self, language: str) -> Optional[ServedJoke]:
+        """
+        Picks a uniformly random approved joke or localization in the given language.
+
+        Args:
+            language (str): The language to pick from.
+
+        Returns:
+            Optional[ServedJoke]: A random joke, or None if nothing approved exists in the language.
+        """
+        if self._shared is not None:
+            return self._shared.pick(language)
+        jokes = self._jokes.get(language)
+        if not jokes:
+            return None
+        return jokes[random.randrange(len(jokes))]
+
+    def at(self, language: str, index: int) -> ServedJoke:
+        """
+        The joke at `index` among the `size(language)` jokes in a language.
+        """
+        if self._shared is not None:
+            return self._shared.entry_at(language, index)
+        return self._jokes[language][index]
+
+    def sample_weighted(self, language: str) -> Optional[int]:
+        """
+        Picks the index of a joke in a language with probability proportional to its freshness weight.
+
+        Picks uniformly when the pool is not weighted.
+
+        Returns:
+            Optional[int]: An index for `at`, or None if nothing approved exists in the language.
+        """
+        if self._shared is not None:
+            return self._shared.sample_weighted(language)
+        if not self.weighted:
+            size = self.size(language)
+            return random.randrange(size) if size else None
+        classes = self._classes.get(language)
+        if not classes:
+            return None
+        sampler = self._samplers.get(language)
+        if sampler is None:
+            sampler = self._samplers[language] = ClassSampler(
+                {c: len(members) for c, members in classes.items()}
+            )
+        members = classes[sampler.choose()]
+        return self._positions[members[random.randrange(len(members))]]
+
+    def _classify(self, entry: PooledJoke) -> None:
+        c = freshness_class(entry.created_at)
+        members = self._classes.setdefault(entry.language, {}).setdefault(c, [])
+        self._class_positions[entry.key] = (c, len(members))
+        members.append(entry.key)
+        self._samplers.pop(entry.language, None)
+
+    def _unclassify(self, key: str, language: str) -> None:
+        c, position = self._class_positions.pop(key)
+        classes = self._classes[language]
+        members = classes[c]
+        last = members.pop()
+        if last != key:
+            members[position] = last
+            self._class_positions[last] = (c, position)
+        if not members:
+            del classes[c]
+        self._samplers.pop(language, None)
+
+    @property
+    def shared(self) -> Optional[SharedCatalog]:
+        return self._shared
+
+    def attach(self, catalog: Optional[SharedCatalog]) -> None:
+        """
+        Serves from a shared catalog snapshot, or from the pool's own contents again when given None.
+        """
+        self._shared = catalog
+        self.version += 1
+
+    def watch(self, watcher: PoolWatcher) -> None:
+        """
+        Tells `watcher` of the pool's contents now and of every later change.
+        """
+        self._watchers.append(watcher)
+        watcher.reset(joke for jokes in self._jokes.values() for joke in jokes)
+
+    def entries(self) -> Dict[str, List[PooledJoke]]:
+        """
+        The pool's own jokes and localizations by language, as a copy safe to read off the event loop.
+        """
+        return {language: list(jokes) for language, jokes in self._jokes.items()}
+
+    def _insert(self, entry: PooledJoke) -> None:
+        key = entry.key
+        if self._languages.get(key, entry.language) != entry.language:
+            self._remove(key)
+        position = self._positions.get(key)
+        if position is not None:
+            self._jokes[entry.language][position] = entry
+            if self.weighted:
+                self._unclassify(key, entry.language)
+                self._classify(entry)
+            self.version += 1
+            for watcher in self._watchers:
+                watcher.update(key, entry)
+            return
+        jokes = self._jokes.setdefault(entry.language, [])
+        self.version += 1
+        self._positions[key] = len(jokes)
+        self._languages[key] = entry.language
+        jokes.append(entry)
+        if self.weighted:
+            self._classify(entry)
+        for watcher in self._watchers:
+            watcher.update(key, entry)
+
+    def _remove(self, key: str) -> None:
+        position = self._positions.pop(key, None)
+        if position is None:
+            return
+        self.version += 1
+        language = self._languages.pop(key)
+        if self.weighted:
+            self._unclassify(key, language)
+        jokes = self._jokes[language]
+        last = jokes.pop()
+        if last.key != key:
+            jokes[position] = last
+            self._positions[last.key] = position
+        for watcher in self._watchers:
+            watcher.update(key, None)
+
+    def upsert(self, joke: PooledJoke) -> None:
+        """
+        Adds an approved joke and its known localizations to the pool, replacing any previous copy.
+        """
+        self._approved.add(joke.id)
+        self._insert(joke)
+        for localization in self._localizations.get(joke.id, {}).values():
+            self._insert(localization)
+
+    def discard(self, joke_id: str) -> None:
+        """
+        Removes a joke and its localizations from the pool if they are present.
+        """
+        self._approved.discard(joke_id)
+        self._remove(joke_id)
+        for localization_id in self._localizations.get(joke_id, ()):
+            self._remove(localization_id)
+
+    def upsert_localization(self, localization: PooledJoke) -> None:
+        """
+        Records a localization, serving it while its joke is approved.
+        """
+        self._localizations.setdefault(localization.id, {})[
+            localization.key
+        ] = localization
+        if localization.id in self._approved:
+            self._insert(localization)
+
+    def apply_event(self, event: CatalogEvent) -> None:
+        """
+        Patches the pool with a moderation decision published on the catalog event bus.
+
+        Ignored while a shared catalog is attached: the process that builds
+        the catalog applies the decision (received through the postgres
+        backend, or forwarded by `CatalogSharing.forward`) and publishes a
+        new snapshot.
+        """
+        if self._shared is not None:
+            return
+        if event.approved:
+            self.upsert(
+                PooledJoke(
+                    id=event.joke_id,
+                    setup=event.setup,
+                    punchline=event.punchline,
+                    language=event.language,
+                )
+            )
+        else:
+            self.discard(event.joke_id)
+
+    def _apply(self, joke: prisma.models.Joke) -> None:
+        if joke.localizations is not None:
+            # The joke was read with all of its localizations, so any we hold
+            # that are not among them no longer exist.
+            for localization_id in self._localizations.pop(joke.id, {}):
+                self._remove(localization_id)
+            for localization in joke.localizations:
+                self._apply_localization(localization)
+        if joke.approved:
+            self.upsert(
+                PooledJoke(
+                    id=joke.id,
+                    setup=joke.setup,
+                    punchline=joke.punchline,
+                    language=joke.language,
+                    created_at=joke.createdAt,
+                )
+            )
+        else:
+            self.discard(joke.id)
+
+    def _apply_localization(self, localization: prisma.models.Localization) -> None:
+        self.upsert_localization(
+            PooledJoke(
+                id=localization.jokeId,
+                setup=localization.setup,
+                punchline=localization.punchline,
+                language=localization.language,
+                localization_id=localization.id,
+                created_at=localization.createdAt,
+            )
+        )
+
+    def _advance(self, joke: prisma.models.Joke) -> None:
+        if self._cursor is None or joke.updatedAt > self._cursor:
+            self._cursor = joke.updatedAt
+        for localization in joke.localizations or ():
+            self._advance_localization(localization)
+
+    def _advance_localization(self, localization: prisma.models.Localization) -> None:
+        if (
+            self._localization_cursor is None
+            or localization.updatedAt > self._localization_cursor
+        ):
+            self._localization_cursor = localization.updatedAt
+
+    def _swap(self, loaded: "JokePool", cursor: datetime) -> None:
+        self._jokes = loaded._jokes
+        self._positions = loaded._positions
+        self._languages = loaded._languages
+        self._approved = loaded._approved
+        self._localizations = loaded._localizations
+        self._classes = loaded._classes
+        self._class_positions = loaded._class_positions
+        self._samplers = loaded._samplers
+        self._cursor = cursor
+        self._localization_cursor = loaded._localization_cursor or cursor
+        self.version += 1
+        for watcher in self._watchers:
+            watcher.reset(joke for jokes in self._jokes.values() for joke in jokes)
+
+    def replace(self, jokes: Iterable[PooledJoke]) -> None:
+        """
+        Replaces the pool's contents with the given jokes and marks it ready.
+
+        Refreshes continue from the current time, so this suits seeding the pool
+        for benchmarks or tests rather than loading from the database.
+        """
+        loaded = JokePool(self.weighted)
+        for joke in jokes:
+            loaded.upsert(joke)
+        self._swap(loaded, datetime.now(timezone.utc))
+
+    async def warm(self) -> None:
+        """
+        Loads every approved joke and its localizations into the pool, paging through the table by id.
+        """
+        async with self._lock:
+            await self._load()
+
+    async def _load(self) -> None:
+        # Build into a separate pool and swap it in, so that a re-warm never
+        # serves from a half-loaded catalog.
+        started = datetime.now(timezone.utc)
+        loaded = JokePool(self.weighted)
+        last_id: Optional[str] = None
+        while True:
+            page = await prisma.models.Joke.prisma().find_many(
+                where={"approved": True},
+                include={"localizations": True},
+                take=JOKE_POOL_PAGE_SIZE,
+                skip=1 if last_id else None,
+                cursor={"id": last_id} if last_id else None,
+                order={"id": "asc"},
+            )
+            for joke in page:
+                loaded._apply(joke)
+                loaded._advance(joke)
+            if len(page) < JOKE_POOL_PAGE_SIZE:
+                break
+            last_id = page[-1].id
+        if loaded._localization_cursor is None:
+            loaded._localization_cursor = started
+        self._swap(loaded, loaded._cursor or started)
+        logger.info("Joke pool warmed with %d approved jokes", len(self))
+
+    async def refresh(self) -> int:
+        """
+        Applies every joke and localization changed since the last sync to the pool.
+
+        Returns:
+            int: The number of changed rows that were read.
+        """
+        async with self._lock:
+            if not self.ready:
+                await self._load()
+                return len(self)
+            return await self._refresh_jokes() + await self._refresh_localizations()
+
+    async def _refresh_jokes(self) -> int:
+        since = self._cursor - REFRESH_OVERLAP
+        changed = 0
+        last_id: Optional[str] = None
+        while True:
+            page = await prisma.models.Joke.prisma().find_many(
+                where={"updatedAt": {"gte": since}},
+                include={"localizations": True},
+                take=JOKE_POOL_PAGE_SIZE,
+                skip=1 if last_id else None,
+                cursor={"id": last_id} if last_id else None,
+                order=[{"updatedAt": "asc"}, {"id": "asc"}],
+            )
+            for joke in page:
+                self._apply(joke)
+                self._advance(joke)
+            changed += len(page)
+            if len(page) < JOKE_POOL_PAGE_SIZE:
+                return changed
+            last_id = page[-1].id
+
+    async def _refresh_localizations(self) -> int:
+        since = self._localization_cursor - REFRESH_OVERLAP
+        changed = 0
+        last_id: Optional[str] = None
+        while True:
+            page = await prisma.models.Localization.prisma().find_many(
+                where={"updatedAt": {"gte": since}},
+                take=JOKE_POOL_PAGE_SIZE,
+                skip=1 if last_id else None,
+                cursor={"id": last_id} if last_id else None,
+                order=[{"updatedAt": "asc"}, {"id": "asc"}],
+            )
+            for localization in page:
+                self._apply_localization(localization)
+                self._advance_localization(localization)
+            changed += len(page)
+            if len(page) < JOKE_POOL_PAGE_SIZE:
+                return changed
+            last_id = page[-1].id
+
+    async def ensure_ready(self) -> None:
+        if self.ready:
+            return
+        async with self._lock:
+            if not self.ready:
+                await self._load()
+
+    async def _refresh_forever(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception("Error refreshing joke pool")
+
+    def start(self, interval: float = JOKE_POOL_REFRESH_SECONDS) -> None:
+        """
+        Starts the background task that keeps the pool in sync with the database.
+        """
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_forever(interval))
+
+    async def stop(self) -> None:
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+
+
+joke_pool = JokePool()
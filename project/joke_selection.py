@@ -0,0 +1,162 @@
+import os
+import random
+from collections import OrderedDict, deque
+from typing import Deque, Hashable, Optional, Set, Tuple
+
+from project.joke_pool import JokePool, ServedJoke, joke_pool
+
+# Clients (API keys, or addresses without one) whose position in each
+# language is remembered; the least recently seen are forgotten beyond this.
+# 0 turns per-client selection off.
+JOKE_NO_REPEAT_CLIENTS = int(os.getenv("JOKE_NO_REPEAT_CLIENTS", "10000"))
+
+# With weighted selection, a client is not served any of its last
+# JOKE_NO_REPEAT_WINDOW jokes again while the language has others to offer.
+JOKE_NO_REPEAT_WINDOW = int(os.getenv("JOKE_NO_REPEAT_WINDOW", "32"))
+
+# Weighted picks that land in the window are redrawn at most this many times.
+MAX_REDRAWS = 8
+
+FEISTEL_ROUNDS = 4
+
+
+class Permutation:
+    """
+    A pseudo-random permutation of range(size), computed one element at a time.
+
+    A balanced Feistel network keyed by random round keys permutes the
+    smallest even-bit-width domain that holds `size`; elements that land
+    outside range(size) are fed through again (cycle walking) until they
+    land inside. As the domain is less than four times `size`, that takes a
+    few rounds at most on average, so an element costs O(1) whatever the
+    size and the permutation itself takes no memory.
+    """
+
+    __slots__ = ("size", "_half", "_mask", "_keys")
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        half = max(1, ((size - 1).bit_length() + 1) // 2)
+        self._half = half
+        self._mask = (1 << half) - 1
+        self._keys = tuple(random.getrandbits(64) for _ in range(FEISTEL_ROUNDS))
+
+    def __getitem__(self, index: int) -> int:
+        half, mask = self._half, self._mask
+        value = index
+        while True:
+            left, right = value >> half, value & mask
+            for key in self._keys:
+                left, right = right, left ^ (hash((right, key)) & mask)
+            value = (left << half) | right
+            if value < self.size:
+                return value
+
+
+class ClientCursor:
+    """
+    What one client has been served in one language.
+
+    Uniform selection walks a fresh permutation of the language's jokes, so
+    the client sees every joke once before any repeats. Weighted selection
+    remembers the client's last JOKE_NO_REPEAT_WINDOW picks instead.
+    """
+
+    __slots__ = ("size", "permutation", "position", "recent", "recent_order")
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self.permutation: Optional[Permutation] = None
+        self.position = 0
+        self.recent: Set[int] = set()
+        self.recent_order: Deque[int] = deque()
+
+    def next_index(self) -> int:
+        if self.permutation is None or self.position == self.size:
+            self.permutation = Permutation(self.size)
+            self.position = 0
+        index = self.permutation[self.position]
+        self.position += 1
+        return index
+
+    def remember(self, index: int, window: int) -> None:
+        self.recent.add(index)
+        self.recent_order.append(index)
+        if len(self.recent_order) > window:
+            self.recent.discard(self.recent_order.popleft())
+
+
+class JokeSelector:
+    """
+    Picks jokes per client so that the same client is not served repeats.
+
+    Each client keeps one `ClientCursor` per language, in an LRU bounded by
+    `max_clients`, so memory stays bounded however many clients there are
+    and per client it is constant (uniform) or `window` indexes (weighted).
+    A cursor starts over when the number of jokes in its language changes,
+    as indexes may then refer to different jokes. Every pick is O(1) in the
+    size of the catalog.
+
+    Cursors live in this process. With several workers (WEB_CONCURRENCY), a
+    client whose requests land on different workers walks one cursor per
+    worker, and may be served repeats across them.
+    """
+
+    def __init__(
+        self,
+        pool: JokePool,
+        max_clients: int = JOKE_NO_REPEAT_CLIENTS,
+        window: int = JOKE_NO_REPEAT_WINDOW,
+    ) -> None:
+        self.pool = pool
+        self.max_clients = max_clients
+        self.window = window
+        self._cursors: "OrderedDict[Tuple[Hashable, str], ClientCursor]" = OrderedDict()
+
+    def _cursor(self, client: Hashable, language: str, size: int) -> ClientCursor:
+        key = (client, language)
+        cursor = self._cursors.get(key)
+        if cursor is None or cursor.size != size:
+            cursor = self._cursors[key] = ClientCursor(size)
+            if len(self._cursors) > self.max_clients:
+                self._cursors.popitem(last=False)
+        self._cursors.move_to_end(key)
+        return cursor
+
+    def _pick_weighted(self, cursor: ClientCursor, language: str) -> int:
+        index = self.pool.sample_weighted(language)
+        for _ in range(MAX_REDRAWS):
+            if index not in cursor.recent:
+                break
+            index = self.pool.sample_weighted(language)
+        cursor.remember(index, min(self.window, cursor.size - 1))
+        return index
+
+    def pick(self, client: Optional[Hashable], language: str) -> Optional[ServedJoke]:
+        """
+        Picks a joke in the given language that the client has not been served recently.
+
+        Args:
+            client (Optional[Hashable]): Identifies the client; None picks without remembering anything.
+            language (str): The language to pick from.
+
+        Returns:
+            Optional[ServedJoke]: A joke, or None if nothing approved exists in the language.
+        """
+        if client is None or not self.max_clients:
+            if self.pool.weighted:
+                index = self.pool.sample_weighted(language)
+                return None if index is None else self.pool.at(language, index)
+            return self.pool.pick(language)
+        size = self.pool.size(language)
+        if not size:
+            return None
+        cursor = self._cursor(client, language, size)
+        if self.pool.weighted:
+            index = self._pick_weighted(cursor, language)
+        else:
+            index = cursor.next_index()
+        return self.pool.at(language, index)
+
+
+joke_selector = JokeSelector(joke_pool)
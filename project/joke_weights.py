@@ -0,0 +1,58 @@
+import os
+import random
+from bisect import bisect_right
+from datetime import datetime, timezone
+from typing import List, Mapping, Optional
+
+# Weight jokes by freshness: a joke's chance of being picked halves with every
+# JOKE_FRESHNESS_HALF_LIFE_DAYS of age. 0 picks uniformly.
+JOKE_FRESHNESS_HALF_LIFE_DAYS = float(os.getenv("JOKE_FRESHNESS_HALF_LIFE_DAYS", "0"))
+
+EPOCH = datetime(2000, 1, 1, tzinfo=timezone.utc)
+
+
+def freshness_class(created_at: Optional[datetime]) -> int:
+    """
+    The number of whole half-lives between EPOCH and when a joke was created.
+
+    Jokes in class c weigh 2**c relative to one another. Classes are fixed at
+    creation, so the relative weights of two jokes never change as they age
+    and nothing has to be reweighted over time. Jokes without a creation time
+    (just approved, not yet re-read) count as created now.
+    """
+    created_at = created_at or datetime.now(timezone.utc)
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    age = (created_at - EPOCH).total_seconds()
+    return int(age // (JOKE_FRESHNESS_HALF_LIFE_DAYS * 86400))
+
+
+class ClassSampler:
+    """
+    Picks a freshness class with probability proportional to its total weight.
+
+    Built from the number of jokes in each class; one pick is a random
+    number and a binary search over the classes, of which there are a few
+    per year of catalog history, however many jokes each holds.
+    """
+
+    __slots__ = ("classes", "_cumulative", "_total")
+
+    def __init__(self, counts: Mapping[int, int]) -> None:
+        self.classes: List[int] = sorted(c for c, count in counts.items() if count)
+        newest = self.classes[-1] if self.classes else 0
+        self._cumulative: List[float] = []
+        total = 0.0
+        for c in self.classes:
+            # Relative to the newest class; classes old enough to underflow to
+            # 0 are never picked, as their weight is negligible anyway.
+            total += counts[c] * 2.0 ** (c - newest)
+            self._cumulative.append(total)
+        self._total = total
+
+    def __bool__(self) -> bool:
+        return bool(self.classes)
+
+    def choose(self) -> int:
+        index = bisect_right(self._cumulative, random.random() * self._total)
+        return self.classes[min(index, len(self.classes) - 1)]
@@ -0,0 +1,36 @@
+import json
+from typing import Any, Dict, Optional
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+
+def dumps(obj: Any) -> bytes:
+    """
+    Encodes JSON-compatible data to compact UTF-8 bytes.
+
+    Uses orjson when it is installed and falls back to the standard library
+    otherwise; both produce the same compact output for the plain dicts and
+    strings encoded here.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def json_response(
+    content: bytes, status_code: int = 200, headers: Optional[Dict[str, str]] = None
+) -> Response:
+    """
+    Wraps already-encoded JSON in a response, bypassing response model validation.
+    """
+    return Response(
+        content=content,
+        status_code=status_code,
+        headers=headers,
+        media_type="application/json",
+    )
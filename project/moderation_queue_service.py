@@ -0,0 +1,223 @@
+import base64
+import os
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+import prisma
+import prisma.enums
+import prisma.models
+from project.database import timestamp
+from pydantic import BaseModel
+
+MODERATION_PAGE_SIZE = int(os.getenv("MODERATION_PAGE_SIZE", "50"))
+
+MODERATION_CLAIM_SECONDS = int(os.getenv("MODERATION_CLAIM_SECONDS", "300"))
+
+# Upper bound on items returned by one listing or claim.
+MAX_PAGE_SIZE = 500
+
+
+class PendingJoke(BaseModel):
+    """
+    A joke waiting in the moderation queue, with whoever currently holds it.
+    """
+
+    id: str
+    jokeId: str
+    setup: str
+    punchline: str
+    language: str
+    createdAt: datetime
+    claimedBy: Optional[str] = None
+    claimExpiresAt: Optional[datetime] = None
+    duplicateOfId: Optional[str] = None
+
+
+class PendingJokesResponse(BaseModel):
+    """
+    One page of pending jokes, oldest first.
+    """
+
+    items: List[PendingJoke]
+    next_cursor: Optional[str]
+
+
+class ClaimPendingJokesResponse(BaseModel):
+    """
+    Pending jokes leased to the calling moderator until `claimExpiresAt`.
+    """
+
+    items: List[PendingJoke]
+    claimedBy: str
+    claimExpiresAt: datetime
+
+
+class ReleaseClaimsResponse(BaseModel):
+    """
+    Confirms how many leased jokes were handed back to the queue.
+    """
+
+    success: bool
+    message: str
+    released: int
+
+
+def encode_cursor(created_at: datetime, entry_id: str) -> str:
+    return (
+        base64.urlsafe_b64encode(f"{created_at.isoformat()}|{entry_id}".encode())
+        .decode()
+        .rstrip("=")
+    )
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, entry_id = raw.split("|", 1)
+        return datetime.fromisoformat(created_at), entry_id
+    except ValueError as e:
+        raise ValueError("Invalid cursor.") from e
+
+
+def _page_size(limit: Optional[int]) -> int:
+    return max(1, min(limit or MODERATION_PAGE_SIZE, MAX_PAGE_SIZE))
+
+
+async def list_pending_jokes(
+    cursor: Optional[str] = None, limit: Optional[int] = None
+) -> PendingJokesResponse:
+    """
+    Lists PENDING moderation queue entries, oldest first.
+
+    Pages are keyset-paginated on (createdAt, id), which the (status, createdAt)
+    index serves directly, so every page costs the same however deep it is.
+
+    Args:
+        cursor (Optional[str]): `next_cursor` of the previous page; omitted for the first page.
+        limit (Optional[int]): Entries per page, up to 500. Defaults to MODERATION_PAGE_SIZE.
+
+    Returns:
+        PendingJokesResponse: The page and the cursor of the next one, or None on the last page.
+    """
+    limit = _page_size(limit)
+    where = {"status": prisma.enums.ModerationStatus.PENDING}
+    if cursor:
+        created_at, entry_id = decode_cursor(cursor)
+        where["OR"] = [
+            {"createdAt": {"gt": created_at}},
+            {"createdAt": created_at, "id": {"gt": entry_id}},
+        ]
+    entries = await prisma.models.ModerationQueue.prisma().find_many(
+        where=where, order=[{"createdAt": "asc"}, {"id": "asc"}], take=limit + 1
+    )
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    jokes = {
+        joke.id: joke
+        for joke in await prisma.models.Joke.prisma().find_many(
+            where={"id": {"in": list({entry.jokeId for entry in entries})}}
+        )
+    }
+    items = [
+        PendingJoke(
+            id=entry.id,
+            jokeId=entry.jokeId,
+            setup=jokes[entry.jokeId].setup,
+            punchline=jokes[entry.jokeId].punchline,
+            language=jokes[entry.jokeId].language,
+            createdAt=entry.createdAt,
+            claimedBy=entry.claimedBy,
+            claimExpiresAt=entry.claimExpiresAt,
+            duplicateOfId=entry.duplicateOfId,
+        )
+        for entry in entries
+        if entry.jokeId in jokes
+    ]
+    return PendingJokesResponse(
+        items=items,
+        next_cursor=(
+            encode_cursor(entries[-1].createdAt, entries[-1].id) if has_more else None
+        ),
+    )
+
+
+async def claim_pending_jokes(
+    moderator: str, limit: Optional[int] = None
+) -> ClaimPendingJokesResponse:
+    """
+    Leases the oldest unclaimed pending jokes to a moderator.
+
+    Entries are picked and leased in one statement with `FOR UPDATE SKIP LOCKED`,
+    so moderators claiming at the same time each get different jokes instead of
+    waiting on one another. Entries whose lease has expired are up for grabs
+    again, and entries the moderator already holds are returned with a renewed
+    lease.
+
+    Args:
+        moderator (str): Identity of the moderator, from their access token.
+        limit (Optional[int]): How many jokes to claim, up to 500. Defaults to MODERATION_PAGE_SIZE.
+
+    Returns:
+        ClaimPendingJokesResponse: The claimed jokes, oldest first, and when the lease expires.
+    """
+    now = datetime.now(timezone.utc)
+    expires_at = now + timedelta(seconds=MODERATION_CLAIM_SECONDS)
+    rows = await prisma.get_client().query_raw(
+        """
+        WITH claimed AS (
+            UPDATE "ModerationQueue" q
+            SET "claimedBy" = $1, "claimExpiresAt" = $2::timestamp,
+                "updatedAt" = $3::timestamp
+            WHERE q."id" IN (
+                SELECT "id" FROM "ModerationQueue"
+                WHERE "status" = 'PENDING'
+                    AND (
+                        "claimedBy" IS NULL
+                        OR "claimedBy" = $1
+                        OR "claimExpiresAt" <= $3::timestamp
+                    )
+                ORDER BY "createdAt", "id"
+                LIMIT $4::int
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING q."id", q."jokeId", q."createdAt", q."claimedBy",
+                q."claimExpiresAt", q."duplicateOfId"
+        )
+        SELECT c.*, j."setup", j."punchline", j."language"
+        FROM claimed c JOIN "Joke" j ON j."id" = c."jokeId"
+        ORDER BY c."createdAt", c."id"
+        """,
+        moderator,
+        timestamp(expires_at),
+        timestamp(now),
+        str(_page_size(limit)),
+    )
+    return ClaimPendingJokesResponse(
+        items=[PendingJoke(**row) for row in rows],
+        claimedBy=moderator,
+        claimExpiresAt=expires_at,
+    )
+
+
+async def release_claims(moderator: str) -> ReleaseClaimsResponse:
+    """
+    Hands every pending joke leased to a moderator back to the queue.
+
+    Args:
+        moderator (str): Identity of the moderator, from their access token.
+
+    Returns:
+        ReleaseClaimsResponse: How many leases were released.
+    """
+    released = await prisma.models.ModerationQueue.prisma().update_many(
+        where={
+            "status": prisma.enums.ModerationStatus.PENDING,
+            "claimedBy": moderator,
+        },
+        data={"claimedBy": None, "claimExpiresAt": None},
+    )
+    return ReleaseClaimsResponse(
+        success=True,
+        message=f"Released {released} claimed jokes.",
+        released=released,
+    )
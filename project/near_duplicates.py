@@ -0,0 +1,315 @@
+import asyncio
+import logging
+import os
+import re
+from array import array
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Set, Tuple
+
+import prisma
+from project.catalog_events import CatalogEvent
+from project.database import timestamp
+
+logger = logging.getLogger(__name__)
+
+# What to do with a submission that nearly duplicates an approved or pending
+# joke: "flag" queues it marked with the joke it duplicates, "reject" turns it
+# away, and "off" skips the check and keeps no index.
+JOKE_DUPLICATE_CHECK = os.getenv("JOKE_DUPLICATE_CHECK", "flag")
+
+# Estimated Jaccard similarity of two jokes' shingles from which they count
+# as near-duplicates. With the template words left out (see TEMPLATE_WORDS),
+# rewordings of a knock-knock joke (a word or two changed in the punchline)
+# score from about 0.4 to 0.8, and different knock-knock jokes under 0.05,
+# or up to about 0.2 when they share a setup.
+JOKE_DUPLICATE_THRESHOLD = float(os.getenv("JOKE_DUPLICATE_THRESHOLD", "0.4"))
+
+JOKE_DUPLICATE_REFRESH_SECONDS = float(
+    os.getenv("JOKE_DUPLICATE_REFRESH_SECONDS", "30")
+)
+
+JOKE_DUPLICATE_PAGE_SIZE = int(os.getenv("JOKE_DUPLICATE_PAGE_SIZE", "5000"))
+
+# Jokes are compared as sets of overlapping character 5-grams of their
+# normalized text, so rewording a few words leaves most shingles in common.
+SHINGLE_SIZE = 5
+
+# A signature is SIGNATURE_SIZE minimums split into BANDS bands of ROWS. Two
+# jokes become candidates when any band matches exactly: for similarity s,
+# with probability 1 - (1 - s**ROWS)**BANDS, which is 88% at s = 0.4, 99% at
+# s = 0.5, 15% at s = 0.17 and under 1% at s = 0.05.
+SIGNATURE_SIZE = 96
+BANDS = 32
+ROWS = SIGNATURE_SIZE // BANDS
+
+# Jokes created this long before the previous read started are read again on
+# refresh, in case they were committed late.
+REFRESH_OVERLAP = timedelta(seconds=5)
+
+WORD = re.compile(r"\w+")
+
+# Words of the knock-knock template ("Knock, knock. Who's there?"), which
+# every joke shares and rewordings change ("Who is there?"). Left in, they
+# would make up a third of every joke's shingles, make unrelated jokes look
+# alike and crowd the index's buckets.
+TEMPLATE_WORDS = frozenset({"knock", "who", "s", "is", "there"})
+
+# Jokes the index holds: approved ones, and those awaiting review.
+_INDEXED = """(
+    j."approved"
+    OR EXISTS (
+        SELECT 1 FROM "ModerationQueue" q
+        WHERE q."jokeId" = j."id" AND q."status" = 'PENDING'
+    )
+)"""
+
+# Odd multiplier spreading the value a densified bin borrows from a neighbour
+# (see `signature`), so that borrowed values do not collide across bins.
+DENSIFY_STEP = 0x9E3779B1
+
+
+def normalize(setup: str, punchline: str) -> str:
+    words = WORD.findall(f"{setup} {punchline}".lower())
+    return " ".join(word for word in words if word not in TEMPLATE_WORDS)
+
+
+def shingles(setup: str, punchline: str) -> Set[str]:
+    """
+    The overlapping SHINGLE_SIZE-character pieces of a joke's normalized text.
+    """
+    text = normalize(setup, punchline)
+    return {
+        text[i : i + SHINGLE_SIZE] for i in range(max(1, len(text) - SHINGLE_SIZE + 1))
+    }
+
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    """
+    The exact similarity of two jokes' shingles, which `similarity` estimates.
+    """
+    return len(a & b) / len(a | b)
+
+
+def signature(setup: str, punchline: str) -> array:
+    """
+    The MinHash signature of a joke's setup and punchline.
+
+    Computed with one-permutation hashing: each shingle is hashed once, its
+    low bits choose one of SIGNATURE_SIZE bins, and each bin keeps the
+    smallest of the high bits that fall in it. Empty bins borrow from the next
+    non-empty one (rotation densification). Each of the entries then behaves
+    as an independent MinHash, for a single hash per shingle rather than one
+    per entry, which keeps a signature well under a millisecond.
+    """
+    empty = 1 << 32
+    bins = [empty] * SIGNATURE_SIZE
+    for shingle in shingles(setup, punchline):
+        h = hash(shingle)
+        b = h % SIGNATURE_SIZE
+        value = (h >> 32) & 0xFFFFFFFF
+        if value < bins[b]:
+            bins[b] = value
+    for i in range(SIGNATURE_SIZE):
+        if bins[i] != empty:
+            continue
+        for step in range(1, SIGNATURE_SIZE):
+            value = bins[(i + step) % SIGNATURE_SIZE]
+            if value != empty:
+                bins[i] = (value + step * DENSIFY_STEP) & 0xFFFFFFFF
+                break
+    # Every text has at least one shingle, so no bin is left empty.
+    return array("I", bins)
+
+
+def similarity(a: array, b: array) -> float:
+    """
+    The Jaccard similarity of two jokes' shingles, estimated from their signatures.
+    """
+    return sum(x == y for x, y in zip(a, b)) / SIGNATURE_SIZE
+
+
+class NearDuplicateIndex:
+    """
+    Locality-sensitive hashing index of the MinHash signatures of approved and pending jokes.
+
+    Each signature is filed under one bucket per band, keyed by the hash of
+    the band's values. A lookup computes the submission's signature, gathers
+    the jokes sharing a bucket with it and compares their signatures, so it
+    takes a few dictionary lookups and comparisons however many jokes are
+    indexed.
+
+    The index is backfilled from the `Joke` table in pages by `start()`,
+    follows moderation decisions through the catalog event bus, and picks up
+    jokes submitted through other processes or bulk imported by periodically
+    reading the jokes created since its previous read.
+    """
+
+    def __init__(self, threshold: float = JOKE_DUPLICATE_THRESHOLD) -> None:
+        self.threshold = threshold
+        self._signatures: Dict[str, array] = {}
+        self._buckets: List[Dict[int, List[str]]] = [{} for _ in range(BANDS)]
+        self._cursor: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    @staticmethod
+    def _band_keys(sig: array) -> List[int]:
+        return [hash(tuple(sig[i * ROWS : (i + 1) * ROWS])) for i in range(BANDS)]
+
+    def add(self, joke_id: str, sig: array) -> None:
+        if joke_id in self._signatures:
+            self.remove(joke_id)
+        self._signatures[joke_id] = sig
+        for band, key in zip(self._buckets, self._band_keys(sig)):
+            band.setdefault(key, []).append(joke_id)
+
+    def remove(self, joke_id: str) -> None:
+        sig = self._signatures.pop(joke_id, None)
+        if sig is None:
+            return
+        for band, key in zip(self._buckets, self._band_keys(sig)):
+            members = band.get(key)
+            if members is not None and joke_id in members:
+                members.remove(joke_id)
+                if not members:
+                    del band[key]
+
+    def find(
+        self, sig: array, exclude: Optional[str] = None
+    ) -> Optional[Tuple[str, float]]:
+        """
+        The indexed joke most similar to a signature, if it is similar enough to be a near-duplicate.
+
+        Args:
+            sig (array): The signature to look up.
+            exclude (Optional[str]): A joke not to match, e.g. the one the signature is of.
+
+        Returns:
+            Optional[Tuple[str, float]]: The joke's id and estimated similarity, or None.
+        """
+        candidates: Set[str] = set()
+        for band, key in zip(self._buckets, self._band_keys(sig)):
+            candidates.update(band.get(key, ()))
+        best: Optional[Tuple[str, float]] = None
+        candidates.discard(exclude)
+        for joke_id in candidates:
+            score = similarity(sig, self._signatures[joke_id])
+            if score >= self.threshold and (best is None or score > best[1]):
+                best = (joke_id, score)
+        return best
+
+    def apply_event(self, event: CatalogEvent) -> None:
+        """
+        Indexes a joke once approved and forgets it once rejected.
+        """
+        if JOKE_DUPLICATE_CHECK == "off":
+            return
+        if event.approved:
+            self.add(event.joke_id, signature(event.setup, event.punchline))
+        else:
+            self.remove(event.joke_id)
+
+    async def _read(self, after: str) -> List[dict]:
+        return await prisma.get_client().query_raw(
+            f"""
+            SELECT j."id", j."setup", j."punchline"
+            FROM "Joke" j
+            WHERE j."id" > $1 AND {_INDEXED}
+            ORDER BY j."id"
+            LIMIT $2::int
+            """,
+            after,
+            str(JOKE_DUPLICATE_PAGE_SIZE),
+        )
+
+    async def _read_created(self, after: Tuple[str, str]) -> List[dict]:
+        # Pages in the order of the ("createdAt", "id") index, so that a
+        # refresh reads only the rows created since the previous one.
+        return await prisma.get_client().query_raw(
+            f"""
+            SELECT j."id", j."setup", j."punchline", j."createdAt"::text AS "createdAt"
+            FROM "Joke" j
+            WHERE (j."createdAt", j."id") > ($1::timestamp, $2) AND {_INDEXED}
+            ORDER BY j."createdAt", j."id"
+            LIMIT $3::int
+            """,
+            after[0],
+            after[1],
+            str(JOKE_DUPLICATE_PAGE_SIZE),
+        )
+
+    async def backfill(self, since: Optional[datetime] = None) -> int:
+        """
+        Indexes every approved or pending joke, or those created since a given time.
+
+        The whole table is paged through by id, jokes created since a time
+        by creation time and id. Yields to the event loop between pages, so
+        it can run while requests are being served.
+
+        Returns:
+            int: The number of jokes read.
+        """
+        started = datetime.now(timezone.utc)
+        read = 0
+        after_id = ""
+        after_created = None
+        if since is not None:
+            after_created = (
+                timestamp(since),
+                "",
+            )
+        while True:
+            if after_created is None:
+                page = await self._read(after_id)
+            else:
+                page = await self._read_created(after_created)
+            for row in page:
+                self.add(row["id"], signature(row["setup"], row["punchline"]))
+            read += len(page)
+            if len(page) < JOKE_DUPLICATE_PAGE_SIZE:
+                break
+            if after_created is None:
+                after_id = page[-1]["id"]
+            else:
+                after_created = (page[-1]["createdAt"], page[-1]["id"])
+            await asyncio.sleep(0)
+        self._cursor = started
+        return read
+
+    async def _run(self, interval: float) -> None:
+        try:
+            read = await self.backfill()
+            logger.info("Near-duplicate index backfilled with %d jokes", read)
+        except Exception:
+            logger.exception("Error backfilling the near-duplicate index")
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.backfill(
+                    self._cursor - REFRESH_OVERLAP if self._cursor else None
+                )
+            except Exception:
+                logger.exception("Error refreshing the near-duplicate index")
+
+    def start(self, interval: float = JOKE_DUPLICATE_REFRESH_SECONDS) -> None:
+        """
+        Starts backfilling the index in the background, and refreshing it afterwards.
+        """
+        if JOKE_DUPLICATE_CHECK == "off":
+            return
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(interval))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+near_duplicate_index = NearDuplicateIndex()
@@ -0,0 +1,90 @@
+"""
+Flags pending jokes that nearly duplicate another approved or pending joke.
+
+    python -m project.near_duplicates_cli
+    python -m project.near_duplicates_cli --dry-run
+
+Builds the near-duplicate index over the whole `Joke` table, then sets
+`duplicateOfId` on every unflagged PENDING moderation queue entry whose joke
+has a near-duplicate, as submission does for new jokes. Of two pending
+jokes that nearly duplicate each other, only one is flagged.
+"""
+
+import argparse
+import asyncio
+import sys
+from typing import Optional
+
+import prisma
+import prisma.models
+import project.near_duplicates
+from prisma import Prisma
+
+
+async def _flag_pending(
+    index: project.near_duplicates.NearDuplicateIndex, dry_run: bool
+) -> int:
+    flagged = 0
+    after = ""
+    while True:
+        rows = await prisma.get_client().query_raw(
+            """
+            SELECT q."id", q."jokeId", j."setup", j."punchline"
+            FROM "ModerationQueue" q JOIN "Joke" j ON j."id" = q."jokeId"
+            WHERE q."status" = 'PENDING' AND q."duplicateOfId" IS NULL
+                AND q."id" > $1
+            ORDER BY q."id"
+            LIMIT $2::int
+            """,
+            after,
+            str(project.near_duplicates.JOKE_DUPLICATE_PAGE_SIZE),
+        )
+        for row in rows:
+            sig = project.near_duplicates.signature(row["setup"], row["punchline"])
+            duplicate = index.find(sig, exclude=row["jokeId"])
+            if duplicate is None:
+                continue
+            # The pair is seen from both sides; drop this joke from the index
+            # so that the other one is not flagged as its duplicate in turn.
+            index.remove(row["jokeId"])
+            flagged += 1
+            print(f"{row['jokeId']} duplicates {duplicate[0]} ({duplicate[1]:.2f})")
+            if not dry_run:
+                await prisma.models.ModerationQueue.prisma().update(
+                    where={"id": row["id"]}, data={"duplicateOfId": duplicate[0]}
+                )
+        if len(rows) < project.near_duplicates.JOKE_DUPLICATE_PAGE_SIZE:
+            return flagged
+        after = rows[-1]["id"]
+
+
+async def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "--dry-run", action="store_true", help="list duplicates without flagging them"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=project.near_duplicates.JOKE_DUPLICATE_THRESHOLD,
+    )
+    args = parser.parse_args(argv)
+
+    index = project.near_duplicates.NearDuplicateIndex(args.threshold)
+    db_client = Prisma(auto_register=True)
+    await db_client.connect()
+    try:
+        indexed = await index.backfill()
+        print(f"indexed {indexed} jokes", file=sys.stderr)
+        flagged = await _flag_pending(index, args.dry_run)
+    finally:
+        await db_client.disconnect()
+
+    print(
+        f"{flagged} pending jokes {'are' if args.dry_run else 'were'} near-duplicates"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
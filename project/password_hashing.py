@@ -0,0 +1,74 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+PASSWORD_HASH_WORKERS = int(
+    os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1)))
+)
+
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+
+
+class PasswordPoolSaturated(Exception):
+    """
+    Raised when too many password operations are already queued.
+    """
+
+
+class PasswordHasher:
+    """
+    Runs password hashing and verification on a dedicated, size-capped thread pool.
+
+    bcrypt releases the GIL while it works, so a small thread pool keeps its
+    cost off the event loop. At most `max_pending` operations may be running
+    or queued at once; beyond that, callers fail fast with
+    PasswordPoolSaturated instead of waiting behind the backlog.
+    """
+
+    def __init__(
+        self,
+        context: Callable[[], Any],
+        workers: int = PASSWORD_HASH_WORKERS,
+        max_pending: int = PASSWORD_HASH_MAX_PENDING,
+    ) -> None:
+        # Returns the passlib context; called in the worker threads, so that
+        # importing passlib on first use does not hold up the event loop.
+        self.context = context
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="password-hash"
+            )
+        return self._executor
+
+    async def _run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise PasswordPoolSaturated("Too many concurrent password operations")
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._get_executor(), fn, *args
+            )
+        finally:
+            self.pending -= 1
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(
+            lambda: self.context().verify(plain_password, hashed_password)
+        )
+
+    async def hash(self, password: str) -> str:
+        return await self._run(lambda: self.context().hash(password))
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,382 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from project.access_log_pipeline import access_log_pipeline
+from project.database import query_gate, query_stats
+from project.get_joke_in_language_service import language_chain
+from project.http_caching import performance_cache, usage_cache
+from project.instrumentation import RequestRecord
+from project.joke_pool import joke_pool
+from project.query_tracing import query_tracer
+from project.rate_limiter import rate_limiter
+from project.request_metrics import BUCKET_BOUNDS, SUB_BUCKETS, Histogram
+from project.token_validation import token_validator
+
+logger = logging.getLogger(__name__)
+
+# When set, every worker writes its counters here and /metrics sums them all.
+METRICS_DIR = os.getenv("METRICS_DIR")
+
+METRICS_SNAPSHOT_SECONDS = float(os.getenv("METRICS_SNAPSHOT_SECONDS", "5"))
+
+EVENT_LOOP_LAG_INTERVAL = float(os.getenv("EVENT_LOOP_LAG_INTERVAL", "0.5"))
+
+# Starlette appends the charset.
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# Exported `le` bounds: one per doubling of the latency histogram buckets,
+# 50us to about 52s. Cumulative counts at these bounds are exact.
+EXPORTED_BUCKETS = range(0, len(BUCKET_BOUNDS), SUB_BUCKETS)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class MetricFamily:
+    """
+    One metric family's samples, keyed by sample name and labels.
+    """
+
+    __slots__ = ("name", "type", "help", "samples")
+
+    def __init__(self, name: str, type: str, help: str) -> None:
+        self.name = name
+        self.type = type
+        self.help = help
+        self.samples: Dict[Tuple[str, Labels], float] = {}
+
+    def add(self, labels: Labels, value: float, suffix: str = "") -> None:
+        key = (self.name + suffix, labels)
+        self.samples[key] = self.samples.get(key, 0.0) + value
+
+    def add_histogram(self, labels: Labels, histogram: Histogram) -> None:
+        seen = 0
+        previous = 0
+        for index in EXPORTED_BUCKETS:
+            seen += sum(histogram.buckets[previous : index + 1])
+            previous = index + 1
+            self.add(labels + (("le", repr(BUCKET_BOUNDS[index])),), seen, "_bucket")
+        self.add(labels + (("le", "+Inf"),), histogram.count, "_bucket")
+        self.add(labels, histogram.count, "_count")
+        self.add(labels, histogram.total, "_sum")
+
+
+class Registry:
+    """
+    Builds metric families from the counters the app already keeps.
+
+    Nothing here runs on the request path: request and query counters are
+    plain integers updated by their owners on the event loop, which needs no
+    locking, and they are only read and formatted when /metrics is scraped.
+    """
+
+    def __init__(self) -> None:
+        self.families: Dict[str, MetricFamily] = {}
+
+    def family(self, name: str, type: str, help: str) -> MetricFamily:
+        family = self.families.get(name)
+        if family is None:
+            family = self.families[name] = MetricFamily(name, type, help)
+        return family
+
+    def merge(self, snapshot: List[list]) -> None:
+        for name, type, help, sample, labels, value in snapshot:
+            family = self.family(name, type, help)
+            key = (sample, tuple(tuple(label) for label in labels))
+            family.samples[key] = family.samples.get(key, 0.0) + value
+
+    def snapshot(self) -> List[list]:
+        return [
+            [family.name, family.type, family.help, sample, labels, value]
+            for family in self.families.values()
+            for (sample, labels), value in family.samples.items()
+        ]
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for family in self.families.values():
+            lines.append(f"# HELP {family.name} {family.help}")
+            lines.append(f"# TYPE {family.name} {family.type}")
+            for (sample, labels), value in family.samples.items():
+                if labels:
+                    rendered = ",".join(
+                        f'{key}="{_escape(label)}"' for key, label in labels
+                    )
+                    lines.append(f"{sample}{{{rendered}}} {_number(value)}")
+                else:
+                    lines.append(f"{sample} {_number(value)}")
+        lines.append("")
+        return "\n".join(lines)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class RouteStats:
+    """
+    Responses by status code and the latency histogram of one route and method.
+    """
+
+    __slots__ = ("statuses", "latency")
+
+    def __init__(self) -> None:
+        self.statuses: Dict[int, int] = {}
+        self.latency = Histogram()
+
+
+class MetricsExporter:
+    """
+    Per-worker request counters plus the Prometheus exposition of every metric.
+
+    `observe` is the only code on the request path: one dict lookup, one
+    status count and one histogram bucket increment. With METRICS_DIR set, each worker also writes
+    its counters to `<METRICS_DIR>/<pid>.json` every METRICS_SNAPSHOT_SECONDS,
+    and a scrape, whichever worker answers it, sums the other workers' latest
+    snapshots into its own live counters. Gauges carry a `pid` label so that
+    they are never summed across workers.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = METRICS_DIR,
+        snapshot_interval: float = METRICS_SNAPSHOT_SECONDS,
+        lag_interval: float = EVENT_LOOP_LAG_INTERVAL,
+    ) -> None:
+        self.directory = directory
+        self.snapshot_interval = snapshot_interval
+        self.lag_interval = lag_interval
+        self.pid = str(os.getpid())
+        self._routes: Dict[Tuple[str, str], RouteStats] = {}
+        self._loop_lag = Histogram()
+        self._last_loop_lag = 0.0
+        self._tasks: List[asyncio.Task] = []
+
+    def observe(self, record: RequestRecord) -> None:
+        """
+        Counts one handled request. Registered as a request observer.
+        """
+        route = self._routes.get((record.endpoint, record.method))
+        if route is None:
+            route = self._routes[(record.endpoint, record.method)] = RouteStats()
+        statuses = route.statuses
+        statuses[record.status_code] = statuses.get(record.status_code, 0) + 1
+        route.latency.record(record.duration, record.status_code >= 500)
+
+    def collect(self) -> Registry:
+        """
+        Gathers this worker's metrics.
+        """
+        registry = Registry()
+        pid = (("pid", self.pid),)
+
+        requests = registry.family(
+            "joke_api_requests_total", "counter", "Requests handled, by route."
+        )
+        latency = registry.family(
+            "joke_api_request_duration_seconds",
+            "histogram",
+            "Time spent in route handlers.",
+        )
+        for (endpoint, method), route in self._routes.items():
+            labels = (("endpoint", endpoint), ("method", method))
+            for status, count in route.statuses.items():
+                requests.add(labels + (("status", str(status)),), count)
+            latency.add_histogram(labels, route.latency)
+
+        queries = registry.family(
+            "joke_api_db_query_duration_seconds",
+            "histogram",
+            "Database query time, by issuing route and Prisma operation.",
+        )
+        query_errors = registry.family(
+            "joke_api_db_query_errors_total", "counter", "Database queries that failed."
+        )
+        for (endpoint, operation), histogram in list(query_stats.queries.items()):
+            labels = (("endpoint", endpoint), ("operation", operation))
+            queries.add_histogram(labels, histogram)
+            query_errors.add(labels, histogram.errors)
+
+        rows = registry.family(
+            "joke_api_db_rows_total",
+            "counter",
+            "Records returned by database queries, by issuing route and Prisma operation.",
+        )
+        for (endpoint, operation), count in list(query_tracer.rows.items()):
+            rows.add((("endpoint", endpoint), ("operation", operation)), count)
+        slow_queries = registry.family(
+            "joke_api_db_slow_queries_total",
+            "counter",
+            "Database queries slower than SLOW_QUERY_MS.",
+        )
+        for (endpoint, operation), count in list(query_tracer.slow_queries.items()):
+            slow_queries.add((("endpoint", endpoint), ("operation", operation)), count)
+        n_plus_one = registry.family(
+            "joke_api_db_n_plus_one_total",
+            "counter",
+            "Requests repeating one operation from one function, by route, operation and function.",
+        )
+        for (endpoint, operation, caller), count in list(
+            query_tracer.n_plus_one.items()
+        ):
+            n_plus_one.add(
+                (("endpoint", endpoint), ("operation", operation), ("caller", caller)),
+                count,
+            )
+
+        gate = query_gate.stats()
+        registry.family(
+            "joke_api_db_pool_connections_in_use",
+            "gauge",
+            "Queries currently holding a database connection.",
+        ).add(pid, gate["in_use"])
+        registry.family(
+            "joke_api_db_pool_waiting", "gauge", "Queries waiting for a connection."
+        ).add(pid, gate["waiting"])
+        rejections = registry.family(
+            "joke_api_db_pool_rejections_total",
+            "counter",
+            "Queries refused a connection, by reason.",
+        )
+        rejections.add((("reason", "queue_full"),), gate["rejected"])
+        rejections.add((("reason", "timeout"),), gate["timed_out"])
+        registry.family(
+            "joke_api_db_pool_wait_seconds",
+            "histogram",
+            "Time spent waiting for a database connection.",
+        ).add_histogram((), query_gate.wait_times)
+
+        caches = registry.family(
+            "joke_api_cache_requests_total",
+            "counter",
+            "Cache lookups, by cache and result.",
+        )
+        chain = language_chain.cache_info()
+        for name, hits, misses in (
+            ("http_usage", usage_cache.hits, usage_cache.misses),
+            ("http_performance", performance_cache.hits, performance_cache.misses),
+            ("token", token_validator.cache.hits, token_validator.cache.misses),
+            (
+                "rate_limit_key",
+                rate_limiter.key_cache.hits,
+                rate_limiter.key_cache.misses,
+            ),
+            ("language_chain", chain.hits, chain.misses),
+        ):
+            caches.add((("cache", name), ("result", "hit")), hits)
+            caches.add((("cache", name), ("result", "miss")), misses)
+
+        registry.family(
+            "joke_api_event_loop_lag_seconds",
+            "histogram",
+            "How late the event loop ran a timer it was asked to run.",
+        ).add_histogram((), self._loop_lag)
+        registry.family(
+            "joke_api_event_loop_lag_last_seconds",
+            "gauge",
+            "The most recent event loop lag measurement.",
+        ).add(pid, self._last_loop_lag)
+
+        access_log = registry.family(
+            "joke_api_access_log_events_total",
+            "counter",
+            "Access log events, by outcome.",
+        )
+        stats = access_log_pipeline.stats()
+        for state in ("enqueued", "dropped", "written", "failed"):
+            access_log.add((("state", state),), stats[state])
+        registry.family(
+            "joke_api_joke_pool_size", "gauge", "Jokes held in the in-process pool."
+        ).add(pid, len(joke_pool))
+        return registry
+
+    def _snapshot_path(self, pid: str) -> str:
+        return os.path.join(self.directory, f"{pid}.json")
+
+    def _other_snapshots(self) -> Iterable[List[list]]:
+        # Snapshots not rewritten for a few intervals belong to workers that
+        # have exited.
+        oldest = time.time() - 3 * self.snapshot_interval
+        for entry in os.scandir(self.directory):
+            if entry.name == f"{self.pid}.json" or not entry.name.endswith(".json"):
+                continue
+            try:
+                if entry.stat().st_mtime < oldest:
+                    continue
+                with open(entry.path) as file:
+                    yield json.load(file)
+            except (OSError, ValueError):
+                continue
+
+    def render(self, registry: Optional[Registry] = None) -> str:
+        """
+        Renders the Prometheus text exposition, summed over every live worker.
+
+        Reading the other workers' snapshots is file I/O, so a caller on the
+        event loop collects `registry` there, where the counters live, and
+        runs this in a thread.
+        """
+        if registry is None:
+            registry = self.collect()
+        if self.directory:
+            for snapshot in self._other_snapshots():
+                registry.merge(snapshot)
+        return registry.render()
+
+    def _write_snapshot(self, snapshot: List[list]) -> None:
+        path = self._snapshot_path(self.pid)
+        with open(f"{path}.tmp", "w") as file:
+            json.dump(snapshot, file)
+        os.replace(f"{path}.tmp", path)
+
+    async def _write_snapshots_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            # Collected on the loop, which owns the counters; written from a
+            # thread so that a slow disk never stalls it.
+            snapshot = self.collect().snapshot()
+            try:
+                await asyncio.to_thread(self._write_snapshot, snapshot)
+            except OSError:
+                logger.exception("Error writing metrics snapshot")
+
+    async def _measure_loop_lag_forever(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.lag_interval)
+            lag = max(0.0, time.perf_counter() - started - self.lag_interval)
+            self._last_loop_lag = lag
+            self._loop_lag.record(lag, False)
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self.pid = str(os.getpid())
+        self._tasks.append(asyncio.create_task(self._measure_loop_lag_forever()))
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            self._tasks.append(asyncio.create_task(self._write_snapshots_forever()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        if self.directory:
+            try:
+                os.remove(self._snapshot_path(self.pid))
+            except OSError:
+                pass
+
+
+metrics_exporter = MetricsExporter()
@@ -0,0 +1,179 @@
+import logging
+import os
+import random
+import sys
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Trace the database queries each request makes and report them in a
+# Server-Timing header; the slow-query log and N+1 detection depend on it.
+QUERY_TRACING = os.getenv("QUERY_TRACING", "1").lower() in ("1", "true", "yes")
+
+# Queries taking at least this long are counted as slow, and a sample of
+# SLOW_QUERY_LOG_SAMPLE_RATE of them is logged with the function that made
+# them.
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+SLOW_QUERY_LOG_SAMPLE_RATE = float(os.getenv("SLOW_QUERY_LOG_SAMPLE_RATE", "0.1"))
+
+# A request making the same Prisma operation from the same function this many
+# times is flagged as an N+1 query pattern.
+QUERY_N_PLUS_ONE_THRESHOLD = int(os.getenv("QUERY_N_PLUS_ONE_THRESHOLD", "5"))
+
+# Modules between a route and the engine, skipped when looking for the
+# function that made a query.
+_SKIPPED_MODULES = ("project.database", "project.instrumentation", __name__)
+
+
+@dataclass(slots=True)
+class QueryTrace:
+    """
+    The database queries made while handling one request.
+    """
+
+    endpoint: str
+    queries: int = 0
+    rows: int = 0
+    # Time spent in queries, and waiting for a connection before them.
+    seconds: float = 0.0
+    wait_seconds: float = 0.0
+    calls: Dict[Tuple[str, str], int] = field(default_factory=dict)
+
+    def server_timing(self, total: float) -> str:
+        """
+        The trace as a Server-Timing header value, in milliseconds.
+
+        Args:
+            total (float): Seconds the whole request took, the rest of which is reported as `app`.
+        """
+        return (
+            f'db;dur={self.seconds * 1000:.1f};desc="{self.queries} queries, '
+            f'{self.rows} rows", db-wait;dur={self.wait_seconds * 1000:.1f}, '
+            f"app;dur={max(0.0, total - self.seconds - self.wait_seconds) * 1000:.1f}"
+        )
+
+
+# Trace of the request being handled; None outside of requests, or with
+# QUERY_TRACING off.
+current_trace: ContextVar[Optional[QueryTrace]] = ContextVar(
+    "current_trace", default=None
+)
+
+
+def calling_function() -> str:
+    """
+    The first function up the stack outside the database layer and Prisma, as `module.function`.
+    """
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if module.startswith("project.") and module not in _SKIPPED_MODULES:
+            return f"{module}.{frame.f_code.co_qualname}"
+        frame = frame.f_back
+    return "unknown"
+
+
+def count_rows(result: Any) -> int:
+    """
+    Records returned by a raw engine response: a list of them, one, or none.
+    """
+    try:
+        data = result["data"]["result"]
+    except (KeyError, TypeError):
+        return 0
+    if isinstance(data, list):
+        return len(data)
+    if isinstance(data, dict):
+        # update_many and delete_many report how many records they changed.
+        count = data.get("count")
+        return count if isinstance(count, int) and len(data) == 1 else 1
+    return 0
+
+
+class QueryTracer:
+    """
+    Adds each query to the current request's trace, and logs slow queries and N+1 patterns.
+
+    The function that made a query is found by walking up the stack to the
+    first frame in a `project` module other than the database layer, which
+    for queries made by a service is the service function (or the helper it
+    called). Per query this costs a context variable lookup, a few frames
+    walked and a dictionary update, so tracing is on by default.
+
+    Slow queries are counted per route and operation for `/metrics`, and a
+    sample is logged. A request that makes the same operation from the same
+    function QUERY_N_PLUS_ONE_THRESHOLD times is counted as an N+1 pattern,
+    and the first such request per route, operation and function is logged.
+    """
+
+    def __init__(
+        self,
+        slow_seconds: float = SLOW_QUERY_MS / 1000,
+        sample_rate: float = SLOW_QUERY_LOG_SAMPLE_RATE,
+        n_plus_one_threshold: int = QUERY_N_PLUS_ONE_THRESHOLD,
+    ) -> None:
+        self.slow_seconds = slow_seconds
+        self.sample_rate = sample_rate
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.slow_queries: Dict[Tuple[str, str], int] = {}
+        self.rows: Dict[Tuple[str, str], int] = {}
+        self.n_plus_one: Dict[Tuple[str, str, str], int] = {}
+
+    def record(self, operation: str, result: Any, duration: float, wait: float) -> None:
+        """
+        Records one finished query.
+
+        Args:
+            operation (str): The Prisma operation, e.g. `Joke.find_many`.
+            result (Any): The engine's raw response, or None if the query failed.
+            duration (float): Seconds the query took once it had a connection.
+            wait (float): Seconds it waited for a connection.
+        """
+        if not QUERY_TRACING:
+            return
+        trace = current_trace.get()
+        endpoint = trace.endpoint if trace is not None else "background"
+        rows = count_rows(result)
+        key = (endpoint, operation)
+        self.rows[key] = self.rows.get(key, 0) + rows
+        caller = None
+        if trace is not None:
+            caller = calling_function()
+            trace.queries += 1
+            trace.rows += rows
+            trace.seconds += duration
+            trace.wait_seconds += wait
+            call = (operation, caller)
+            calls = trace.calls[call] = trace.calls.get(call, 0) + 1
+            if calls == self.n_plus_one_threshold:
+                self._flag_n_plus_one(endpoint, operation, caller)
+        if duration >= self.slow_seconds:
+            self.slow_queries[key] = self.slow_queries.get(key, 0) + 1
+            if random.random() < self.sample_rate:
+                logger.warning(
+                    "Slow query: %s took %.1fms (%d rows, waited %.1fms) in %s for %s",
+                    operation,
+                    duration * 1000,
+                    rows,
+                    wait * 1000,
+                    caller or calling_function(),
+                    endpoint,
+                )
+
+    def _flag_n_plus_one(self, endpoint: str, operation: str, caller: str) -> None:
+        key = (endpoint, operation, caller)
+        seen = self.n_plus_one.get(key, 0)
+        self.n_plus_one[key] = seen + 1
+        if not seen:
+            logger.warning(
+                "Possible N+1 queries: %s made %s %d or more times for one %s request",
+                caller,
+                operation,
+                self.n_plus_one_threshold,
+                endpoint,
+            )
+
+
+query_tracer = QueryTracer()
@@ -0,0 +1,375 @@
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Protocol, Tuple
+
+import prisma.models
+from project.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_REQUESTS = int(os.getenv("RATE_LIMIT_REQUESTS", "1000"))
+
+RATE_LIMIT_WINDOW_SECONDS = int(os.getenv("RATE_LIMIT_WINDOW_SECONDS", "3600"))
+
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+
+# How long an API key's lookup is trusted, and a lookup of a key that does not
+# exist (requests with unknown keys are limited by client address).
+RATE_LIMIT_KEY_CACHE_TTL_SECONDS = float(
+    os.getenv("RATE_LIMIT_KEY_CACHE_TTL_SECONDS", "60")
+)
+RATE_LIMIT_KEY_CACHE_NEGATIVE_TTL_SECONDS = float(
+    os.getenv("RATE_LIMIT_KEY_CACHE_NEGATIVE_TTL_SECONDS", "5")
+)
+
+API_KEY_HEADER = b"x-api-key"
+
+# Where the resolved client key is kept in the ASGI scope, so that a request
+# is only resolved once.
+_SCOPE_KEY = "rate_limit_client"
+
+
+@dataclass(frozen=True)
+class RateLimitState:
+    """
+    The sliding-window usage of one client at a point in time.
+    """
+
+    allowed: bool
+    limit: int
+    used: int
+    window_seconds: int
+    reset_after: float
+
+    @property
+    def remaining(self) -> int:
+        return max(0, self.limit - self.used)
+
+
+class RateLimitBackend(Protocol):
+    async def hit(
+        self, key: str, limit: int, window_seconds: int, now: float, cost: int = 1
+    ) -> Tuple[bool, int]:
+        """Counts `cost` requests if they fit under `limit`; returns (allowed, used)."""
+        ...
+
+    async def peek(self, key: str, window_seconds: int, now: float) -> int:
+        """Returns the current usage without counting a request."""
+        ...
+
+    async def close(self) -> None: ...
+
+
+def _sliding_count(previous: int, current: int, elapsed_fraction: float) -> int:
+    # Sliding-window counter: the previous fixed window is weighted by how
+    # much of it still overlaps the sliding window ending now.
+    return int(previous * (1.0 - elapsed_fraction)) + current
+
+
+class MemoryRateLimitBackend:
+    """
+    Per-process sliding-window counters.
+
+    Each key costs three integers (window number, current and previous window
+    counts). Keys are kept in LRU order and the least recently seen key is
+    evicted once `max_keys` is reached, so memory stays bounded no matter how
+    many distinct clients show up.
+    """
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS) -> None:
+        self.max_keys = max_keys
+        self._counters: "OrderedDict[str, List[int]]" = OrderedDict()
+
+    def _counter(self, key: str, window: int) -> List[int]:
+        counter = self._counters.get(key)
+        if counter is None:
+            counter = [window, 0, 0]
+            self._counters[key] = counter
+            if len(self._counters) > self.max_keys:
+                self._counters.popitem(last=False)
+        else:
+            self._counters.move_to_end(key)
+            if counter[0] != window:
+                counter[2] = counter[1] if counter[0] == window - 1 else 0
+                counter[1] = 0
+                counter[0] = window
+        return counter
+
+    async def hit(
+        self, key: str, limit: int, window_seconds: int, now: float, cost: int = 1
+    ) -> Tuple[bool, int]:
+        window, offset = divmod(now, window_seconds)
+        counter = self._counter(key, int(window))
+        used = _sliding_count(counter[2], counter[1], offset / window_seconds)
+        if used + cost > limit:
+            return False, used
+        counter[1] += cost
+        return True, used + cost
+
+    async def peek(self, key: str, window_seconds: int, now: float) -> int:
+        window, offset = divmod(now, window_seconds)
+        counter = self._counters.get(key)
+        if counter is None:
+            return 0
+        if counter[0] == int(window):
+            previous, current = counter[2], counter[1]
+        elif counter[0] == int(window) - 1:
+            previous, current = counter[1], 0
+        else:
+            return 0
+        return _sliding_count(previous, current, offset / window_seconds)
+
+    async def close(self) -> None:
+        pass
+
+
+_REDIS_HIT_SCRIPT = """
+local previous = tonumber(redis.call('GET', KEYS[1]) or '0')
+local current = tonumber(redis.call('GET', KEYS[2]) or '0')
+local used = math.floor(previous * tonumber(ARGV[2])) + current
+local cost = tonumber(ARGV[4])
+if used + cost > tonumber(ARGV[1]) then
+    return {0, used}
+end
+redis.call('INCRBY', KEYS[2], cost)
+redis.call('EXPIRE', KEYS[2], tonumber(ARGV[3]))
+return {1, used + cost}
+"""
+
+
+class RedisRateLimitBackend:
+    """
+    Sliding-window counters shared by every worker through Redis.
+
+    Uses the same two-counter scheme as the in-memory backend; each window's
+    counter expires on its own after two windows. Requires the optional
+    `redis` package.
+    """
+
+    def __init__(
+        self, url: str = RATE_LIMIT_REDIS_URL, prefix: str = "ratelimit"
+    ) -> None:
+        try:
+            import redis.asyncio
+        except ImportError as e:
+            raise RuntimeError(
+                "RATE_LIMIT_BACKEND=redis requires the 'redis' package"
+            ) from e
+        self.prefix = prefix
+        self._redis = redis.asyncio.from_url(url)
+        self._hit = self._redis.register_script(_REDIS_HIT_SCRIPT)
+
+    def _keys(self, key: str, window: int) -> List[str]:
+        return [f"{self.prefix}:{key}:{window - 1}", f"{self.prefix}:{key}:{window}"]
+
+    async def hit(
+        self, key: str, limit: int, window_seconds: int, now: float, cost: int = 1
+    ) -> Tuple[bool, int]:
+        window, offset = divmod(now, window_seconds)
+        allowed, used = await self._hit(
+            keys=self._keys(key, int(window)),
+            args=[
+                limit,
+                str(1.0 - offset / window_seconds),
+                2 * window_seconds,
+                cost,
+            ],
+        )
+        return bool(allowed), int(used)
+
+    async def peek(self, key: str, window_seconds: int, now: float) -> int:
+        window, offset = divmod(now, window_seconds)
+        previous, current = await self._redis.mget(self._keys(key, int(window)))
+        return _sliding_count(
+            int(previous or 0), int(current or 0), offset / window_seconds
+        )
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+
+class RateLimiter:
+    """
+    Enforces a per-client request budget over a sliding window.
+    """
+
+    def __init__(
+        self,
+        backend: RateLimitBackend,
+        limit: int = RATE_LIMIT_REQUESTS,
+        window_seconds: int = RATE_LIMIT_WINDOW_SECONDS,
+    ) -> None:
+        self.backend = backend
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.key_cache: TTLCache[str] = TTLCache(
+            RATE_LIMIT_MAX_KEYS,
+            RATE_LIMIT_KEY_CACHE_TTL_SECONDS,
+            RATE_LIMIT_KEY_CACHE_NEGATIVE_TTL_SECONDS,
+        )
+
+    @classmethod
+    def from_env(cls) -> "RateLimiter":
+        if RATE_LIMIT_BACKEND == "redis":
+            return cls(RedisRateLimitBackend())
+        return cls(MemoryRateLimitBackend())
+
+    async def client_key(self, scope: dict) -> str:
+        """
+        Identifies the client of a request by its API key, falling back to its address.
+
+        The `X-API-Key` header is only trusted once it is found in the
+        `ApiKey` table; a made-up key is limited by the client's address, like
+        a request without one, so that it neither gets a fresh budget nor
+        pushes real keys' counters out. Lookups are cached in `key_cache`.
+        """
+        state = scope.setdefault("state", {})
+        key = state.get(_SCOPE_KEY)
+        if key is None:
+            key = state[_SCOPE_KEY] = await self._resolve(scope)
+        return key
+
+    async def _resolve(self, scope: dict) -> str:
+        for name, value in scope.get("headers", ()):
+            if name == API_KEY_HEADER:
+                api_key = value.decode("latin-1")
+                found, api_key_id = self.key_cache.get(api_key)
+                if not found:
+                    try:
+                        row = await prisma.models.ApiKey.prisma().find_unique(
+                            where={"key": api_key}
+                        )
+                    except Exception as e:
+                        # Limited by address until the key can be looked up.
+                        logger.warning("Could not look up API key: %s", e)
+                        break
+                    api_key_id = row.id if row is not None else None
+                    self.key_cache.put(api_key, api_key_id)
+                if api_key_id is not None:
+                    return "key:" + api_key_id
+                break
+        client = scope.get("client")
+        return "ip:" + (client[0] if client else "unknown")
+
+    def _state(self, allowed: bool, used: int, now: float) -> RateLimitState:
+        return RateLimitState(
+            allowed=allowed,
+            limit=self.limit,
+            used=used,
+            window_seconds=self.window_seconds,
+            reset_after=self.window_seconds - now % self.window_seconds,
+        )
+
+    async def hit(self, key: str, cost: int = 1) -> RateLimitState:
+        """
+        Counts a request, or `cost` requests' worth, against a client's budget.
+
+        A request costing more than the client has left is refused and not
+        counted at all.
+
+        If the backend cannot be reached (Redis is down), the request is
+        let through uncounted: an outage of the limiter should not take the
+        whole API down with it.
+        """
+        now = time.time()
+        try:
+            allowed, used = await self.backend.hit(
+                key, self.limit, self.window_seconds, now, cost
+            )
+        except Exception as e:
+            logger.warning("Rate limit backend unavailable, not limiting: %s", e)
+            allowed, used = True, 0
+        return self._state(allowed, used, now)
+
+    async def peek(self, key: str) -> RateLimitState:
+        """
+        A client's usage, without counting a request.
+
+        If the backend cannot be reached, the usage is reported as zero, which
+        is what `hit` counts while it lets requests through uncounted.
+        """
+        now = time.time()
+        try:
+            used = await self.backend.peek(key, self.window_seconds, now)
+        except Exception as e:
+            logger.warning("Rate limit backend unavailable, reporting no usage: %s", e)
+            used = 0
+        return self._state(used < self.limit, used, now)
+
+    async def close(self) -> None:
+        await self.backend.close()
+
+
+def rate_limit_headers(state: RateLimitState) -> Dict[str, str]:
+    """
+    The `X-RateLimit-*` headers describing a client's remaining budget.
+    """
+    return {
+        "X-RateLimit-Limit": str(state.limit),
+        "X-RateLimit-Remaining": str(state.remaining),
+        "X-RateLimit-Reset": str(math.ceil(state.reset_after)),
+    }
+
+
+def _headers(state: RateLimitState) -> List[Tuple[bytes, bytes]]:
+    return [
+        (name.lower().encode(), value.encode())
+        for name, value in rate_limit_headers(state).items()
+    ]
+
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware that rejects requests over the rate limit with 429.
+
+    Allowed responses carry `X-RateLimit-*` headers describing the client's
+    remaining budget.
+    """
+
+    def __init__(
+        self, app, limiter: RateLimiter, exempt_paths: Iterable[str] = ()
+    ) -> None:
+        self.app = app
+        self.limiter = limiter
+        self.exempt_paths = frozenset(exempt_paths)
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+        state = await self.limiter.hit(await self.limiter.client_key(scope))
+        if not state.allowed:
+            body = b'{"error":"Rate limit exceeded"}'
+            headers = _headers(state) + [
+                (b"retry-after", str(math.ceil(state.reset_after)).encode()),
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+            ]
+            await send(
+                {"type": "http.response.start", "status": 429, "headers": headers}
+            )
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        async def send_with_headers(message) -> None:
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", ()))
+                # A route that charged more against the budget (batches) sets
+                # its own, more recent, headers.
+                if not any(name == b"x-ratelimit-remaining" for name, _ in headers):
+                    headers += _headers(state)
+                message["headers"] = headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+
+rate_limiter = RateLimiter.from_env()
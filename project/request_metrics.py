@@ -0,0 +1,62 @@
+from bisect import bisect_left
+from typing import Tuple
+
+# Log-bucketed latency histogram: bucket 0 holds everything up to
+# BUCKET_BASE, then each doubling of latency is split into SUB_BUCKETS
+# buckets, which bounds the relative error of a reported percentile to
+# about 19%. 84 buckets reach just over a minute.
+BUCKET_BASE = 50e-6
+
+SUB_BUCKETS = 4
+
+BUCKET_COUNT = 84
+
+BUCKET_BOUNDS: Tuple[float, ...] = tuple(
+    BUCKET_BASE * 2 ** (i / SUB_BUCKETS) for i in range(BUCKET_COUNT)
+)
+
+
+class Histogram:
+    """
+    Request count, error count, total latency and latency buckets for one time slice.
+    """
+
+    __slots__ = ("index", "count", "errors", "total", "buckets")
+
+    def __init__(self, index: int = 0) -> None:
+        self.index = index
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.buckets = [0] * BUCKET_COUNT
+
+    def record(self, duration: float, error: bool) -> None:
+        self.count += 1
+        self.errors += error
+        self.total += duration
+        # The first bucket whose upper bound is at least `duration`; a binary
+        # search over the bounds is cheaper than taking a log on every request.
+        self.buckets[bisect_left(BUCKET_BOUNDS, duration, 0, BUCKET_COUNT - 1)] += 1
+
+    def merge(self, other: "Histogram") -> None:
+        self.count += other.count
+        self.errors += other.errors
+        self.total += other.total
+        buckets = self.buckets
+        for i, n in enumerate(other.buckets):
+            if n:
+                buckets[i] += n
+
+    def percentile(self, q: float) -> float:
+        """
+        Returns the upper bound, in seconds, of the bucket holding the q-th quantile.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                return BUCKET_BOUNDS[i]
+        return BUCKET_BOUNDS[-1]
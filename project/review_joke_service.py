@@ -1,8 +1,16 @@
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
 import prisma
 import prisma.enums
 import prisma.models
+from project.catalog_events import CatalogEvent, catalog_events
+from project.database import timestamp
 from pydantic import BaseModel
 
+MODERATION_BATCH_LIMIT = int(os.getenv("MODERATION_BATCH_LIMIT", "500"))
+
 
 class ReviewJokeResponse(BaseModel):
     """
@@ -15,13 +23,134 @@ class ReviewJokeResponse(BaseModel):
     decision: str
 
 
-async def review_joke(jokeId: str, decision: str) -> ReviewJokeResponse:
+class ReviewDecision(BaseModel):
+    """
+    A moderator's decision on one joke submission.
+    """
+
+    jokeId: str
+    decision: str
+
+
+class BatchReviewRequest(BaseModel):
+    """
+    Decisions to apply together, in one transaction.
+    """
+
+    decisions: List[ReviewDecision]
+
+
+class BatchReviewResponse(BaseModel):
+    """
+    The outcome of every decision in a batch review.
+    """
+
+    success: bool
+    message: str
+    applied: int
+    results: List[ReviewJokeResponse]
+
+
+async def _apply_decisions(
+    decisions: Dict[str, bool], moderator: Optional[str], pending_only: bool
+) -> Dict[str, str]:
+    """
+    Applies approve/reject decisions in a single transaction.
+
+    The jokes are locked first, so a concurrent review of the same joke waits
+    and then sees this one's outcome. Jokes leased to another moderator whose
+    claim has not expired are left alone, as are, when `pending_only` is set,
+    jokes that are no longer pending. Catalog events are published once the
+    transaction has committed.
+
+    Returns:
+        Dict[str, str]: Why each skipped joke was not reviewed, keyed by its id.
+    """
+    ids = list(decisions)
+    placeholders = ", ".join(f"${i}" for i in range(3, len(ids) + 3))
+    skipped: Dict[str, str] = {}
+    async with prisma.get_client().tx(timeout=timedelta(seconds=60)) as transaction:
+        rows = await transaction.query_raw(
+            f"""
+            SELECT j."id", j."language", j."setup", j."punchline",
+                EXISTS (
+                    SELECT 1 FROM "ModerationQueue" q
+                    WHERE q."jokeId" = j."id" AND q."status" = 'PENDING'
+                ) AS "pending",
+                EXISTS (
+                    SELECT 1 FROM "ModerationQueue" q
+                    WHERE q."jokeId" = j."id"
+                        AND q."claimedBy" <> $1
+                        AND q."claimExpiresAt" > $2::timestamp
+                ) AS "claimedByOther"
+            FROM "Joke" j
+            WHERE j."id" IN ({placeholders})
+            FOR UPDATE OF j
+            """,
+            moderator or "",
+            timestamp(datetime.now(timezone.utc)),
+            *ids,
+        )
+        # One row per joke, whatever its number of queue entries: a joke is
+        # pending if any entry is, and claimed if any live claim is another's.
+        jokes = {row["id"]: row for row in rows}
+        pending = {row["id"] for row in rows if row["pending"]}
+        claimed = {row["id"] for row in rows if row["claimedByOther"]}
+        for joke_id in ids:
+            if joke_id not in jokes:
+                skipped[joke_id] = f"Joke with ID {joke_id} not found."
+            elif joke_id in claimed:
+                skipped[joke_id] = f"Joke {joke_id} is claimed by another moderator."
+            elif pending_only and joke_id not in pending:
+                skipped[joke_id] = f"Joke {joke_id} is not pending review."
+        for approved, status in (
+            (True, prisma.enums.ModerationStatus.APPROVED),
+            (False, prisma.enums.ModerationStatus.REJECTED),
+        ):
+            reviewed = [
+                joke_id
+                for joke_id in ids
+                if decisions[joke_id] == approved and joke_id not in skipped
+            ]
+            if not reviewed:
+                continue
+            await transaction.joke.update_many(
+                where={"id": {"in": reviewed}}, data={"approved": approved}
+            )
+            await transaction.moderationqueue.update_many(
+                where={"jokeId": {"in": reviewed}},
+                data={
+                    "status": status,
+                    "reviewedBy": moderator,
+                    "claimedBy": None,
+                    "claimExpiresAt": None,
+                },
+            )
+    for joke_id in ids:
+        if joke_id not in skipped:
+            joke = jokes[joke_id]
+            await catalog_events.publish(
+                CatalogEvent(
+                    joke_id=joke_id,
+                    approved=decisions[joke_id],
+                    language=joke["language"],
+                    setup=joke["setup"],
+                    punchline=joke["punchline"],
+                )
+            )
+    return skipped
+
+
+async def review_joke(
+    jokeId: str, decision: str, moderator: Optional[str] = None
+) -> ReviewJokeResponse:
     """
     Review and approve or reject a joke submission.
 
     Args:
         jokeId (str): The unique identifier of the joke being reviewed.
         decision (str): The moderator's decision on the joke submission. Possible values: 'APPROVED', 'REJECTED'.
+        moderator (Optional[str]): Identity of the reviewing moderator, recorded on the queue entry.
 
     Returns:
         ReviewJokeResponse: Confirms the review action taken on a joke submission.
@@ -33,27 +162,73 @@ async def review_joke(jokeId: str, decision: str) -> ReviewJokeResponse:
             jokeId=jokeId,
             decision=decision,
         )
-    joke = await prisma.models.Joke.prisma().find_unique(where={"id": jokeId})
-    if joke is None:
+    skipped = await _apply_decisions(
+        {jokeId: decision.upper() == "APPROVED"}, moderator, pending_only=False
+    )
+    if jokeId in skipped:
         return ReviewJokeResponse(
-            success=False,
-            message=f"Joke with ID {jokeId} not found.",
-            jokeId=jokeId,
-            decision=decision,
+            success=False, message=skipped[jokeId], jokeId=jokeId, decision=decision
         )
-    update_data = {"approved": True if decision == "APPROVED" else False}
-    await prisma.models.Joke.prisma().update(where={"id": jokeId}, data=update_data)
-    mod_status = (
-        prisma.enums.ModerationStatus.APPROVED
-        if decision == "APPROVED"
-        else prisma.enums.ModerationStatus.REJECTED
-    )
-    await prisma.models.ModerationQueue.prisma().update_many(
-        where={"jokeId": jokeId}, data={"status": mod_status}
-    )
     return ReviewJokeResponse(
         success=True,
         message=f"Joke {jokeId} has been {decision.lower()}.",
         jokeId=jokeId,
         decision=decision,
     )
+
+
+async def review_jokes(
+    decisions: List[ReviewDecision], moderator: str
+) -> BatchReviewResponse:
+    """
+    Applies many moderation decisions at once.
+
+    All valid decisions are applied in one transaction with one update per
+    outcome, whatever the batch size. Only pending jokes are reviewed, and jokes
+    claimed by another moderator are skipped; each skip is reported in
+    `results` rather than failing the batch. When a joke appears more than
+    once, its last decision wins.
+
+    Args:
+        decisions (List[ReviewDecision]): Up to MODERATION_BATCH_LIMIT decisions.
+        moderator (str): Identity of the reviewing moderator, from their access token.
+
+    Returns:
+        BatchReviewResponse: How many decisions were applied, and the outcome of each.
+    """
+    if len(decisions) > MODERATION_BATCH_LIMIT:
+        raise ValueError(
+            f"At most {MODERATION_BATCH_LIMIT} decisions can be reviewed at once."
+        )
+    results: Dict[str, ReviewJokeResponse] = {}
+    valid: Dict[str, bool] = {}
+    for item in decisions:
+        if item.decision.upper() not in ["APPROVED", "REJECTED"]:
+            valid.pop(item.jokeId, None)
+            results[item.jokeId] = ReviewJokeResponse(
+                success=False,
+                message="Invalid decision. Choices are 'APPROVED' or 'REJECTED'.",
+                jokeId=item.jokeId,
+                decision=item.decision,
+            )
+            continue
+        valid[item.jokeId] = item.decision.upper() == "APPROVED"
+        results[item.jokeId] = ReviewJokeResponse(
+            success=True,
+            message=f"Joke {item.jokeId} has been {item.decision.lower()}.",
+            jokeId=item.jokeId,
+            decision=item.decision,
+        )
+    skipped = (
+        await _apply_decisions(valid, moderator, pending_only=True) if valid else {}
+    )
+    for joke_id, message in skipped.items():
+        results[joke_id].success = False
+        results[joke_id].message = message
+    applied = len(valid) - len(skipped)
+    return BatchReviewResponse(
+        success=applied > 0 or not decisions,
+        message=f"{applied} of {len(results)} jokes reviewed.",
+        applied=applied,
+        results=list(results.values()),
+    )
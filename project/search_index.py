@@ -0,0 +1,161 @@
+import heapq
+import logging
+import os
+import re
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from project.joke_pool import JokePool, PooledJoke, joke_pool
+from project.shared_catalog import CATALOG_SNAPSHOT_DIR
+
+logger = logging.getLogger(__name__)
+
+# "memory" answers plain-word full-text searches from an inverted index over
+# the approved jokes in the pool instead of from PostgreSQL.
+JOKE_SEARCH_INDEX = os.getenv("JOKE_SEARCH_INDEX", "postgres")
+
+# The weights of a match in the setup and in the punchline, in the ratio of
+# `ts_rank`'s default A and B weights.
+SETUP_WEIGHT = 1.0
+PUNCHLINE_WEIGHT = 0.4
+
+WORD = re.compile(r"\w+")
+
+# Queries the index answers: words only, without the quotes, `or` and `-` of
+# `websearch_to_tsquery`. Its answers are not PostgreSQL's: words are matched
+# whole, without stemming or stop words, and scores are sums of the weights
+# below rather than `ts_rank`, so pages of one search are never mixed between
+# the two (see `search_jokes`).
+PLAIN_QUERY = re.compile(r"[\w\s]+")
+
+
+def terms(text: str) -> Set[str]:
+    return set(WORD.findall(text.lower()))
+
+
+class SearchIndex:
+    """
+    An inverted index over the approved jokes in a `JokePool`, by language.
+
+    Maps each (language, word) to the ids of the jokes whose setup, and
+    separately whose punchline, contain it. A search intersects the postings
+    of its words, starting from the shortest, so it costs about as much as
+    the rarest word has matches, whatever the size of the catalog. The pool
+    reports every change to it (see `JokePool.watch`), so the index follows
+    the pool without being rebuilt.
+
+    Words are matched whole and case-insensitively, without the stemming of
+    PostgreSQL's per-language dictionaries. Localizations are not indexed,
+    as they are not in the database's search index either.
+    """
+
+    def __init__(self, pool: JokePool) -> None:
+        self.pool = pool
+        self._jokes: Dict[str, PooledJoke] = {}
+        self._setups: Dict[Tuple[str, str], Set[str]] = {}
+        self._punchlines: Dict[Tuple[str, str], Set[str]] = {}
+        pool.watch(self)
+
+    @property
+    def ready(self) -> bool:
+        return self.pool.ready and self.pool.shared is None
+
+    def __len__(self) -> int:
+        return len(self._jokes)
+
+    def reset(self, jokes: Iterable[PooledJoke]) -> None:
+        self._jokes = {}
+        self._setups = {}
+        self._punchlines = {}
+        for joke in jokes:
+            self.update(joke.key, joke)
+
+    def update(self, key: str, joke: Optional[PooledJoke]) -> None:
+        """
+        Indexes the joke now served under `key`, or unindexes it when given None.
+        """
+        previous = self._jokes.pop(key, None)
+        if previous is not None:
+            self._unpost(self._setups, previous.language, previous.setup, key)
+            self._unpost(self._punchlines, previous.language, previous.punchline, key)
+        if joke is None or joke.localization_id is not None:
+            return
+        self._jokes[key] = joke
+        for term in terms(joke.setup):
+            self._setups.setdefault((joke.language, term), set()).add(key)
+        for term in terms(joke.punchline):
+            self._punchlines.setdefault((joke.language, term), set()).add(key)
+
+    @staticmethod
+    def _unpost(
+        postings: Dict[Tuple[str, str], Set[str]], language: str, text: str, key: str
+    ) -> None:
+        for term in terms(text):
+            keys = postings.get((language, term))
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del postings[(language, term)]
+
+    def search(
+        self,
+        query: str,
+        language: str,
+        limit: int,
+        after: Optional[Tuple[float, str]] = None,
+    ) -> Optional[List[Tuple[float, PooledJoke]]]:
+        """
+        Finds the jokes in a language containing every word of the query, best matches first.
+
+        Args:
+            query (str): The words to search for.
+            language (str): The language of the jokes to search.
+            limit (int): How many matches to return at most.
+            after (Optional[Tuple[float, str]]): The score and id of the last match of the previous page.
+
+        Returns:
+            Optional[List[Tuple[float, PooledJoke]]]: Scores and jokes ordered by score and then id, both descending, or None if the index cannot answer the query.
+        """
+        if not self.ready or not PLAIN_QUERY.fullmatch(query):
+            return None
+        words = terms(query)
+        if not words:
+            return None
+        matches: List[Tuple[Set[str], Set[str]]] = []
+        for word in words:
+            setups = self._setups.get((language, word), set())
+            punchlines = self._punchlines.get((language, word), set())
+            if not setups and not punchlines:
+                return []
+            matches.append((setups, punchlines))
+        matches.sort(key=lambda match: len(match[0]) + len(match[1]))
+        setups, punchlines = matches[0]
+        candidates = setups | punchlines
+        for setups, punchlines in matches[1:]:
+            candidates = {
+                key for key in candidates if key in setups or key in punchlines
+            }
+        scored = []
+        for key in candidates:
+            score = sum(
+                SETUP_WEIGHT if key in setups else PUNCHLINE_WEIGHT
+                for setups, _ in matches
+            )
+            if after is None or (score, key) < after:
+                scored.append((score, key))
+        return [
+            (score, self._jokes[key]) for score, key in heapq.nlargest(limit, scored)
+        ]
+
+
+def _create() -> Optional[SearchIndex]:
+    if JOKE_SEARCH_INDEX != "memory":
+        return None
+    if CATALOG_SNAPSHOT_DIR:
+        # Workers serving a shared snapshot hold no jokes of their own to
+        # index, and would page differently from the one that does.
+        logger.warning("JOKE_SEARCH_INDEX=memory is ignored with CATALOG_SNAPSHOT_DIR")
+        return None
+    return SearchIndex(joke_pool)
+
+
+search_index = _create()
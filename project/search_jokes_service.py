@@ -0,0 +1,173 @@
+import base64
+import json
+import os
+from typing import List, Optional, Tuple
+
+import prisma
+from project.search_index import search_index
+from pydantic import BaseModel
+
+JOKE_SEARCH_LIMIT = int(os.getenv("JOKE_SEARCH_LIMIT", "100"))
+
+SEARCH_MODES = ("fulltext", "fuzzy")
+
+# Matches of every word of the query, stemmed by the dictionary of the
+# language, ranked by `ts_rank`; the GIN index on "searchVector" finds them.
+FULLTEXT_MATCHES = """
+    SELECT "id", "setup", "punchline", "language", ts_rank("searchVector", query) AS "score"
+    FROM "Joke", websearch_to_tsquery(joke_search_config($1), $2) AS query
+    WHERE "approved" AND "language" = $1 AND "searchVector" @@ query
+"""
+
+# Setups or punchlines containing something similar to the query, misspelled
+# words included, ranked by trigram word similarity; the trigram GIN indexes
+# on "setup" and "punchline" find them.
+FUZZY_MATCHES = """
+    SELECT "id", "setup", "punchline", "language",
+        greatest(word_similarity($2, "setup"), word_similarity($2, "punchline")) AS "score"
+    FROM "Joke"
+    WHERE "approved" AND "language" = $1 AND ($2 <% "setup" OR $2 <% "punchline")
+"""
+
+
+class JokeSearchResult(BaseModel):
+    """
+    A joke matching a search, with how well it matches.
+    """
+
+    id: str
+    setup: str
+    punchline: str
+    language: str
+    score: float
+
+
+class JokeSearchResponse(BaseModel):
+    """
+    A page of search results, best matches first.
+    """
+
+    results: List[JokeSearchResult]
+    next_cursor: Optional[str] = None
+
+
+# Where a page of results came from: the in-memory index, or PostgreSQL in one
+# of the modes. Scores from each are on their own scale, so a cursor is only
+# valid against the source that issued it.
+MEMORY_SOURCE = "memory"
+
+
+def _encode_cursor(source: str, score: float, joke_id: str) -> str:
+    return base64.urlsafe_b64encode(
+        json.dumps([source, score, joke_id]).encode()
+    ).decode()
+
+
+def _decode_cursor(cursor: str) -> Tuple[str, float, str]:
+    try:
+        source, score, joke_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(source), float(score), str(joke_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid search cursor.")
+
+
+async def _search_database(
+    query: str,
+    language: str,
+    mode: str,
+    limit: int,
+    after: Optional[Tuple[float, str]],
+) -> List[dict]:
+    matches = FULLTEXT_MATCHES if mode == "fulltext" else FUZZY_MATCHES
+    args = [language, query, str(limit)]
+    keyset = ""
+    if after is not None:
+        # Keyset pagination: continue after the last result of the previous
+        # page in (score, id) order, so that pages neither skip nor repeat
+        # results as jokes come and go. Every match is still scored on each
+        # page, only fewer of them are returned.
+        keyset = 'WHERE ("score", "id") < ($4::real, $5)'
+        args += [repr(after[0]), after[1]]
+    return await prisma.get_client().query_raw(
+        f"""
+        SELECT "id", "setup", "punchline", "language", "score"::float8 AS "score"
+        FROM ({matches}) AS matches
+        {keyset}
+        ORDER BY "score" DESC, "id" DESC
+        LIMIT $3::int
+        """,
+        *args,
+    )
+
+
+async def search_jokes(
+    query: str,
+    language: str,
+    mode: str = "fulltext",
+    cursor: Optional[str] = None,
+    limit: int = 20,
+) -> JokeSearchResponse:
+    """
+    Searches the setups and punchlines of approved jokes in a language.
+
+    Full-text search matches every word of the query, stemmed with the
+    language's dictionary, and accepts web search syntax ("quoted phrases",
+    `or`, `-excluded`). Fuzzy search also matches misspelled words. With
+    JOKE_SEARCH_INDEX=memory, plain-word full-text searches are answered from
+    the in-memory index once the joke pool is loaded.
+
+    The index and PostgreSQL score matches differently, so a cursor records
+    which of them served its page, and the following pages are served by
+    the same one.
+
+    Args:
+        query (str): What to search for.
+        language (str): The language of the jokes to search.
+        mode (str): "fulltext" or "fuzzy".
+        cursor (Optional[str]): The `next_cursor` of the previous page, if any.
+        limit (int): How many results to return, up to JOKE_SEARCH_LIMIT.
+
+    Returns:
+        JokeSearchResponse: The page of results and the cursor of the next one, if there may be more.
+    """
+    query = query.strip()
+    if not query:
+        raise ValueError("A search query is required.")
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode: {mode}.")
+    if limit < 1 or limit > JOKE_SEARCH_LIMIT:
+        raise ValueError(f"limit must be between 1 and {JOKE_SEARCH_LIMIT}.")
+    source = None
+    after = None
+    if cursor:
+        source, score, joke_id = _decode_cursor(cursor)
+        after = (score, joke_id)
+        if source not in (mode, MEMORY_SOURCE) or (
+            source == MEMORY_SOURCE and mode != "fulltext"
+        ):
+            raise ValueError("The search cursor is for another search mode.")
+    hits = None
+    if source != mode and mode == "fulltext" and search_index is not None:
+        hits = search_index.search(query, language, limit, after)
+    if hits is None and source == MEMORY_SOURCE:
+        raise ValueError("The search cursor has expired; start the search again.")
+    if hits is not None:
+        source = MEMORY_SOURCE
+        results = [
+            JokeSearchResult(
+                id=joke.id,
+                setup=joke.setup,
+                punchline=joke.punchline,
+                language=joke.language,
+                score=score,
+            )
+            for score, joke in hits
+        ]
+    else:
+        source = mode
+        rows = await _search_database(query, language, mode, limit, after)
+        results = [JokeSearchResult(**row) for row in rows]
+    next_cursor = None
+    if len(results) == limit:
+        next_cursor = _encode_cursor(source, results[-1].score, results[-1].id)
+    return JokeSearchResponse(results=results, next_cursor=next_cursor)
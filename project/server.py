@@ -1,30 +1,136 @@
+import asyncio
 import logging
+import math
 from contextlib import asynccontextmanager
-from typing import Optional
+from typing import List, Optional
 
+import project.access_log_pipeline
+import project.analytics_rollup
 import project.authenticate_user_service
+import project.bulk_import_jokes_service
+import project.catalog_events
+import project.database
 import project.get_api_usage_stats_service
+import project.get_database_pool_stats_service
+import project.get_joke_batch_service
 import project.get_joke_in_language_service
 import project.get_performance_metrics_service
 import project.get_random_joke_service
+import project.get_readiness_service
+import project.http_caching
+import project.instrumentation
+import project.joke_pool
+import project.json_encoding
+import project.moderation_queue_service
+import project.near_duplicates
+import project.password_hashing
+import project.prometheus
 import project.rate_limit_check_service
+import project.rate_limiter
 import project.review_joke_service
+import project.search_jokes_service
+import project.shared_catalog
 import project.submit_joke_for_review_service
-from fastapi import FastAPI
+import project.token_validation
+import project.usage_leaderboard
+import project.warmup
+from fastapi import Depends, FastAPI, Query, Request
 from fastapi.encoders import jsonable_encoder
-from fastapi.responses import Response
-from prisma import Prisma
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 
 logger = logging.getLogger(__name__)
 
-db_client = Prisma(auto_register=True)
+db_client = project.database.create_client()
+
+
+async def _connect_database() -> None:
+    await db_client.connect()
+
+
+async def _load_catalog() -> None:
+    await project.catalog_events.catalog_events.start()
+    await project.shared_catalog.catalog_sharing.start()
+
+
+async def _start_analytics() -> None:
+    project.instrumentation.add_observer(
+        project.access_log_pipeline.access_log_pipeline.record
+    )
+    project.access_log_pipeline.access_log_pipeline.start()
+    await project.usage_leaderboard.usage_leaderboard.load()
+    project.instrumentation.add_observer(
+        project.usage_leaderboard.usage_leaderboard.observe
+    )
+    project.usage_leaderboard.usage_leaderboard.start()
+    project.instrumentation.add_observer(
+        project.analytics_rollup.analytics_rollup.observe
+    )
+    project.analytics_rollup.analytics_rollup.start()
+
+
+async def _start_moderation() -> None:
+    project.near_duplicates.near_duplicate_index.start()
+
+
+async def _load_auth() -> None:
+    # Imports passlib and its bcrypt backend ahead of the first login.
+    await asyncio.to_thread(project.authenticate_user_service.crypt_context)
+
+
+def _unavailable(e: Exception) -> JSONResponse:
+    # A bounded resource (database connections, password hashing) is saturated
+    # and the request was turned away rather than queued; it may be retried.
+    logger.warning("Rejecting request: %s", e)
+    return JSONResponse(
+        content={"error": str(e)}, status_code=503, headers={"Retry-After": "1"}
+    )
+
+
+project.warmup.warmup.add("database", _connect_database)
+project.warmup.warmup.add("catalog", _load_catalog)
+project.warmup.warmup.add("analytics", _start_analytics, required=False)
+project.warmup.warmup.add("moderation", _start_moderation, required=False)
+project.warmup.warmup.add("auth", _load_auth, required=False)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    await db_client.connect()
+    project.catalog_events.catalog_events.subscribe(
+        project.joke_pool.joke_pool.apply_event
+    )
+    project.catalog_events.catalog_events.subscribe(
+        project.near_duplicates.near_duplicate_index.apply_event
+    )
+    project.catalog_events.catalog_events.subscribe(
+        project.shared_catalog.catalog_sharing.forward
+    )
+    project.prometheus.metrics_exporter.start()
+    if project.warmup.FAST_START:
+        project.warmup.warmup.start()
+    else:
+        await project.warmup.warmup.run()
     yield
-    await db_client.disconnect()
+    await project.warmup.warmup.stop()
+    await project.prometheus.metrics_exporter.stop()
+    project.instrumentation.remove_observer(
+        project.analytics_rollup.analytics_rollup.observe
+    )
+    await project.analytics_rollup.analytics_rollup.stop()
+    project.instrumentation.remove_observer(
+        project.usage_leaderboard.usage_leaderboard.observe
+    )
+    await project.usage_leaderboard.usage_leaderboard.stop()
+    project.instrumentation.remove_observer(
+        project.access_log_pipeline.access_log_pipeline.record
+    )
+    await project.access_log_pipeline.access_log_pipeline.stop()
+    await project.near_duplicates.near_duplicate_index.stop()
+    await project.shared_catalog.catalog_sharing.stop()
+    await project.catalog_events.catalog_events.stop()
+    await project.rate_limiter.rate_limiter.close()
+    project.authenticate_user_service.password_hasher.shutdown()
+    if db_client.is_connected():
+        await db_client.disconnect()
 
 
 app = FastAPI(
@@ -33,17 +139,34 @@ app = FastAPI(
     description="Based on the information gathered, it is understood that the user prefers knock-knock jokes. To fulfill this requirement, it's recommended to develop a single API that returns one knock-knock joke upon request. Given the tech stack specified, here's a succinct plan for this project:\n\n1. **Programming Language**: Utilize Python, a widely used and powerful programming language that is well-suited for web API development.\n\n2. **API Framework**: Implement the API using FastAPI. This modern, fast (high-performance) web framework for building APIs with Python 3.7+ is ideal for quickly creating a joke API thanks to its easy-to-use route declarations that allow for asynchronous handling and its automatic Swagger documentation generation.\n\n3. **Database**: Store the jokes in PostgreSQL. This robust, open-source object-relational database system offers reliability, feature robustness, and performance for storing and retrieving jokes.\n\n4. **ORM (Object-Relational Mapping)**: Utilize Prisma with Python as the ORM to interface with the PostgreSQL database. Prisma's approach to database interaction is developer-friendly and can simplify database operations, such as fetching a random knock-knock joke for the API to serve.\n\nThe API will have a simple endpoint, such as `/joke`, which when accessed will query the database using Prisma to retrieve and return a random knock-knock joke. This design ensures that the API remains scalable, maintainable, and easy to use, both for developers integrating this API into their applications and for end-users looking for a quick laugh.\n\nRemember, this implementation plan is based on preference for knock-knock jokes and utilizes a specified technology stack. The choice of the JokeAPI as a potential source during the research phase suggests exploring existing services; however, creating a custom API offers the advantage of personalized joke selection and the flexibility of future expansions, such as adding categories.",
 )
 
+# FastAPI 0.85 does not forward its `lifespan` argument to the router.
+app.router.lifespan_context = lifespan
+app.router.route_class = project.instrumentation.InstrumentedRoute
+project.instrumentation.add_observer(project.prometheus.metrics_exporter.observe)
+
+app.add_middleware(
+    project.rate_limiter.RateLimitMiddleware,
+    limiter=project.rate_limiter.rate_limiter,
+    exempt_paths=["/security/rate_limit", "/metrics", "/ready"],
+)
+
 
 @app.get("/joke", response_model=project.get_random_joke_service.RandomJokeResponse)
 async def api_get_get_random_joke(
+    request: Request,
     language: str,
 ) -> project.get_random_joke_service.RandomJokeResponse | Response:
     """
     Fetches a random knock-knock joke.
     """
+    cache = project.http_caching.joke_cache
     try:
-        res = await project.get_random_joke_service.get_random_joke(language)
-        return res
+        res = await project.get_random_joke_service.get_random_joke_json(
+            language, await project.rate_limiter.rate_limiter.client_key(request.scope)
+        )
+        return project.json_encoding.json_response(res, headers=cache.headers())
+    except project.database.PoolExhausted as e:
+        return _unavailable(e)
     except Exception as e:
         logger.exception("Error processing request")
         res = dict()
@@ -70,6 +193,46 @@ async def api_post_submit_joke_for_review(
             punchline, setup, submitterId, language
         )
         return res
+    except project.database.PoolExhausted as e:
+        return _unavailable(e)
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=jsonable_encoder(res),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.post(
+    "/moderation/bulk_import",
+    response_model=project.bulk_import_jokes_service.BulkImportResponse,
+)
+async def api_post_bulk_import_jokes(
+    request: Request,
+    format: Optional[str] = None,
+    submitterId: Optional[str] = None,
+    resume_from_line: int = 0,
+    claims: dict = Depends(project.token_validation.require_token),
+) -> project.bulk_import_jokes_service.BulkImportResponse | Response:
+    """
+    Streams an NDJSON or CSV body of jokes into the moderation queue in batches.
+    """
+    try:
+        if format is None:
+            content_type = request.headers.get("content-type", "")
+            format = "csv" if content_type.startswith("text/csv") else "ndjson"
+        res = await project.bulk_import_jokes_service.bulk_import_jokes(
+            project.bulk_import_jokes_service.iter_lines(request.stream()),
+            format,
+            submitterId,
+            resume_from_line,
+        )
+        return res
+    except project.database.PoolExhausted as e:
+        return _unavailable(e)
     except Exception as e:
         logger.exception("Error processing request")
         res = dict()
@@ -85,14 +248,114 @@ async def api_post_submit_joke_for_review(
     "/joke/{language}", response_model=project.get_joke_in_language_service.JokeResponse
 )
 async def api_get_get_joke_in_language(
+    request: Request,
     language: str,
 ) -> project.get_joke_in_language_service.JokeResponse | Response:
     """
     Fetches a random joke in the specified language.
     """
+    cache = project.http_caching.joke_cache
     try:
-        res = await project.get_joke_in_language_service.get_joke_in_language(language)
+        res = await project.get_joke_in_language_service.get_joke_in_language_json(
+            language, await project.rate_limiter.rate_limiter.client_key(request.scope)
+        )
+        return project.json_encoding.json_response(res, headers=cache.headers())
+    except project.database.PoolExhausted as e:
+        return _unavailable(e)
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=jsonable_encoder(res),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.get("/jokes", response_model=project.get_joke_batch_service.JokeBatchResponse)
+async def api_get_get_joke_batch(
+    request: Request,
+    count: int = 10,
+    language: List[str] = Query(
+        [project.get_joke_in_language_service.JOKE_DEFAULT_LANGUAGE]
+    ),
+    format: Optional[str] = None,
+) -> project.get_joke_batch_service.JokeBatchResponse | Response:
+    """
+    Fetches up to `count` distinct random jokes, taking turns between the given languages.
+
+    Sent as NDJSON, one joke per line, with `format=ndjson` or an
+    `Accept: application/x-ndjson` header; larger batches are allowed then.
+    """
+    client = await project.rate_limiter.rate_limiter.client_key(request.scope)
+    try:
+        if format is None:
+            accept = request.headers.get("accept", "")
+            format = "ndjson" if "application/x-ndjson" in accept else "json"
+        project.get_joke_batch_service.check_batch(count, format)
+        # Each joke counts as a request; the middleware has counted one.
+        state = await project.rate_limiter.rate_limiter.hit(client, count - 1)
+        if not state.allowed:
+            return JSONResponse(
+                content={"error": "Rate limit exceeded"},
+                status_code=429,
+                headers={
+                    **project.rate_limiter.rate_limit_headers(state),
+                    "Retry-After": str(math.ceil(state.reset_after)),
+                },
+            )
+        headers = project.rate_limiter.rate_limit_headers(state)
+        if format == "ndjson":
+            stream = await project.get_joke_batch_service.stream_joke_batch(
+                count, language, client
+            )
+            return StreamingResponse(
+                stream, media_type="application/x-ndjson", headers=headers
+            )
+        res = await project.get_joke_batch_service.get_joke_batch_json(
+            count, language, client
+        )
+        return project.json_encoding.json_response(res, headers=headers)
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+    except project.database.PoolExhausted as e:
+        return _unavailable(e)
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=jsonable_encoder(res),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.get(
+    "/jokes/search", response_model=project.search_jokes_service.JokeSearchResponse
+)
+async def api_get_search_jokes(
+    q: str,
+    language: str = project.get_joke_in_language_service.JOKE_DEFAULT_LANGUAGE,
+    mode: str = "fulltext",
+    cursor: Optional[str] = None,
+    limit: int = 20,
+) -> project.search_jokes_service.JokeSearchResponse | Response:
+    """
+    Searches approved jokes in a language by the words of their setup and punchline.
+
+    Pages are fetched by passing the `next_cursor` of one page as `cursor`.
+    """
+    try:
+        res = await project.search_jokes_service.search_jokes(
+            q, language, mode, cursor, limit
+        )
         return res
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+    except project.database.PoolExhausted as e:
+        return _unavailable(e)
     except Exception as e:
         logger.exception("Error processing request")
         res = dict()
@@ -108,13 +371,19 @@ async def api_get_get_joke_in_language(
     "/security/rate_limit",
     response_model=project.rate_limit_check_service.RateLimitCheckResponse,
 )
-async def api_get_rate_limit_check() -> project.rate_limit_check_service.RateLimitCheckResponse | Response:
+async def api_get_rate_limit_check(
+    request: Request,
+) -> project.rate_limit_check_service.RateLimitCheckResponse | Response:
     """
     Checks and reports on the current rate limit status of the user.
     """
     try:
-        res = await project.rate_limit_check_service.rate_limit_check()
+        res = await project.rate_limit_check_service.rate_limit_check(
+            await project.rate_limiter.rate_limiter.client_key(request.scope)
+        )
         return res
+    except project.database.PoolExhausted as e:
+        return _unavailable(e)
     except Exception as e:
         logger.exception("Error processing request")
         res = dict()
@@ -130,13 +399,21 @@ async def api_get_rate_limit_check() -> project.rate_limit_check_service.RateLim
     "/analytics/usage",
     response_model=project.get_api_usage_stats_service.GetApiUsageStatsResponse,
 )
-async def api_get_get_api_usage_stats() -> project.get_api_usage_stats_service.GetApiUsageStatsResponse | Response:
+async def api_get_get_api_usage_stats(
+    request: Request, response: Response, limit: int = 10
+) -> project.get_api_usage_stats_service.GetApiUsageStatsResponse | Response:
     """
     Provides statistics on API usage.
     """
+    cache = project.http_caching.usage_cache
     try:
-        res = await project.get_api_usage_stats_service.get_api_usage_stats()
+        if cache.is_fresh(request):
+            return cache.not_modified()
+        res = await project.get_api_usage_stats_service.get_api_usage_stats(limit)
+        response.headers.update(cache.headers())
         return res
+    except project.database.PoolExhausted as e:
+        return _unavailable(e)
     except Exception as e:
         logger.exception("Error processing request")
         res = dict()
@@ -153,14 +430,136 @@ async def api_get_get_api_usage_stats() -> project.get_api_usage_stats_service.G
     response_model=project.review_joke_service.ReviewJokeResponse,
 )
 async def api_put_review_joke(
-    jokeId: str, decision: str
+    jokeId: str,
+    decision: str,
+    claims: dict = Depends(project.authenticate_user_service.require_moderator),
 ) -> project.review_joke_service.ReviewJokeResponse | Response:
     """
     Review and approve or reject a joke submission.
     """
     try:
-        res = await project.review_joke_service.review_joke(jokeId, decision)
+        res = await project.review_joke_service.review_joke(
+            jokeId, decision, claims["sub"]
+        )
         return res
+    except project.database.PoolExhausted as e:
+        return _unavailable(e)
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=jsonable_encoder(res),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.post(
+    "/moderation/review",
+    response_model=project.review_joke_service.BatchReviewResponse,
+)
+async def api_post_review_jokes(
+    body: project.review_joke_service.BatchReviewRequest,
+    claims: dict = Depends(project.authenticate_user_service.require_moderator),
+) -> project.review_joke_service.BatchReviewResponse | Response:
+    """
+    Applies many moderation decisions in one transaction.
+    """
+    try:
+        res = await project.review_joke_service.review_jokes(
+            body.decisions, claims["sub"]
+        )
+        return res
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+    except project.database.PoolExhausted as e:
+        return _unavailable(e)
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=jsonable_encoder(res),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.get(
+    "/moderation/pending",
+    response_model=project.moderation_queue_service.PendingJokesResponse,
+)
+async def api_get_list_pending_jokes(
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    claims: dict = Depends(project.authenticate_user_service.require_moderator),
+) -> project.moderation_queue_service.PendingJokesResponse | Response:
+    """
+    Lists jokes awaiting moderation, oldest first, one keyset page at a time.
+    """
+    try:
+        res = await project.moderation_queue_service.list_pending_jokes(cursor, limit)
+        return res
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+    except project.database.PoolExhausted as e:
+        return _unavailable(e)
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=jsonable_encoder(res),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.post(
+    "/moderation/claim",
+    response_model=project.moderation_queue_service.ClaimPendingJokesResponse,
+)
+async def api_post_claim_pending_jokes(
+    limit: Optional[int] = None,
+    claims: dict = Depends(project.authenticate_user_service.require_moderator),
+) -> project.moderation_queue_service.ClaimPendingJokesResponse | Response:
+    """
+    Leases the oldest unclaimed pending jokes to the calling moderator.
+    """
+    try:
+        res = await project.moderation_queue_service.claim_pending_jokes(
+            claims["sub"], limit
+        )
+        return res
+    except project.database.PoolExhausted as e:
+        return _unavailable(e)
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=jsonable_encoder(res),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.delete(
+    "/moderation/claim",
+    response_model=project.moderation_queue_service.ReleaseClaimsResponse,
+)
+async def api_delete_release_claims(
+    claims: dict = Depends(project.authenticate_user_service.require_moderator),
+) -> project.moderation_queue_service.ReleaseClaimsResponse | Response:
+    """
+    Hands the calling moderator's leased jokes back to the queue.
+    """
+    try:
+        res = await project.moderation_queue_service.release_claims(claims["sub"])
+        return res
+    except project.database.PoolExhausted as e:
+        return _unavailable(e)
     except Exception as e:
         logger.exception("Error processing request")
         res = dict()
@@ -187,6 +586,85 @@ async def api_post_authenticate_user(
             username_or_email, password
         )
         return res
+    except (
+        project.password_hashing.PasswordPoolSaturated,
+        project.database.PoolExhausted,
+    ) as e:
+        return _unavailable(e)
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=jsonable_encoder(res),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.get(
+    "/analytics/database",
+    response_model=project.get_database_pool_stats_service.DatabasePoolStatsResponse,
+)
+async def api_get_get_database_pool_stats() -> (
+    project.get_database_pool_stats_service.DatabasePoolStatsResponse | Response
+):
+    """
+    Reports connection pool saturation for this process.
+    """
+    try:
+        res = await project.get_database_pool_stats_service.get_database_pool_stats()
+        return res
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=jsonable_encoder(res),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.get("/ready", response_model=project.get_readiness_service.ReadinessResponse)
+async def api_get_get_readiness() -> (
+    project.get_readiness_service.ReadinessResponse | Response
+):
+    """
+    Reports whether the process is ready to serve, answering 503 until it is.
+
+    Meant for load balancer and autoscaler readiness probes; the body shows
+    the progress of each startup stage.
+    """
+    try:
+        res = await project.get_readiness_service.get_readiness()
+        if not res.ready:
+            return JSONResponse(
+                content=jsonable_encoder(res),
+                status_code=503,
+                headers={"Retry-After": "1"},
+            )
+        return res
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=jsonable_encoder(res),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.get("/metrics", include_in_schema=False)
+async def api_get_metrics() -> Response:
+    """
+    Prometheus text exposition of request, database, cache and event loop metrics.
+    """
+    exporter = project.prometheus.metrics_exporter
+    try:
+        content = await asyncio.to_thread(exporter.render, exporter.collect())
+        return Response(content=content, media_type=project.prometheus.CONTENT_TYPE)
     except Exception as e:
         logger.exception("Error processing request")
         res = dict()
@@ -202,13 +680,25 @@ async def api_post_authenticate_user(
     "/analytics/performance",
     response_model=project.get_performance_metrics_service.PerformanceMetricsResponse,
 )
-async def api_get_get_performance_metrics() -> project.get_performance_metrics_service.PerformanceMetricsResponse | Response:
+async def api_get_get_performance_metrics(
+    request: Request, response: Response, window: str = "24h"
+) -> project.get_performance_metrics_service.PerformanceMetricsResponse | Response:
     """
     Provides metrics on API performance.
     """
+    cache = project.http_caching.performance_cache
     try:
-        res = await project.get_performance_metrics_service.get_performance_metrics()
+        if cache.is_fresh(request):
+            return cache.not_modified()
+        res = await project.get_performance_metrics_service.get_performance_metrics(
+            window
+        )
+        response.headers.update(cache.headers())
         return res
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+    except project.database.PoolExhausted as e:
+        return _unavailable(e)
     except Exception as e:
         logger.exception("Error processing request")
         res = dict()
@@ -0,0 +1,230 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import time
+from dataclasses import asdict
+from typing import Optional
+
+from project.catalog_events import (
+    CATALOG_EVENTS_BACKEND,
+    ORIGIN,
+    CatalogEvent,
+)
+from project.catalog_snapshot import CatalogStamp, SharedCatalog, write_catalog
+from project.joke_pool import JokePool, joke_pool
+
+logger = logging.getLogger(__name__)
+
+# Directory, preferably on a tmpfs such as /dev/shm, through which worker
+# processes share one copy of the catalog. Unset, each process loads its own.
+CATALOG_SNAPSHOT_DIR = os.getenv("CATALOG_SNAPSHOT_DIR")
+
+# How often the building worker publishes changes and the others look for them.
+CATALOG_SNAPSHOT_SECONDS = float(os.getenv("CATALOG_SNAPSHOT_SECONDS", "1"))
+
+
+class CatalogSharing:
+    """
+    Builds the joke catalog in one worker and shares it with the others as a memory-mapped snapshot.
+
+    Workers race for an exclusive lock on `leader.lock` in the snapshot
+    directory. The winner loads its pool from the database and keeps it
+    current as a single process would (periodic refreshes and catalog
+    events), and writes a new snapshot whenever the pool has changed, at
+    most every CATALOG_SNAPSHOT_SECONDS. The other workers map the newest
+    snapshot and serve from it, polling its stamp at the same interval. The
+    lock is released when the leader exits, and the next worker to try it
+    takes over.
+
+    Followers do not patch the snapshot they serve, so a moderation decision
+    they handle has to reach the leader. With CATALOG_EVENTS_BACKEND=postgres
+    it does so through NOTIFY; otherwise `forward()` drops the event as a
+    file in the `events` subdirectory, which the leader applies on its next
+    sync, before publishing.
+
+    Without a snapshot directory, `start()` and `stop()` just warm and stop
+    the pool.
+    """
+
+    def __init__(
+        self,
+        pool: JokePool,
+        directory: Optional[str] = CATALOG_SNAPSHOT_DIR,
+        interval: float = CATALOG_SNAPSHOT_SECONDS,
+    ) -> None:
+        self.pool = pool
+        self.directory = directory
+        self.interval = interval
+        self._stamp: Optional[CatalogStamp] = None
+        self._lock_fd: Optional[int] = None
+        self._published_version: Optional[int] = None
+        self._generation = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def leader(self) -> bool:
+        return self._lock_fd is not None
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def forward(self, event: CatalogEvent) -> None:
+        """
+        Hands a moderation decision made in this follower to the leader.
+
+        Subscribed to the catalog event bus. Does nothing in the leader, for
+        events received from other processes, or when the postgres backend
+        already delivers events to every process.
+        """
+        if (
+            not self.directory
+            or self.leader
+            or event.origin != ORIGIN
+            or CATALOG_EVENTS_BACKEND == "postgres"
+        ):
+            return
+        # Named so that the leader applies events in the order they were made;
+        # written under a temporary name so that it never reads half a file.
+        name = f"{time.time_ns():020d}-{os.getpid()}-{event.joke_id}.json"
+        os.makedirs(self._path("events"), exist_ok=True)
+        path = self._path(os.path.join("events", name))
+        with open(path + ".tmp", "w") as f:
+            json.dump(asdict(event), f)
+        os.replace(path + ".tmp", path)
+
+    def _apply_forwarded(self) -> None:
+        directory = self._path("events")
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                with open(path) as f:
+                    event = CatalogEvent(**json.load(f))
+            except (TypeError, ValueError):
+                logger.warning("Ignoring malformed forwarded catalog event %s", name)
+            else:
+                self.pool.apply_event(event)
+            os.remove(path)
+
+    def _try_lead(self) -> bool:
+        fd = os.open(self._path("leader.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        logger.info("Worker %d builds the shared joke catalog", os.getpid())
+        return True
+
+    async def _build(self) -> None:
+        # A worker taking over keeps serving the snapshot it has mapped until
+        # its own pool is loaded.
+        await self.pool.warm()
+        self.pool.attach(None)
+        self.pool.start()
+
+    async def publish(self) -> None:
+        """
+        Writes the leader's pool as a new snapshot if it changed since the last one.
+        """
+        version = self.pool.version
+        if version == self._published_version:
+            return
+        generation = max(self._stamp.read(), self._generation) + 1
+        name = f"catalog-{generation}.bin"
+        await asyncio.to_thread(
+            write_catalog,
+            self._path(name),
+            generation,
+            len(self.pool),
+            self.pool.entries(),
+            self.pool.weighted,
+        )
+        self._stamp.write(generation)
+        self._generation = generation
+        self._published_version = version
+        # Workers still reading an older snapshot keep their mapping of it
+        # after it is unlinked.
+        for entry in os.scandir(self.directory):
+            if (
+                entry.name.startswith("catalog-")
+                and entry.name.endswith(".bin")
+                and entry.name != name
+            ):
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+
+    def _follow(self) -> bool:
+        """
+        Maps the newest snapshot if it is not the one being served.
+
+        Returns:
+            bool: Whether a snapshot is being served.
+        """
+        generation = self._stamp.read()
+        current = self.pool.shared
+        if generation and (current is None or current.generation != generation):
+            try:
+                self.pool.attach(SharedCatalog(self._path(f"catalog-{generation}.bin")))
+            except FileNotFoundError:
+                # Already replaced by a newer one; picked up on the next poll.
+                pass
+            except ValueError:
+                # Written by an older version of the app; the leader replaces it.
+                logger.warning("Ignoring unreadable catalog snapshot %d", generation)
+        return self.pool.shared is not None
+
+    async def _sync(self) -> bool:
+        if self.leader or self._try_lead():
+            if self._published_version is None:
+                await self._build()
+            self._apply_forwarded()
+            await self.publish()
+            return True
+        return self._follow()
+
+    async def _sync_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self._sync()
+            except Exception:
+                logger.exception("Error syncing the shared joke catalog")
+
+    async def start(self) -> None:
+        """
+        Loads or maps the catalog, returning once this worker can serve it.
+        """
+        if not self.directory:
+            await self.pool.warm()
+            self.pool.start()
+            return
+        if self._task is not None:
+            return
+        os.makedirs(self._path("events"), exist_ok=True)
+        self._stamp = CatalogStamp(self._path("catalog.stamp"))
+        while not await self._sync():
+            await asyncio.sleep(self.interval)
+        self._task = asyncio.create_task(self._sync_forever())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.pool.stop()
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+
+catalog_sharing = CatalogSharing(joke_pool)
@@ -3,6 +3,11 @@ from typing import Optional
 import prisma
 import prisma.enums
 import prisma.models
+from project.near_duplicates import (
+    JOKE_DUPLICATE_CHECK,
+    near_duplicate_index,
+    signature,
+)
 from pydantic import BaseModel
 
 
@@ -14,6 +19,7 @@ class SubmitJokeForReviewResponse(BaseModel):
     success: bool
     message: str
     jokeId: Optional[str] = None
+    duplicateOfId: Optional[str] = None
 
 
 async def submit_joke_for_review(
@@ -22,6 +28,11 @@ async def submit_joke_for_review(
     """
     Submits a new joke to the moderation queue.
 
+    Unless JOKE_DUPLICATE_CHECK is "off", the joke is first looked up in the
+    near-duplicate index of approved and pending jokes. A near-duplicate is
+    turned away with JOKE_DUPLICATE_CHECK=reject, and otherwise queued with
+    `duplicateOfId` set so that moderators can dismiss it quickly.
+
     Args:
     setup (str): The setup part of the joke.
     punchline (str): The punchline of the joke.
@@ -33,6 +44,18 @@ async def submit_joke_for_review(
     """
     if not language:
         language = "en"
+    sig = None
+    duplicate = None
+    if JOKE_DUPLICATE_CHECK != "off":
+        sig = signature(setup, punchline)
+        duplicate = near_duplicate_index.find(sig)
+    if duplicate is not None and JOKE_DUPLICATE_CHECK == "reject":
+        return SubmitJokeForReviewResponse(
+            success=False,
+            message="This joke has already been submitted.",
+            duplicateOfId=duplicate[0],
+        )
+    duplicate_of = duplicate[0] if duplicate is not None else None
     try:
         joke = await prisma.models.Joke.prisma().create(
             data={
@@ -41,14 +64,24 @@ async def submit_joke_for_review(
                 "language": language,
                 "createdByUserId": submitterId,
                 "moderationQueues": {
-                    "create": {"status": prisma.enums.ModerationStatus.PENDING}
+                    "create": {
+                        "status": prisma.enums.ModerationStatus.PENDING,
+                        "duplicateOfId": duplicate_of,
+                    }
                 },
             }
         )
+        if sig is not None:
+            near_duplicate_index.add(joke.id, sig)
         return SubmitJokeForReviewResponse(
             success=True,
-            message="Joke submitted for review successfully.",
+            message=(
+                "Joke submitted for review successfully."
+                if duplicate_of is None
+                else "Joke submitted for review; it closely resembles an existing joke."
+            ),
             jokeId=joke.id,
+            duplicateOfId=duplicate_of,
         )
     except Exception as e:
         return SubmitJokeForReviewResponse(
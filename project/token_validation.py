@@ -0,0 +1,187 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+SECRET_KEY = "a_very_secret_key"
+
+ALGORITHM = "HS256"
+
+# Comma-separated `kid:secret` pairs. The first pair signs new tokens unless
+# JWT_ACTIVE_KID names another; every listed key is accepted for validation.
+JWT_SIGNING_KEYS = os.getenv("JWT_SIGNING_KEYS", "")
+
+JWT_ACTIVE_KID = os.getenv("JWT_ACTIVE_KID", "")
+
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+
+DEFAULT_KID = "default"
+
+
+class InvalidToken(Exception):
+    """
+    Raised when a bearer token cannot be accepted.
+    """
+
+
+class KeyRing:
+    """
+    The HMAC keys tokens are signed and validated with, addressed by `kid`.
+
+    Rotating keys is a matter of adding the new key, making it active, and
+    removing the old one once the tokens it signed have expired. Every
+    process only needs the same key list; no session store is shared.
+    """
+
+    def __init__(self, keys: Dict[str, str], active_kid: str) -> None:
+        if active_kid not in keys:
+            raise ValueError(f"Active key id {active_kid!r} is not in the key ring")
+        self.keys = dict(keys)
+        self.active_kid = active_kid
+
+    @classmethod
+    def from_env(cls) -> "KeyRing":
+        keys: Dict[str, str] = {}
+        for pair in filter(None, (p.strip() for p in JWT_SIGNING_KEYS.split(","))):
+            kid, _, secret = pair.partition(":")
+            keys[kid] = secret
+        if not keys:
+            keys[DEFAULT_KID] = SECRET_KEY
+        return cls(keys, JWT_ACTIVE_KID or next(iter(keys)))
+
+    def signing_key(self) -> Tuple[str, str]:
+        return self.active_kid, self.keys[self.active_kid]
+
+    def get(self, kid: str) -> Optional[str]:
+        return self.keys.get(kid)
+
+
+class TokenCache:
+    """
+    Bounded LRU of verified token claims keyed by the SHA-256 digest of the token.
+
+    Entries are dropped once their `exp` has passed, so a cached token is never
+    accepted for longer than the token itself would be.
+    """
+
+    def __init__(self, maxsize: int = TOKEN_CACHE_SIZE) -> None:
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[bytes, Tuple[str, float, Dict[str, Any]]]" = (
+            OrderedDict()
+        )
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, digest: bytes, now: float) -> Optional[Tuple[str, Dict[str, Any]]]:
+        entry = self._entries.get(digest)
+        if entry is None:
+            self.misses += 1
+            return None
+        kid, expires_at, claims = entry
+        if expires_at <= now:
+            del self._entries[digest]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(digest)
+        self.hits += 1
+        return kid, claims
+
+    def put(
+        self, digest: bytes, kid: str, expires_at: float, claims: Dict[str, Any]
+    ) -> None:
+        self._entries[digest] = (kid, expires_at, claims)
+        self._entries.move_to_end(digest)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+class TokenValidator:
+    """
+    Validates bearer tokens from their signature and claims alone.
+
+    No database lookup is made. The signature of a given token is checked
+    once; after that its claims come from the cache until the token expires
+    or its signing key leaves the key ring.
+    """
+
+    def __init__(
+        self,
+        key_ring: KeyRing,
+        algorithm: str = ALGORITHM,
+        cache: Optional[TokenCache] = None,
+    ) -> None:
+        self.key_ring = key_ring
+        self.algorithm = algorithm
+        self.cache = cache if cache is not None else TokenCache()
+
+    def validate(self, token: str) -> Dict[str, Any]:
+        """
+        Returns the claims of a valid token.
+
+        Args:
+            token (str): The encoded JWT.
+
+        Returns:
+            Dict[str, Any]: The token's verified claims.
+
+        Raises:
+            InvalidToken: If the token is malformed, signed with an unknown key, tampered with or expired.
+        """
+        now = time.time()
+        digest = hashlib.sha256(token.encode()).digest()
+        cached = self.cache.get(digest, now)
+        if cached is not None:
+            kid, claims = cached
+            if self.key_ring.get(kid) is not None:
+                return claims
+        # Imported here rather than at startup, as most processes serve far
+        # more jokes than authenticated requests.
+        from jose import JWTError, jwt
+
+        try:
+            kid = jwt.get_unverified_header(token).get("kid") or DEFAULT_KID
+            secret = self.key_ring.get(kid)
+            if secret is None:
+                raise InvalidToken(f"Unknown signing key {kid!r}")
+            claims = jwt.decode(token, secret, algorithms=[self.algorithm])
+        except JWTError as e:
+            raise InvalidToken(str(e)) from e
+        expires_at = claims.get("exp")
+        if not isinstance(expires_at, (int, float)):
+            raise InvalidToken("Token has no expiry")
+        self.cache.put(digest, kid, float(expires_at), claims)
+        return claims
+
+
+key_ring = KeyRing.from_env()
+
+token_validator = TokenValidator(key_ring)
+
+bearer_scheme = HTTPBearer(auto_error=False)
+
+
+async def require_token(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme),
+) -> Dict[str, Any]:
+    """
+    FastAPI dependency that rejects requests without a valid bearer token.
+
+    Returns:
+        Dict[str, Any]: The verified claims of the caller's token; `sub` is the user's email.
+    """
+    if credentials is None:
+        raise HTTPException(
+            status_code=401,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    try:
+        return token_validator.validate(credentials.credentials)
+    except InvalidToken as e:
+        raise HTTPException(
+            status_code=401, detail=str(e), headers={"WWW-Authenticate": "Bearer"}
+        )
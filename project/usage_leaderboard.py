@@ -0,0 +1,224 @@
+import asyncio
+import bisect
+import logging
+import os
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import prisma
+import prisma.models
+from project.instrumentation import RequestRecord
+
+logger = logging.getLogger(__name__)
+
+USAGE_LEADERBOARD_SIZE = int(os.getenv("USAGE_LEADERBOARD_SIZE", "100"))
+
+USAGE_PERSIST_SECONDS = float(os.getenv("USAGE_PERSIST_SECONDS", "10"))
+
+
+@dataclass(slots=True)
+class EndpointUsage:
+    """
+    One endpoint's entry on the leaderboard.
+
+    `error` is the most `count` can overstate the true number of requests: it
+    is non-zero only for endpoints that took over the slot of an evicted one.
+    """
+
+    endpoint: str
+    count: int
+    last_access: datetime
+    error: int = 0
+
+
+class UsageLeaderboard:
+    """
+    Request counts per endpoint, kept in memory and ordered by count.
+
+    The board is a Space-Saving summary with room for `capacity` endpoints:
+    while there are at most that many distinct endpoints (the route templates,
+    in practice) every count is exact; past that, a new endpoint replaces the
+    least requested one and inherits its count, so the heavy hitters are never
+    lost. Entries are kept sorted, so the top N is a slice.
+
+    The board is the source of `Analytics.requestCount`. Requests observed
+    since the last write are folded into one increment per endpoint every
+    `persist_interval` seconds, after which the board is reloaded from the
+    table's top rows so that it also reflects the other processes' traffic.
+    """
+
+    def __init__(
+        self,
+        capacity: int = USAGE_LEADERBOARD_SIZE,
+        persist_interval: float = USAGE_PERSIST_SECONDS,
+    ) -> None:
+        self.capacity = capacity
+        self.persist_interval = persist_interval
+        self._entries: Dict[str, EndpointUsage] = {}
+        # Sorted by count, highest first; `_positions` indexes into it.
+        self._ranked: List[EndpointUsage] = []
+        self._positions: Dict[str, int] = {}
+        self._unpersisted: Counter = Counter()
+        self._last_access: Dict[str, datetime] = {}
+        self._analytics_ids: Dict[str, str] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.version = 0
+
+    def __len__(self) -> int:
+        return len(self._ranked)
+
+    def top(self, limit: int) -> List[EndpointUsage]:
+        return self._ranked[:limit]
+
+    def observe(self, record: RequestRecord) -> None:
+        """
+        Counts a handled request. Registered as a request observer.
+        """
+        access_time = datetime.fromtimestamp(record.finished_at, timezone.utc)
+        self._unpersisted[record.endpoint] += 1
+        self._last_access[record.endpoint] = access_time
+        self._add(record.endpoint, 1, access_time)
+
+    def _add(self, endpoint: str, count: int, last_access: datetime) -> None:
+        self.version += 1
+        entry = self._entries.get(endpoint)
+        if entry is not None:
+            entry.count += count
+            entry.last_access = max(entry.last_access, last_access)
+            self._promote(self._positions[endpoint])
+            return
+        if len(self._ranked) < self.capacity:
+            entry = EndpointUsage(endpoint, count, last_access)
+            self._positions[endpoint] = len(self._ranked)
+            self._ranked.append(entry)
+        else:
+            # Space-Saving: the newcomer takes over the least requested slot.
+            evicted = self._ranked[-1]
+            del self._entries[evicted.endpoint]
+            del self._positions[evicted.endpoint]
+            entry = EndpointUsage(
+                endpoint, evicted.count + count, last_access, error=evicted.count
+            )
+            self._positions[endpoint] = len(self._ranked) - 1
+            self._ranked[-1] = entry
+        self._entries[endpoint] = entry
+        self._promote(self._positions[endpoint])
+
+    def _promote(self, position: int) -> None:
+        entry = self._ranked[position]
+        # First entry ranked above `entry` with a lower count.
+        target = bisect.bisect_right(
+            self._ranked, -entry.count, hi=position, key=lambda e: -e.count
+        )
+        if target == position:
+            return
+        del self._ranked[position]
+        self._ranked.insert(target, entry)
+        for index in range(target, position + 1):
+            self._positions[self._ranked[index].endpoint] = index
+
+    async def load(self) -> None:
+        """
+        Rebuilds the board from the highest `Analytics.requestCount` rows.
+
+        Requests observed but not yet persisted are added on top, so nothing
+        counted locally disappears from the board when it is reloaded.
+        """
+        rows = await prisma.models.Analytics.prisma().find_many(
+            order={"requestCount": "desc"}, take=self.capacity
+        )
+        self._entries.clear()
+        self._ranked.clear()
+        self._positions.clear()
+        for row in rows:
+            self._add(
+                row.endpoint,
+                row.requestCount,
+                row.lastAccess or row.createdAt,
+            )
+        for endpoint, count in self._unpersisted.items():
+            self._add(endpoint, count, self._last_access[endpoint])
+
+    async def _resolve_analytics(self, endpoints: List[str]) -> None:
+        unknown = [
+            endpoint for endpoint in endpoints if endpoint not in self._analytics_ids
+        ]
+        if not unknown:
+            return
+        rows = await prisma.models.Analytics.prisma().find_many(
+            where={"endpoint": {"in": unknown}}
+        )
+        for row in rows:
+            self._analytics_ids[row.endpoint] = row.id
+        missing = [
+            endpoint for endpoint in unknown if endpoint not in self._analytics_ids
+        ]
+        if missing:
+            # Endpoints are unique, so a row another process created
+            # meanwhile is kept and read back below.
+            await prisma.models.Analytics.prisma().create_many(
+                data=[{"endpoint": endpoint} for endpoint in missing],
+                skip_duplicates=True,
+            )
+            rows = await prisma.models.Analytics.prisma().find_many(
+                where={"endpoint": {"in": missing}}
+            )
+            for row in rows:
+                self._analytics_ids[row.endpoint] = row.id
+
+    async def persist(self) -> None:
+        """
+        Writes the requests counted since the last write, then reloads the board.
+        """
+        counts, self._unpersisted = self._unpersisted, Counter()
+        if counts:
+            try:
+                await self._resolve_analytics(list(counts))
+                async with prisma.get_client().batch_() as batcher:
+                    for endpoint, count in counts.items():
+                        batcher.analytics.update(
+                            where={"id": self._analytics_ids[endpoint]},
+                            data={
+                                "requestCount": {"increment": count},
+                                "lastAccess": self._last_access[endpoint],
+                            },
+                        )
+            except Exception:
+                # Keep the counts for the next attempt.
+                self._unpersisted.update(counts)
+                self._analytics_ids.clear()
+                raise
+        for endpoint in counts:
+            if endpoint not in self._unpersisted:
+                del self._last_access[endpoint]
+        await self.load()
+
+    async def _persist_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.persist_interval)
+            try:
+                await self.persist()
+            except Exception:
+                logger.exception("Error persisting endpoint usage")
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._persist_forever())
+
+    async def stop(self) -> None:
+        """
+        Stops the background task and writes whatever has not been persisted.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.persist()
+
+
+usage_leaderboard = UsageLeaderboard()
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Serve requests as soon as the app is imported, and connect to the database,
+# load the catalog and start everything else in the background. Until the
+# catalog is loaded jokes are read from the database, and until the database
+# is connected queries wait for it.
+FAST_START = os.getenv("FAST_START", "").lower() in ("1", "true", "yes")
+
+# How long a fast start waits before retrying a required stage that failed.
+RETRY_SECONDS = 1.0
+
+WarmupStep = Callable[[], Awaitable[Any]]
+
+
+@dataclass
+class WarmupStage:
+    """
+    One step of bringing a process up, and how far it got.
+    """
+
+    name: str
+    step: WarmupStep
+    # Whether the process is only ready to serve once this stage is done.
+    required: bool = True
+    state: str = "pending"
+    seconds: Optional[float] = None
+    error: Optional[str] = None
+
+
+class Warmup:
+    """
+    Runs the stages of bringing a process up in order, recording their progress for `/ready`.
+
+    Normally the lifespan awaits `run()`, so nothing is served until every
+    stage is done. With FAST_START, `start()` runs them in a background task
+    instead, and the app serves requests while they complete; required
+    stages (database, catalog) come first, so the process is ready before
+    rarely used subsystems are brought up.
+
+    A required stage that fails stops a normal startup. With FAST_START it
+    is retried every RETRY_SECONDS instead, the process reporting itself not
+    ready meanwhile. Other stages that fail are logged and recorded, and the
+    app runs without them.
+    """
+
+    def __init__(self) -> None:
+        self.stages: List[WarmupStage] = []
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, name: str, step: WarmupStep, required: bool = True) -> None:
+        self.stages.append(WarmupStage(name, step, required))
+
+    @property
+    def ready(self) -> bool:
+        return all(s.state == "done" for s in self.stages if s.required)
+
+    async def run(self, retry: bool = False) -> None:
+        """
+        Runs every stage in order.
+
+        Args:
+            retry (bool): Retry failed required stages until they succeed, rather than raising.
+        """
+        self.started = time.monotonic()
+        self.finished = None
+        for stage in self.stages:
+            stage.state, stage.seconds, stage.error = "pending", None, None
+        for stage in self.stages:
+            stage.state = "running"
+            begun = time.perf_counter()
+            while True:
+                try:
+                    await stage.step()
+                    stage.state, stage.error = "done", None
+                    break
+                except Exception as e:
+                    logger.exception("Warm-up stage %s failed", stage.name)
+                    stage.state = "failed"
+                    stage.error = str(e)
+                    if not stage.required:
+                        break
+                    if not retry:
+                        raise
+                    await asyncio.sleep(RETRY_SECONDS)
+            stage.seconds = time.perf_counter() - begun
+        self.finished = time.monotonic()
+        logger.info(
+            "Warmed up in %.3fs (%s)",
+            self.finished - self.started,
+            ", ".join(f"{s.name} {s.seconds:.3f}s" for s in self.stages),
+        )
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run(retry=True))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+warmup = Warmup()
@@ -0,0 +1,65 @@
+-- Full-text search over jokes, applied after `prisma db push` and safe to re-run:
+--
+--   psql "$DATABASE_URL" -f search.sql
+--
+-- Prisma cannot declare generated columns, so `Joke.searchVector` is declared in
+-- schema.prisma as an unsupported type and turned into a generated column here. The
+-- trigram indexes used for fuzzy search are declared in schema.prisma.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- The text search configuration for a joke's language tag, ignoring subtags
+-- ('de-AT' uses 'german'). Languages without a stemmer use 'simple'.
+CREATE OR REPLACE FUNCTION joke_search_config(language text) RETURNS regconfig
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT CASE split_part(lower(language), '-', 1)
+        WHEN 'ar' THEN 'arabic'
+        WHEN 'da' THEN 'danish'
+        WHEN 'de' THEN 'german'
+        WHEN 'el' THEN 'greek'
+        WHEN 'en' THEN 'english'
+        WHEN 'es' THEN 'spanish'
+        WHEN 'fi' THEN 'finnish'
+        WHEN 'fr' THEN 'french'
+        WHEN 'ga' THEN 'irish'
+        WHEN 'hu' THEN 'hungarian'
+        WHEN 'id' THEN 'indonesian'
+        WHEN 'it' THEN 'italian'
+        WHEN 'lt' THEN 'lithuanian'
+        WHEN 'nb' THEN 'norwegian'
+        WHEN 'ne' THEN 'nepali'
+        WHEN 'nl' THEN 'dutch'
+        WHEN 'nn' THEN 'norwegian'
+        WHEN 'no' THEN 'norwegian'
+        WHEN 'pt' THEN 'portuguese'
+        WHEN 'ro' THEN 'romanian'
+        WHEN 'ru' THEN 'russian'
+        WHEN 'sv' THEN 'swedish'
+        WHEN 'ta' THEN 'tamil'
+        WHEN 'tr' THEN 'turkish'
+        ELSE 'simple'
+    END::regconfig
+$$;
+
+-- `prisma db push` creates the column as a plain one; replace it with the
+-- generated column once.
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'Joke'
+            AND column_name = 'searchVector'
+            AND is_generated = 'NEVER'
+    ) THEN
+        ALTER TABLE "Joke" DROP COLUMN "searchVector";
+    END IF;
+END
+$$;
+
+ALTER TABLE "Joke" ADD COLUMN IF NOT EXISTS "searchVector" tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector(joke_search_config("language"), "setup"), 'A')
+        || setweight(to_tsvector(joke_search_config("language"), "punchline"), 'B')
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS "Joke_searchVector_idx" ON "Joke" USING GIN ("searchVector");
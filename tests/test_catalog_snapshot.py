@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import project.joke_weights
+import pytest
+from project.catalog_snapshot import FIELDS, SharedCatalog, write_catalog
+
+
+def joke(id, language, created_at=None, localization_id=None):
+    return SimpleNamespace(
+        id=id,
+        setup=f"Knock, knock. Who's there? {id}.",
+        punchline=f"{id} ünïcode punchline",
+        language=language,
+        localization_id=localization_id,
+        random_joke_json=f'{{"id": "{id}"}}'.encode(),
+        joke_json=f'{{"joke": "{id}"}}'.encode(),
+        created_at=created_at,
+    )
+
+
+def read(catalog, language):
+    return [catalog.entry_at(language, i) for i in range(catalog.size(language))]
+
+
+def test_round_trip(tmp_path):
+    jokes = {
+        "en": [joke("a", "en"), joke("b", "en", localization_id="loc-b")],
+        "de": [joke("c", "de")],
+        "fr": [],
+    }
+    path = str(tmp_path / "catalog")
+    write_catalog(path, 7, 3, jokes)
+    catalog = SharedCatalog(path)
+
+    assert catalog.generation == 7
+    assert len(catalog) == 3
+    assert catalog.size("fr") == 0 and catalog.size("xx") == 0
+    for language, entries in jokes.items():
+        for original, shared in zip(entries, read(catalog, language)):
+            for field in FIELDS:
+                assert getattr(shared, field) == getattr(original, field)
+    assert [j.key for j in read(catalog, "en")] == ["a", "loc-b"]
+    assert catalog.pick("de").id == "c"
+    assert catalog.pick("fr") is None
+
+
+def test_rewriting_replaces_the_snapshot(tmp_path):
+    path = str(tmp_path / "catalog")
+    write_catalog(path, 1, 1, {"en": [joke("a", "en")]})
+    write_catalog(path, 2, 1, {"en": [joke("b", "en")]})
+    catalog = SharedCatalog(path)
+    assert catalog.generation == 2
+    assert [j.id for j in read(catalog, "en")] == ["b"]
+    assert not (tmp_path / "catalog.tmp").exists()
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "catalog"
+    path.write_bytes(b"NOTACATALOG" + bytes(64))
+    with pytest.raises(ValueError):
+        SharedCatalog(str(path))
+
+
+def test_weighted_entries_are_grouped_in_class_spans(tmp_path, monkeypatch):
+    monkeypatch.setattr(project.joke_weights, "JOKE_FRESHNESS_HALF_LIFE_DAYS", 30)
+    now = datetime.now(timezone.utc)
+    ages = {"new1": 0, "old1": 100, "new2": 1, "mid": 50, "old2": 101}
+    jokes = {
+        "en": [joke(id, "en", now - timedelta(days=age)) for id, age in ages.items()]
+    }
+    path = str(tmp_path / "catalog")
+    write_catalog(path, 1, 5, jokes, weighted=True)
+    catalog = SharedCatalog(path)
+
+    _, spans = catalog._classes["en"]
+    classes = {
+        id: project.joke_weights.freshness_class(now - timedelta(days=age))
+        for id, age in ages.items()
+    }
+    assert sorted(spans) == sorted(set(classes.values()))
+    entries = read(catalog, "en")
+    covered = []
+    for c, (offset, members) in spans.items():
+        span = entries[offset : offset + members]
+        assert {classes[j.id] for j in span} == {c}
+        covered += [j.id for j in span]
+    assert sorted(covered) == sorted(ages)
+    for _ in range(100):
+        assert 0 <= catalog.sample_weighted("en") < len(ages)
+    assert catalog.sample_weighted("fr") is None
@@ -0,0 +1,57 @@
+import asyncio
+
+import httpx
+import project.instrumentation
+import pytest
+from fastapi import Depends, FastAPI, HTTPException
+
+
+def forbid() -> None:
+    raise HTTPException(status_code=403)
+
+
+app = FastAPI()
+app.router.route_class = project.instrumentation.InstrumentedRoute
+
+
+@app.get("/joke")
+async def joke(language: str, count: int = 1) -> dict:
+    return {"language": language, "count": count}
+
+
+@app.get("/private", dependencies=[Depends(forbid)])
+async def private() -> dict:
+    return {}
+
+
+@pytest.fixture
+def records():
+    seen = []
+    project.instrumentation.add_observer(seen.append)
+    yield seen
+    project.instrumentation.remove_observer(seen.append)
+
+
+def get(path: str) -> httpx.Response:
+    async def send() -> httpx.Response:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+            return await c.get(path)
+
+    return asyncio.run(send())
+
+
+@pytest.mark.parametrize(
+    "path, status_code",
+    [
+        ("/joke?language=en", 200),
+        ("/joke", 422),
+        ("/joke?language=en&count=abc", 422),
+        ("/private", 403),
+    ],
+)
+def test_observers_see_the_status_sent(records, path, status_code):
+    assert get(path).status_code == status_code
+    assert [(r.endpoint, r.status_code) for r in records] == [
+        (path.split("?")[0], status_code)
+    ]
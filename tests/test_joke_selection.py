@@ -0,0 +1,21 @@
+import pytest
+from project.joke_selection import ClientCursor, Permutation
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 16, 17, 100, 1000, 4097])
+def test_permutation_is_a_bijection(size):
+    permutation = Permutation(size)
+    assert sorted(permutation[i] for i in range(size)) == list(range(size))
+
+
+def test_permutations_differ():
+    orders = {tuple(Permutation(50)[i] for i in range(50)) for _ in range(10)}
+    assert len(orders) > 1
+
+
+@pytest.mark.parametrize("size", [1, 7, 64, 300])
+def test_cursor_serves_every_index_once_per_cycle(size):
+    cursor = ClientCursor(size)
+    for _ in range(3):
+        cycle = [cursor.next_index() for _ in range(size)]
+        assert sorted(cycle) == list(range(size))
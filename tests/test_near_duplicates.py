@@ -0,0 +1,105 @@
+import itertools
+
+import pytest
+from project.near_duplicates import (
+    JOKE_DUPLICATE_THRESHOLD,
+    NearDuplicateIndex,
+    jaccard,
+    shingles,
+    signature,
+)
+
+JOKES = [
+    (
+        "Knock, knock. Who's there? Lettuce. Lettuce who?",
+        "Lettuce in, it's cold out here!",
+    ),
+    ("Knock, knock. Who's there? Boo. Boo who?", "Don't cry, it's only a joke!"),
+    ("Knock, knock. Who's there? Olive. Olive who?", "Olive you and I miss you!"),
+    ("Knock, knock. Who's there? Cow says. Cow says who?", "No silly, a cow says moo!"),
+    ("Knock, knock. Who's there? Atch. Atch who?", "Bless you!"),
+    ("Knock, knock. Who's there? Tank. Tank who?", "You're welcome!"),
+    ("Knock, knock. Who's there? Orange. Orange who?", "Orange you glad to see me?"),
+    ("Knock, knock. Who's there? Nobel. Nobel who?", "Nobel, that's why I knocked!"),
+    (
+        "Knock, knock. Who's there? Lettuce. Lettuce who?",
+        "Lettuce tell you some jokes!",
+    ),
+]
+
+REWORDINGS = [
+    (
+        JOKES[0],
+        (
+            "Knock knock. Who is there? Lettuce. Lettuce who?",
+            "Lettuce in, it's freezing out here!",
+        ),
+    ),
+    (
+        JOKES[1],
+        (
+            "Knock, knock. Who is there? Boo. Boo who?",
+            "Don't cry, it's just a joke!",
+        ),
+    ),
+    (
+        JOKES[2],
+        (
+            "Knock, knock! Who is there? Olive. Olive who?",
+            "Olive you, and I miss you so much!",
+        ),
+    ),
+    (
+        JOKES[7],
+        (
+            "Knock knock. Who's there? Nobel. Nobel who?",
+            "No bell, that's why I knocked!",
+        ),
+    ),
+]
+
+
+def similarity(a, b):
+    return jaccard(shingles(*a), shingles(*b))
+
+
+@pytest.mark.parametrize("original, reworded", REWORDINGS)
+def test_rewordings_reach_the_threshold(original, reworded):
+    assert similarity(original, reworded) >= JOKE_DUPLICATE_THRESHOLD
+
+
+@pytest.mark.parametrize("a, b", list(itertools.combinations(JOKES, 2)))
+def test_different_jokes_stay_below_the_threshold(a, b):
+    # Jokes sharing the template, and even a setup, are well clear of it.
+    assert similarity(a, b) < JOKE_DUPLICATE_THRESHOLD - 0.15
+
+
+def test_index_finds_added_jokes():
+    index = NearDuplicateIndex(threshold=JOKE_DUPLICATE_THRESHOLD)
+    for i, joke in enumerate(JOKES):
+        index.add(str(i), signature(*joke))
+    assert len(index) == len(JOKES)
+    # Signatures estimate similarity; only rewordings well clear of the
+    # threshold are found whatever the hash seed.
+    for original, reworded in REWORDINGS:
+        if similarity(original, reworded) < JOKE_DUPLICATE_THRESHOLD + 0.25:
+            continue
+        match = index.find(signature(*reworded))
+        assert match is not None and match[0] == str(JOKES.index(original))
+    unrelated = ("Why did the chicken cross the road?", "To get to the other side.")
+    assert index.find(signature(*unrelated)) is None
+
+
+def test_index_excludes_and_forgets_jokes():
+    index = NearDuplicateIndex(threshold=JOKE_DUPLICATE_THRESHOLD)
+    sig = signature(*JOKES[0])
+    index.add("a", sig)
+    assert index.find(sig) == ("a", 1.0)
+    assert index.find(sig, exclude="a") is None
+    index.add("a", signature(*JOKES[5]))
+    assert index.find(sig) is None
+    index.remove("a")
+    index.remove("a")
+    assert len(index) == 0
+    assert index.find(signature(*JOKES[5])) is None
+    assert all(not band for band in index._buckets)
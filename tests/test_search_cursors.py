@@ -0,0 +1,68 @@
+import asyncio
+import base64
+import json
+
+import project.search_jokes_service
+import pytest
+from project.search_jokes_service import (
+    MEMORY_SOURCE,
+    _decode_cursor,
+    _encode_cursor,
+    search_jokes,
+)
+
+
+@pytest.mark.parametrize(
+    "source, score, joke_id",
+    [
+        ("fulltext", 0.0607927, "3f1c9a52-6c1e-4a59-9d5e-8a1b2c3d4e5f"),
+        ("fuzzy", 1.0, "a"),
+        (MEMORY_SOURCE, 12.5, ""),
+    ],
+)
+def test_cursor_round_trip(source, score, joke_id):
+    cursor = _encode_cursor(source, score, joke_id)
+    assert _decode_cursor(cursor) == (source, score, joke_id)
+    assert "+" not in cursor and "/" not in cursor
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        b"not json",
+        b'{"score": 1}',
+        b'["fulltext", 1.0]',
+        b'["fulltext", "high", "a"]',
+        b'["fulltext", null, "a"]',
+    ],
+)
+def test_malformed_cursors_are_rejected(payload):
+    with pytest.raises(ValueError):
+        _decode_cursor(base64.urlsafe_b64encode(payload).decode())
+
+
+def test_garbage_cursor_is_rejected():
+    with pytest.raises(ValueError):
+        _decode_cursor("zzz")
+
+
+@pytest.mark.parametrize(
+    "source, mode",
+    [("fulltext", "fuzzy"), ("fuzzy", "fulltext"), (MEMORY_SOURCE, "fuzzy")],
+)
+def test_cursor_from_another_mode_is_rejected(source, mode):
+    cursor = _encode_cursor(source, 0.5, "a")
+    with pytest.raises(ValueError, match="another search mode"):
+        asyncio.run(search_jokes("lettuce", "en", mode, cursor))
+
+
+def test_memory_cursor_without_the_index_is_rejected(monkeypatch):
+    monkeypatch.setattr(project.search_jokes_service, "search_index", None)
+    cursor = _encode_cursor(MEMORY_SOURCE, 0.5, "a")
+    with pytest.raises(ValueError, match="expired"):
+        asyncio.run(search_jokes("lettuce", "en", "fulltext", cursor))
+
+
+def test_cursor_is_json_of_source_score_and_id():
+    cursor = _encode_cursor("fuzzy", 0.25, "b")
+    assert json.loads(base64.urlsafe_b64decode(cursor)) == ["fuzzy", 0.25, "b"]